@@ -74,16 +74,36 @@ class SortVectorAdmin(admin.ModelAdmin):
 class AnalysisDatasetsAdmin(admin.ModelAdmin):
     list_display = (
         'id', 'analysis', 'dataset',
-        'display_name', 'created', 'last_updated',
+        'display_name', 'status', 'task_start_time', 'task_end_time',
+        'created', 'last_updated',
     )
     list_filter = (
-        'analysis',
+        'analysis', 'status',
     )
     search_fields = (
         'analysis__name', 'dataset__name', 'analysis__owner__email',
     )
 
 
+class ExecutionStageInline(admin.TabularInline):
+    model = models.ExecutionStage
+    fields = (
+        'name', 'count_matrix', 'queue_wait', 'compute',
+        'bytes_read', 'bytes_written', 'peak_rss', 'succeeded', 'created',
+    )
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+
+
+class CountMatrixStageInline(ExecutionStageInline):
+    fields = (
+        'name', 'analysis', 'queue_wait', 'compute',
+        'bytes_read', 'bytes_written', 'peak_rss', 'succeeded', 'created',
+    )
+    readonly_fields = fields
+
+
 class AnalysisAdmin(admin.ModelAdmin):
     list_display = (
         'name', 'genome_assembly', 'owner',
@@ -97,6 +117,21 @@ class AnalysisAdmin(admin.ModelAdmin):
     search_fields = (
         'name', 'owner__email', 'feature_list__name', 'sort_vector__name',
     )
+    inlines = (ExecutionStageInline, )
+
+
+class ExecutionStageAdmin(admin.ModelAdmin):
+    list_display = (
+        'analysis', 'name', 'count_matrix', 'queue_wait', 'compute',
+        'bytes_read', 'bytes_written', 'peak_rss', 'succeeded', 'created',
+    )
+    list_filter = (
+        'name', 'succeeded',
+    )
+    search_fields = (
+        'analysis__name', 'analysis__owner__email',
+    )
+    raw_id_fields = ('analysis', 'count_matrix', )
 
 
 class FeatureListCountMatrixAdmin(admin.ModelAdmin):
@@ -119,6 +154,17 @@ class FeatureListCountMatrixAdmin(admin.ModelAdmin):
     search_fields = (
         'dataset__name', 'feature_list__name',
     )
+    inlines = (CountMatrixStageInline, )
+
+
+class FeatureListCountMatrixSummaryAdmin(admin.ModelAdmin):
+    list_display = (
+        'count_matrix', 'sort_key', 'created',
+    )
+    search_fields = (
+        'sort_key',
+    )
+    raw_id_fields = ('count_matrix', )
 
 
 class TemporaryDownloadAdmin(admin.ModelAdmin):
@@ -138,4 +184,6 @@ admin.site.register(models.SortVector, SortVectorAdmin)
 admin.site.register(models.AnalysisDatasets, AnalysisDatasetsAdmin)
 admin.site.register(models.Analysis, AnalysisAdmin)
 admin.site.register(models.FeatureListCountMatrix, FeatureListCountMatrixAdmin)
+admin.site.register(models.FeatureListCountMatrixSummary, FeatureListCountMatrixSummaryAdmin)
+admin.site.register(models.ExecutionStage, ExecutionStageAdmin)
 admin.site.register(models.TemporaryDownload, TemporaryDownloadAdmin)
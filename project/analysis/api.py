@@ -1,12 +1,19 @@
+from datetime import timedelta
+
 from django.contrib.auth.models import AnonymousUser
+from django.db import transaction
 from django.db.models import Q
-from rest_framework import viewsets, filters
+from django.utils.timezone import now
+from rest_framework import viewsets, filters, renderers, status
 from rest_framework.decorators import list_route
 from rest_framework.response import Response
 from rest_framework.decorators import detail_route
-from rest_framework.exceptions import NotAcceptable
+from rest_framework.exceptions import NotAcceptable, PermissionDenied, ValidationError
 
-from utils.api import SiteMixin, AnalysisObjectMixin, NoPagination, PlainTextRenderer
+from utils.api import SiteMixin, AnalysisObjectMixin, NoPagination, PlainTextRenderer, \
+    NumpyJSONRenderer, ProfilingMixin, ConditionalGetMixin, conditional_get, \
+    conditional_file_get, stream_file_response, OptionalCursorPaginationMixin, \
+    get_sparse_fields, png_response, wants_image
 from utils.base import try_int, is_none
 
 from . import models, serializers
@@ -21,7 +28,8 @@ def owner_or_public(user):
     return query
 
 
-class EncodeDatasetViewset(SiteMixin, viewsets.ReadOnlyModelViewSet):
+class EncodeDatasetViewset(OptionalCursorPaginationMixin, SiteMixin,
+                           viewsets.ReadOnlyModelViewSet):
     filter_backends = (filters.DjangoFilterBackend, )
 
     @list_route()
@@ -29,9 +37,24 @@ class EncodeDatasetViewset(SiteMixin, viewsets.ReadOnlyModelViewSet):
         opts = models.EncodeDataset.get_field_options()
         return Response(opts)
 
+    @list_route()
+    def facets(self, request):
+        genome_assembly = try_int(request.query_params.get('genome_assembly'))
+        if genome_assembly is None:
+            raise NotAcceptable('`genome_assembly` parameter required')
+        selected = {
+            fld: request.query_params.getlist('{}[]'.format(fld))
+            for fld in models.EncodeDataset.FACET_FIELDS
+        }
+        return Response(models.EncodeDataset.get_facet_counts(genome_assembly, selected))
+
     def get_serializer_class(self):
         return serializers.EncodeDatasetSerializer
 
+    def get_serializer(self, *args, **kwargs):
+        kwargs['fields'] = get_sparse_fields(self.request)
+        return super().get_serializer(*args, **kwargs)
+
     def get_filters(self, params):
         query = Q()
 
@@ -39,35 +62,28 @@ class EncodeDatasetViewset(SiteMixin, viewsets.ReadOnlyModelViewSet):
         if genome_assembly:
             query &= Q(genome_assembly=genome_assembly)
 
-        data_type = params.getlist('data_type[]')
-        if data_type:
-            query &= Q(data_type__in=data_type)
-
-        cell_type = params.getlist('cell_type[]')
-        if cell_type:
-            query &= Q(cell_type__in=cell_type)
-
-        treatment = params.getlist('treatment[]')
-        if treatment:
-            query &= Q(treatment__in=treatment)
-
-        antibody = params.getlist('antibody[]')
-        if antibody:
-            query &= Q(antibody__in=antibody)
-
-        phase = params.getlist('phase[]')
-        if phase:
-            query &= Q(phase__in=phase)
-
-        rna_extract = params.getlist('rna_extract[]')
-        if rna_extract:
-            query &= Q(rna_extract__in=rna_extract)
+        for fld in models.EncodeDataset.FACET_FIELDS:
+            values = params.getlist('{}[]'.format(fld))
+            if values:
+                query &= Q(**{'{}__in'.format(fld): values})
 
         return query
 
     def get_queryset(self):
         filters = self.get_filters(self.request.query_params)
-        return models.EncodeDataset.objects.filter(filters)
+        queryset = models.EncodeDataset.objects\
+            .filter(filters)\
+            .defer('search_text', 'search_vector')
+
+        fields = get_sparse_fields(self.request)
+        if fields and 'extra_content' not in fields:
+            queryset = queryset.defer('extra_content')
+
+        search = self.request.query_params.get('search', '').strip()
+        if search:
+            queryset = models.EncodeDataset.search(queryset, search)
+
+        return queryset
 
 
 class UserDatasetViewset(AnalysisObjectMixin, viewsets.ModelViewSet):
@@ -111,10 +127,13 @@ class SortVectorViewset(AnalysisObjectMixin, viewsets.ModelViewSet):
         serializer.save(owner=self.request.user)
 
 
-class AnalysisViewset(AnalysisObjectMixin, viewsets.ModelViewSet):
+class AnalysisViewset(ProfilingMixin, ConditionalGetMixin, AnalysisObjectMixin,
+                      viewsets.ModelViewSet):
     pagination_class = NoPagination
+    renderer_classes = (NumpyJSONRenderer, renderers.BrowsableAPIRenderer)
 
     @detail_route(methods=['get'])
+    @conditional_get
     def ks(self, request, pk=None):
         vector_id = try_int(self.request.GET.get('vector_id'), -1)
         matrix_id = try_int(self.request.GET.get('matrix_id'), -1)
@@ -126,6 +145,7 @@ class AnalysisViewset(AnalysisObjectMixin, viewsets.ModelViewSet):
         return Response(object.get_ks(vector_id, matrix_id))
 
     @detail_route(methods=['get'])
+    @conditional_get
     def unsorted_ks(self, request, pk=None):
         matrix_id = try_int(self.request.GET.get('matrix_id'), -1)
         if matrix_id == -1:
@@ -139,6 +159,12 @@ class AnalysisViewset(AnalysisObjectMixin, viewsets.ModelViewSet):
         return Response({"is_complete": object.is_complete})
 
     @detail_route(methods=['get'])
+    def progress(self, request, pk=None):
+        object = self.get_object()
+        return Response(object.get_progress())
+
+    @detail_route(methods=['get'])
+    @conditional_get
     def clust_boxplot(self, request, pk=None):
         k = try_int(self.request.GET.get('k'), -1)
         col_index = try_int(self.request.GET.get('index'), -1)
@@ -150,11 +176,13 @@ class AnalysisViewset(AnalysisObjectMixin, viewsets.ModelViewSet):
         return Response(object.get_clust_boxplot_values(k, col_index))
 
     @detail_route(methods=['get'])
+    @conditional_get
     def fc_vector_col_names(self, request, pk=None):
         object = self.get_object()
         return Response(object.get_fc_vectors_ngs_list())
 
     @detail_route(methods=['get'])
+    @conditional_get
     def user_sort_ks(self, request, pk=None):
         matrix_id = try_int(self.request.GET.get('matrix_id'), -1)
         if matrix_id == -1:
@@ -163,27 +191,32 @@ class AnalysisViewset(AnalysisObjectMixin, viewsets.ModelViewSet):
         return Response(object.get_ks_by_user_vector(matrix_id))
 
     @detail_route(methods=['get'])
+    @conditional_get
     def analysis_overview(self, request, pk=None):
         object = self.get_object()
         return Response(object.get_analysis_overview_init())
 
     @detail_route(methods=['get'])
+    @conditional_get
     def individual_overview(self, request, pk=None):
         object = self.get_object()
         return Response(object.get_individual_overview_init())
 
     @detail_route(methods=['get'])
+    @conditional_get
     def feature_clustering_overview(self, request, pk=None):
         object = self.get_object()
         return Response(object.get_feature_clustering_overview_init())
 
     @detail_route(methods=['get'])
+    @conditional_get
     def dsc_full_row_value(self, request, pk=None):
         row_name = self.request.GET.get('row')
         object = self.get_object()
         return Response(object.get_dsc_full_row_value(row_name))
 
     @detail_route(methods=['get'])
+    @conditional_get
     def k_clust_heatmap(self, request, pk=None):
         k_value = try_int(self.request.GET.get('k'), -1)
         if k_value == -1:
@@ -191,15 +224,20 @@ class AnalysisViewset(AnalysisObjectMixin, viewsets.ModelViewSet):
         dim_x = try_int(self.request.GET.get('dim_x'))
         dim_y = try_int(self.request.GET.get('dim_y'))
         object = self.get_object()
+        if wants_image(request):
+            png = object.get_k_clust_heatmap_png(k_value, dim_x, dim_y)
+            return png_response(request, png, 'k{}-clusters.png'.format(k_value))
         return Response(object.get_k_clust_heatmap(k_value, dim_x, dim_y))
 
     @detail_route(methods=['get'])
+    @conditional_get
     def feature_data(self, request, pk=None):
         feature_name = self.request.GET.get('feature')
         object = self.get_object()
         return Response(object.get_feature_data(feature_name))
 
     @detail_route(methods=['get'])
+    @conditional_get
     def sort_vector(self, request, pk=None):
         sort_vector_id = try_int(self.request.GET.get('id'), -1)
         if sort_vector_id == -1:
@@ -208,6 +246,7 @@ class AnalysisViewset(AnalysisObjectMixin, viewsets.ModelViewSet):
         return Response(object.get_sort_vector(sort_vector_id))
 
     @detail_route(methods=['get'], renderer_classes=(PlainTextRenderer,))
+    @conditional_get
     def sortvectorscatterplot(self, request, pk=None):
         idy = try_int(self.request.GET.get('idy'))
         column = self.request.GET.get('column')
@@ -217,6 +256,7 @@ class AnalysisViewset(AnalysisObjectMixin, viewsets.ModelViewSet):
         return Response(object.get_sortvector_scatterplot_data(idy, column))
 
     @detail_route(methods=['get'], renderer_classes=(PlainTextRenderer,))
+    @conditional_get
     def scatterplot(self, request, pk=None):
         idx = try_int(self.request.GET.get('idx'))
         idy = try_int(self.request.GET.get('idy'))
@@ -227,11 +267,13 @@ class AnalysisViewset(AnalysisObjectMixin, viewsets.ModelViewSet):
         return Response(object.get_scatterplot_data(idx, idy, column))
 
     @detail_route(methods=['get'])
+    @conditional_get
     def bin_names(self, request, pk=None):
         object = self.get_object()
         return Response(object.get_bin_names())
 
     @detail_route(methods=['get'])
+    @conditional_get
     def cluster_details(self, request, pk=None):
         k = try_int(self.request.GET.get('k'), -1)
         cluster_id = try_int(self.request.GET.get('cluster_id'), -1)
@@ -242,26 +284,95 @@ class AnalysisViewset(AnalysisObjectMixin, viewsets.ModelViewSet):
         object = self.get_object()
         return Response(object.get_cluster_members(k, cluster_id))
 
+    @detail_route(methods=['get'])
+    def timings(self, request, pk=None):
+        object = self.get_object()
+        serializer = serializers.ExecutionStageSerializer(object.get_stages(), many=True)
+        return Response(serializer.data)
+
+    @list_route(methods=['get'])
+    def timings_summary(self, request):
+        """
+        Aggregate execution stage timings across all analyses (staff only).
+
+        Restricted to the last `days` days (default 30).
+        """
+        if not request.user.is_staff:
+            raise PermissionDenied()
+        days = try_int(request.GET.get('days'), 30)
+        queryset = models.ExecutionStage.objects\
+            .filter(created__gte=now() - timedelta(days=days))
+        return Response(models.ExecutionStage.get_summary(queryset))
+
+    @list_route(methods=['post'])
+    def bulk_create(self, request):
+        """
+        Create, validate, and optionally execute many analyses.
+
+        Expects a list of analyses in the same format as a single create. If
+        `?execute=1`, each analysis which passes validation is executed. If
+        any analysis is invalid, none are created.
+        """
+        if not isinstance(request.data, list):
+            raise NotAcceptable('A list of analyses is required')
+        execute = request.query_params.get('execute') == '1'
+
+        serializer = self.get_serializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        with transaction.atomic():
+            analyses = serializer.save(owner=request.user)
+
+        results = []
+        for analysis in analyses:
+            analysis.validate_and_save(silent=True)
+            executed = False
+            if execute and analysis.is_ready_to_run:
+                analysis.execute(silent=True)
+                executed = True
+            results.append({
+                'id': analysis.id,
+                'url': analysis.get_absolute_url(),
+                'validated': analysis.validated,
+                'validation_errors': analysis.validation_errors,
+                'executed': executed,
+            })
+        return Response(results, status=status.HTTP_201_CREATED)
+
+    @list_route(methods=['get'])
+    def bulk_status(self, request):
+        ids = set(filter(None, [try_int(id_) for id_ in request.GET.getlist('ids[]')]))
+        if len(ids) == 0:
+            raise NotAcceptable('`ids[]` parameter required')
+        queryset = models.Analysis.objects\
+            .filter(owner_or_public(request.user), id__in=ids)
+        return Response(models.Analysis.get_bulk_status(queryset))
+
     def get_serializer_class(self):
         return serializers.AnalysisSerializer
 
     def get_queryset(self):
         query = owner_or_public(self.request.user)
-        return models.Analysis.objects.filter(query)
+        queryset = models.Analysis.objects.filter(query)
+        if self.action in ('list', 'retrieve'):
+            queryset = models.Analysis.prefetch_analysis_datasets(queryset)\
+                .prefetch_related('datasets')
+        return queryset
 
     def perform_create(self, serializer):
         serializer.save(owner=self.request.user)
 
 
-class FeatureListCountMatrixViewset(AnalysisObjectMixin, viewsets.ReadOnlyModelViewSet):
+class FeatureListCountMatrixViewset(ProfilingMixin, ConditionalGetMixin, AnalysisObjectMixin,
+                                    viewsets.ReadOnlyModelViewSet):
+    renderer_classes = (NumpyJSONRenderer, renderers.BrowsableAPIRenderer)
 
     @detail_route(methods=['get'], renderer_classes=(PlainTextRenderer,))
+    @conditional_file_get
     def plot(self, request, pk=None):
         object = self.get_object()
-        return Response(object.get_dataset())
+        return stream_file_response(request, object.matrix.path)
 
-    @detail_route(methods=['get'])
-    def sorted_render(self, request, pk=None):
+    def get_sorted_render_params(self):
         dim_x = try_int(self.request.GET.get('dim_x'))
         dim_y = try_int(self.request.GET.get('dim_y'))
         analysis_sort = (self.request.GET.get('analysis_sort') == '1')
@@ -273,10 +384,68 @@ class FeatureListCountMatrixViewset(AnalysisObjectMixin, viewsets.ReadOnlyModelV
         if any(filter(is_none, [dim_x, dim_y, analysis_id])):
             raise NotAcceptable('`dim_x`, `dim_y`, and `analysis_id` are required parameters')
 
+        if analysis_sort and not models.Analysis.objects\
+                .filter(id=analysis_id, sort_vector__isnull=False)\
+                .exists():
+            raise ValidationError('`analysis_sort` requires an analysis with a sort vector')
+
+        return dim_x, dim_y, analysis_sort, sort_matrix_id, analysis_id
+
+    @detail_route(methods=['get'])
+    @conditional_get
+    def sorted_render(self, request, pk=None):
+        params = self.get_sorted_render_params()
         object = self.get_object()
-        return Response(object.get_sorted_data(
-            dim_x, dim_y, analysis_sort, sort_matrix_id, analysis_id
-        ))
+        if wants_image(request):
+            return png_response(request, object.get_sorted_png(*params))
+        return Response(object.get_sorted_data(*params))
+
+    @list_route(methods=['get'])
+    def sorted_render_batch(self, request):
+        ids = set(filter(None, [try_int(id_) for id_ in request.GET.getlist('ids[]')]))
+        if len(ids) == 0:
+            raise NotAcceptable('`ids[]` parameter required')
+        params = self.get_sorted_render_params()
+
+        objects = list(self.get_queryset().filter(id__in=ids))
+        if len(objects) != len(ids):
+            raise NotAcceptable('Invalid `ids[]` parameter')
+        for object in objects:
+            self.check_object_permissions(request, object)
+
+        return Response(models.FeatureListCountMatrix.get_sorted_data_batch(objects, *params))
+
+    def get_conditional_validators(self, obj):
+        etag, last_modified = super().get_conditional_validators(obj)
+
+        # results sorted by an analysis sort-vector also depend on analysis
+        analysis_id = try_int(self.request.GET.get('analysis_id'))
+        if self.request.GET.get('analysis_sort') == '1' and analysis_id:
+            analysis = models.Analysis.objects\
+                .select_related('sort_vector')\
+                .filter(id=analysis_id)\
+                .first()
+            if analysis is None:
+                return None, None
+            etag = '%s-%s-%s' % (etag, analysis.sort_vector_id, analysis.last_updated.timestamp())
+            last_modified = max(last_modified, analysis.last_updated)
+
+            # sort vector may be replaced without changing the analysis
+            sort_vector = analysis.sort_vector
+            if sort_vector is not None:
+                etag = '%s-%s' % (etag, sort_vector.last_updated.timestamp())
+                last_modified = max(last_modified, sort_vector.last_updated)
+
+        return etag, last_modified
+
+    def is_public(self, obj):
+        # public if in any public analysis; an analysis sort must be public too
+        if not obj.analysisdatasets_set.filter(analysis__public=True).exists():
+            return False
+        analysis_id = try_int(self.request.GET.get('analysis_id'))
+        if self.request.GET.get('analysis_sort') == '1' and analysis_id:
+            return models.Analysis.objects.filter(id=analysis_id, public=True).exists()
+        return True
 
     def get_serializer_class(self):
         return serializers.FeatureListCountMatrixSerializer
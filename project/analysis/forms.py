@@ -274,8 +274,11 @@ class AnalysisForm(BaseFormMixin, forms.ModelForm):
                 .get_dataset_ids(self.cleaned_data['datasets_json'])
             self.execute_reset_required = \
                 self.instance.is_reset_required(dsIds)
+            self.execute_incremental = self.execute_reset_required and \
+                self.instance.is_incremental_update(dsIds)
             if self.execute_reset_required:
-                self.instance.reset_analysis_object()
+                self.instance.reset_analysis_object(
+                    keep_output=self.execute_incremental)
         return super().save(commit=commit)
 
     def _save_m2m(self):
@@ -284,11 +287,18 @@ class AnalysisForm(BaseFormMixin, forms.ModelForm):
 
         logger.info("Resetting analysis m2m relations")
         ds = self.cleaned_data['datasets_json']
+        existing = set()
 
-        # out with the old
-        models.AnalysisDatasets.objects\
-            .filter(analysis=self.instance)\
-            .delete()
+        if self.execute_incremental:
+            # keep existing datasets and their count matrices
+            existing = set(models.AnalysisDatasets.objects
+                           .filter(analysis=self.instance)
+                           .values_list('dataset_id', flat=True))
+        else:
+            # out with the old
+            models.AnalysisDatasets.objects\
+                .filter(analysis=self.instance)\
+                .delete()
 
         # in with the new
         objects = [
@@ -298,5 +308,6 @@ class AnalysisForm(BaseFormMixin, forms.ModelForm):
                 display_name=d['display_name']
             ) for d in itertools.chain(
                 ds['userDatasets'], ds['encodeDatasets'])
+            if d['dataset'] not in existing
         ]
         models.AnalysisDatasets.objects.bulk_create(objects)
@@ -0,0 +1,76 @@
+"""
+Rasterize heatmaps directly from arrays to PNG.
+
+Color scales match those drawn client-side, so downloaded images are
+identical to what is displayed, without rendering the page in a browser.
+"""
+import io
+
+import numpy
+from matplotlib import image
+
+
+# same color scheme as the client-side cluster heatmap
+CMAP = 'RdYlBu'
+
+# client-side count-matrix heatmap colors at the lower quartile, median,
+# and upper quartile
+COUNT_MATRIX_COLORS = numpy.array([
+    [0xfe, 0xe5, 0xd9],
+    [0xfc, 0xae, 0x91],
+    [0xfb, 0x6a, 0x4a],
+], dtype=numpy.float)
+
+
+def repeat_to_fit(values, dim_x, dim_y):
+    # repeat cells by an integer factor so an image is close to (dim_x, dim_y)
+    nrows, ncols = values.shape[:2]
+    repeat_y = max(1, dim_y // nrows) if dim_y else 1
+    repeat_x = max(1, dim_x // ncols) if dim_x else 1
+    return numpy.repeat(numpy.repeat(values, repeat_y, axis=0), repeat_x, axis=1)
+
+
+def to_png(values, **kwargs):
+    # values are either RGB (uint8), or scalar with a colormap in kwargs
+    f = io.BytesIO()
+    image.imsave(f, values, format='png', **kwargs)
+    return f.getvalue()
+
+
+def cluster_heatmap_png(values, dim_x=None, dim_y=None):
+    """
+    Rasterize a normalized cluster heatmap to PNG bytes.
+
+    Values are scaled by the upper quartile; 0 is the midpoint of the color
+    scale and values >= 1 are saturated.
+    """
+    values = repeat_to_fit(numpy.asarray(values, dtype=numpy.float), dim_x, dim_y)
+    scaled = numpy.clip((1. - values) / 2., 0., 1.)
+    return to_png(scaled, vmin=0., vmax=1., cmap=CMAP)
+
+
+def count_matrix_colors(values, norm_val):
+    """
+    Map values to RGB, linear between lower quartile, median, and upper
+    quartile colors, and extrapolated (then clipped) outside of them.
+    """
+    values = numpy.asarray(values, dtype=numpy.float)
+    domain = [
+        norm_val['lower_quartile'],
+        norm_val['median'],
+        norm_val['upper_quartile'],
+    ]
+    upper = values >= domain[1]
+    rgb = numpy.empty(values.shape + (3, ), dtype=numpy.float)
+    for segment, mask in enumerate((~upper, upper)):
+        x0, x1 = domain[segment], domain[segment + 1]
+        c0, c1 = COUNT_MATRIX_COLORS[segment], COUNT_MATRIX_COLORS[segment + 1]
+        t = (values[mask] - x0) / (x1 - x0) if x1 != x0 else numpy.zeros(mask.sum())
+        rgb[mask] = c0 + t[:, numpy.newaxis] * (c1 - c0)
+    return numpy.clip(numpy.round(rgb), 0, 255).astype(numpy.uint8)
+
+
+def count_matrix_heatmap_png(values, norm_val, dim_x=None, dim_y=None):
+    """Rasterize a smoothed count-matrix heatmap to PNG bytes."""
+    rgb = count_matrix_colors(values, norm_val)
+    return to_png(repeat_to_fit(rgb, dim_x, dim_y))
@@ -0,0 +1,86 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from utils import profiling
+
+
+HELP_TEXT = """
+Show sampled API request profiles, by route.
+
+Profiling is opt-in; set the `API_PROFILE_SAMPLE_RATE` environment variable
+to the fraction of requests to profile (for example, 0.05). Latencies are
+estimated from histogram buckets, so percentiles are upper bounds.
+
+"""
+
+
+class Command(BaseCommand):
+
+    help = HELP_TEXT
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--json',
+            action='store_true',
+            dest='json',
+            default=False,
+            help='Output JSON instead of a table',
+        )
+        parser.add_argument(
+            '--reset',
+            action='store_true',
+            dest='reset',
+            default=False,
+            help='Clear all accumulated profiles',
+        )
+
+    def format_ms(self, value):
+        if value is None:
+            return '>{}'.format(profiling.BUCKETS[-2])
+        return value
+
+    def handle(self, *args, **options):
+        if options['reset']:
+            profiling.reset()
+            self.stdout.write('Profiles cleared')
+            return
+
+        summaries = {
+            route: profiling.summarize(fields)
+            for route, fields in profiling.get_results().items()
+        }
+        summaries = {k: v for k, v in summaries.items() if v is not None}
+
+        if options['json']:
+            self.stdout.write(json.dumps(summaries, indent=2))
+            return
+
+        if not summaries:
+            self.stdout.write('No profiles recorded')
+            return
+
+        row = '{:<60} {:>7} {:>9} {:>7} {:>7} {:>7} {:>6} {:>10}  {}'
+        self.stdout.write(row.format(
+            'route', 'count', 'mean ms', 'p50', 'p95', 'p99', 'hit %', 'mean KB',
+            'phases (mean ms)'))
+        ordered = sorted(
+            summaries.items(),
+            key=lambda item: item[1]['mean_ms'] * item[1]['count'],
+            reverse=True)
+        for route, s in ordered:
+            hit = s['cache_hit_ratio']
+            size = s['mean_bytes']
+            phases = ', '.join(
+                '{}={:.1f}'.format(k, v) for k, v in sorted(s['phases_mean_ms'].items()))
+            self.stdout.write(row.format(
+                route,
+                s['count'],
+                '{:.1f}'.format(s['mean_ms']),
+                self.format_ms(s['p50_ms']),
+                self.format_ms(s['p95_ms']),
+                self.format_ms(s['p99_ms']),
+                '-' if hit is None else '{:.0f}'.format(hit * 100),
+                '-' if size is None else '{:.1f}'.format(size / 1024),
+                phases,
+            ))
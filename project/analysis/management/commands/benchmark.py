@@ -0,0 +1,361 @@
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import subprocess
+import time
+from contextlib import contextmanager
+
+import numpy
+import pandas as pd
+import scipy
+import django
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+from django.core.urlresolvers import reverse
+from django.test.utils import setup_test_environment
+from django.utils.timezone import now
+from rest_framework.test import APIClient
+
+from analysis import models
+from myuser.models import User
+
+
+HELP_TEXT = """
+Benchmark analysis execution using synthetic data.
+
+Synthetic bigWigs and feature lists are generated for the requested genome
+assembly, and an analysis is executed for each combination of feature-list
+size and dataset count. Each stage is executed in-process (not using
+celery) and timed separately:
+
+    - validation: analysis validation of feature list and datasets
+    - count_matrix: genomic bins and count matrix for each dataset
+    - matrix_combination: MatrixByMatrix combination of all matrices
+    - json_write: writing MatrixByMatrix results to JSON, unmodified
+    - endpoints: each visualization API endpoint, cold and then cached
+
+Bin building isn't timed on its own: orio's BedMatrix builds each
+feature's bins while reading coverage, so it's included in count_matrix.
+
+Results are written as JSON. All created objects and files are removed
+afterwards, unless `--keep` is specified. Requires the UCSC
+`bedGraphToBigWig` binary.
+
+"""
+
+
+@contextmanager
+def timer(results, name):
+    start = time.perf_counter()
+    yield
+    results[name] = time.perf_counter() - start
+
+
+class Command(BaseCommand):
+
+    help = HELP_TEXT
+
+    BENCHMARK_EMAIL = 'benchmark@orio.local'
+    BENCHMARK_PREFIX = 'benchmarking:'
+    SPAN = 2500  # coverage is generated +/- SPAN around each feature
+    DIM_X = 500
+    DIM_Y = 1000
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--features', type=int, nargs='+', default=[100, 1000],
+            help='Feature-list sizes')
+        parser.add_argument(
+            '--datasets', type=int, nargs='+', default=[2, 10],
+            help='Number of datasets in each analysis')
+        parser.add_argument(
+            '--replicates', type=int, default=1,
+            help='Number of replicates of each combination')
+        parser.add_argument(
+            '--assembly', default=None,
+            help='Genome assembly name (default: first available)')
+        parser.add_argument(
+            '--output', default='benchmark.json',
+            help='Output JSON filename')
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='Random seed used to generate synthetic data')
+        parser.add_argument(
+            '--bedgraph-to-bigwig', dest='bedgraph_to_bigwig',
+            default=shutil.which('bedGraphToBigWig'),
+            help='Path to UCSC bedGraphToBigWig binary')
+        parser.add_argument(
+            '--keep', action='store_true', default=False,
+            help='Keep benchmark objects and files after completion')
+
+    def handle(self, *args, **options):
+        if not options['bedgraph_to_bigwig']:
+            raise CommandError('UCSC `bedGraphToBigWig` binary not found')
+        self.options = options
+        self.random = numpy.random.RandomState(options['seed'])
+
+        assemblies = models.GenomeAssembly.objects.order_by('id')
+        if options['assembly']:
+            assemblies = assemblies.filter(name=options['assembly'])
+        self.assembly = assemblies.first()
+        if self.assembly is None:
+            raise CommandError('Genome assembly not found')
+
+        self.user = User.objects.filter(email=self.BENCHMARK_EMAIL).first() or \
+            User.objects.create_user(self.BENCHMARK_EMAIL)
+        self.path = os.path.join(
+            self.user.path, 'benchmark-{}'.format(int(time.time())))
+        os.makedirs(self.path, exist_ok=True)
+
+        # API requests are made using the test client
+        setup_test_environment()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+        self.created = []
+        try:
+            results = self.run()
+        finally:
+            if not options['keep']:
+                self.cleanup()
+
+        with open(options['output'], 'w') as f:
+            json.dump({
+                'metadata': self.get_metadata(),
+                'results': results,
+            }, f, indent=2)
+        self.stdout.write('Results written to {}'.format(options['output']))
+
+    def get_metadata(self):
+        return {
+            'created': now().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': multiprocessing.cpu_count(),
+            'django': django.get_version(),
+            'numpy': numpy.__version__,
+            'scipy': scipy.__version__,
+            'pandas': pd.__version__,
+            'assembly': self.assembly.name,
+            'options': {
+                key: self.options[key]
+                for key in ('features', 'datasets', 'replicates', 'seed')
+            },
+        }
+
+    def run(self):
+        sizes = self.read_chrom_sizes()
+        features = self.generate_features(sizes, max(self.options['features']))
+
+        self.stdout.write('Generating {} synthetic datasets'.format(
+            max(self.options['datasets'])))
+        datasets = [
+            self.create_dataset(i, features, sizes)
+            for i in range(max(self.options['datasets']))
+        ]
+
+        results = []
+        for n_features in self.options['features']:
+            feature_list = self.create_feature_list(features, n_features)
+            for n_datasets in self.options['datasets']:
+                for replicate in range(self.options['replicates']):
+                    self.stdout.write('Running {} features, {} datasets, replicate {}'.format(
+                        n_features, n_datasets, replicate + 1))
+                    result = self.run_analysis(
+                        feature_list, datasets[:n_datasets])
+                    result.update(
+                        features=n_features,
+                        datasets=n_datasets,
+                        replicate=replicate + 1,
+                    )
+                    results.append(result)
+        return results
+
+    def read_chrom_sizes(self):
+        return {
+            chrom: size
+            for chrom, size in self.assembly.get_chromosome_sizes().as_dict().items()
+            if size > 4 * self.SPAN
+        }
+
+    def generate_features(self, sizes, n):
+        # random single-base features, weighted by chromosome size
+        chroms = sorted(sizes.keys())
+        weights = numpy.array([sizes[c] for c in chroms], dtype=numpy.float)
+        picks = self.random.choice(len(chroms), n, p=weights / weights.sum())
+        features = []
+        for i, idx in enumerate(picks):
+            chrom = chroms[idx]
+            pos = self.random.randint(2 * self.SPAN, sizes[chrom] - 2 * self.SPAN)
+            strand = '+' if self.random.rand() < 0.5 else '-'
+            features.append((chrom, pos, 'feature_{}'.format(i), strand))
+        return sorted(features)
+
+    def create_feature_list(self, features, n):
+        idx = numpy.sort(self.random.choice(len(features), n, replace=False))
+        content = ''.join(
+            '{}\t{}\t{}\t{}\t0\t{}\n'.format(chrom, pos, pos + 1, name, strand)
+            for chrom, pos, name, strand in (features[i] for i in idx)
+        )
+        name = '{} {} features'.format(self.BENCHMARK_PREFIX, n)
+        fl = models.FeatureList(
+            owner=self.user,
+            name=name,
+            genome_assembly=self.assembly,
+            stranded=True,
+        )
+        fl.dataset.save('benchmark-{}.bed'.format(n), ContentFile(content), save=False)
+        fl.save()
+        self.created.append(fl)
+        fl.validate_and_save(silent=True)
+        if not fl.validated:
+            raise CommandError('Feature list validation failed: {}'.format(
+                fl.validation_errors))
+        return fl
+
+    def create_dataset(self, i, features, sizes):
+        # write random coverage surrounding each feature, convert to bigWig
+        bin_size = 100
+        offsets = numpy.arange(-self.SPAN, self.SPAN, bin_size)
+        bedgraph = os.path.join(self.path, 'dataset-{}.bedGraph'.format(i))
+        bigwig = os.path.join(self.path, 'dataset-{}.bigWig'.format(i))
+
+        by_chrom = pd.DataFrame(features, columns=['chrom', 'pos', 'name', 'strand'])\
+            .groupby('chrom')['pos']
+        with open(bedgraph, 'w') as f:
+            for chrom, positions in sorted(by_chrom):
+                starts = (positions.values[:, None] + offsets[None, :]).ravel()
+                starts = numpy.unique(starts[self.random.rand(starts.size) < 0.5])
+                ends = numpy.minimum(
+                    starts + bin_size, numpy.append(starts[1:], sizes[chrom]))
+                values = self.random.gamma(2., 5., starts.size)
+                for start, end, value in zip(starts, ends, values):
+                    f.write('{}\t{}\t{}\t{:.3f}\n'.format(chrom, start, end, value))
+
+        subprocess.check_call([
+            self.options['bedgraph_to_bigwig'],
+            bedgraph, self.assembly.chromosome_size_file, bigwig])
+        os.remove(bedgraph)
+
+        # don't save individually; a created download triggers a download task
+        download = models.DatasetDownload(
+            owner=self.user,
+            url='http://localhost/benchmark/dataset-{}.bigWig'.format(i),
+            status_code=models.DatasetDownload.FINISHED_SUCCESS,
+            start_time=now(),
+            end_time=now(),
+        )
+        download.data.name = bigwig[len(settings.USERDATA_PATH) + 1:]
+        models.DatasetDownload.objects.bulk_create([download])
+        download = models.DatasetDownload.objects.get(url=download.url, owner=self.user)
+        self.created.append(download)
+
+        ds = models.UserDataset.objects.create(
+            owner=self.user,
+            name='{} dataset {}'.format(self.BENCHMARK_PREFIX, i),
+            genome_assembly=self.assembly,
+            data_type='Other',
+            ambiguous=download,
+            validated=True,
+        )
+        self.created.append(ds)
+        return ds
+
+    def delete_count_matrices(self, feature_list):
+        for flcm in models.FeatureListCountMatrix.objects.filter(feature_list=feature_list):
+            flcm.matrix.delete(save=False)
+            flcm.delete()
+
+    def run_analysis(self, feature_list, datasets):
+        # count matrices are reused across analyses by default; remove
+        self.delete_count_matrices(feature_list)
+
+        analysis = models.Analysis.objects.create(
+            owner=self.user,
+            name='{} {} datasets'.format(self.BENCHMARK_PREFIX, len(datasets)),
+            genome_assembly=self.assembly,
+            feature_list=feature_list,
+        )
+        self.created.append(analysis)
+        models.AnalysisDatasets.objects.bulk_create([
+            models.AnalysisDatasets(
+                analysis=analysis, dataset=ds, display_name=ds.name)
+            for ds in datasets
+        ])
+
+        stages = {}
+        with timer(stages, 'validation'):
+            analysis.validate_and_save(silent=True)
+        if not analysis.validated:
+            return {'error': analysis.validation_errors, 'stages': stages}
+
+        analysis.start_time = now()
+        count_matrices = []
+        with timer(stages, 'count_matrix'):
+            for ads in analysis.analysisdatasets_set.select_related('dataset__userdataset'):
+                ads.count_matrix = models.FeatureListCountMatrix.execute(
+                    analysis, ads.dataset.userdataset)
+                ads.save()
+                count_matrices.append(ads.count_matrix)
+
+        with timer(stages, 'matrix_combination'):
+            mm = analysis.get_mat2mat()
+
+        with timer(stages, 'json_write'):
+            analysis.output = analysis.write_mat2mat(mm)
+
+        analysis.end_time = now()
+        analysis.save()
+        analysis.clear_cache()
+
+        return {
+            'analysis': analysis.id,
+            'stages': stages,
+            'endpoints': self.time_endpoints(analysis, count_matrices),
+        }
+
+    def get_endpoints(self, analysis, count_matrices):
+        args = [analysis.id]
+        return [
+            ('analysis_overview',
+             reverse('analysis:api:analysis-analysis-overview', args=args), {}),
+            ('individual_overview',
+             reverse('analysis:api:analysis-individual-overview', args=args), {}),
+            ('feature_clustering_overview',
+             reverse('analysis:api:analysis-feature-clustering-overview', args=args), {}),
+            ('fc_vector_col_names',
+             reverse('analysis:api:analysis-fc-vector-col-names', args=args), {}),
+            ('k_clust_heatmap',
+             reverse('analysis:api:analysis-k-clust-heatmap', args=args),
+             {'k': 2, 'dim_x': self.DIM_X, 'dim_y': self.DIM_Y}),
+            ('sorted_render_batch',
+             reverse('analysis:api:flcm-sorted-render-batch'),
+             {'ids[]': [cm.id for cm in count_matrices], 'analysis_id': analysis.id,
+              'dim_x': self.DIM_X, 'dim_y': self.DIM_Y}),
+        ]
+
+    def time_endpoints(self, analysis, count_matrices):
+        results = {}
+        for name, url, params in self.get_endpoints(analysis, count_matrices):
+            result = {}
+            for run in ('cold', 'cached'):
+                start = time.perf_counter()
+                response = self.client.get(url, params)
+                result[run] = time.perf_counter() - start
+            result['status_code'] = response.status_code
+            result['bytes'] = len(response.content)
+            results[name] = result
+        return results
+
+    def cleanup(self):
+        for obj in reversed(self.created):
+            if isinstance(obj, models.Analysis) and obj.output:
+                obj.output.delete(save=False)
+            if isinstance(obj, models.FeatureList):
+                self.delete_count_matrices(obj)
+                obj.dataset.delete(save=False)
+            obj.delete()
+        shutil.rmtree(self.path, ignore_errors=True)
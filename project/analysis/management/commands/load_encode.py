@@ -1,8 +1,10 @@
 import json
 import os
+from concurrent.futures import ThreadPoolExecutor
 
 from django.core.management.base import BaseCommand
 from django.conf import settings
+from django.db import transaction
 
 from analysis import models
 
@@ -16,6 +18,12 @@ This script requires that all encode datasets are found in the value specified
 in the django `settings.ENCODE_PATH` setting. It will check to make sure a
 file all files exist when creating objects.
 
+With the `--incremental` flag, existing datasets are instead matched to the
+JSON file by genome assembly and name; only new or changed datasets are
+saved, and datasets no longer in the JSON file are removed. Datasets whose
+files are not found are left unchanged. Dataset ids are preserved, so
+previously computed count matrices are kept.
+
 """
 
 
@@ -23,13 +31,33 @@ class Command(BaseCommand):
 
     help = HELP_TEXT
 
-    assembly_cw = {
-        d.name: d.id for d in
-        models.GenomeAssembly.objects.all()
-    }
+    FIELDS = (
+        'data_type',
+        'cell_type',
+        'antibody',
+        'rna_extract',
+        'treatment',
+        'phase',
+        'localization',
+        'extra_content',
+    )
+    FILE_FIELDS = (
+        ('plus_bigwig', 'data_plus'),
+        ('minus_bigwig', 'data_minus'),
+        ('ambig_bigwig', 'data_ambiguous'),
+    )
+    BATCH_SIZE = 500
+    FILE_CHECK_WORKERS = 16
 
     def add_arguments(self, parser):
         parser.add_argument('json_file')
+        parser.add_argument(
+            '--incremental',
+            action='store_true',
+            dest='incremental',
+            default=False,
+            help='Update changed datasets in-place instead of re-creating all',
+        )
 
     def handle(self, *args, **options):
         json_file = options.get('json_file')
@@ -39,59 +67,130 @@ class Command(BaseCommand):
         with open(json_file, 'r') as f:
             datasets = json.loads(f.read())
 
+        self.assembly_cw = {
+            d.name: d.id for d in
+            models.GenomeAssembly.objects.all()
+        }
+        self.found_files = self.check_files(datasets)
+
         self.files_added = 0
-        models.EncodeDataset.objects.all().delete()
-        for ds in datasets:
-            self.create_django_object(ds)
+        if options.get('incremental'):
+            self.sync(datasets)
+        else:
+            models.EncodeDataset.objects.all().delete()
+            for ds in datasets:
+                self.create_django_object(ds)
+
+        models.EncodeDataset.build_facet_index()
 
         self.stdout.write("{} datasets in JSON file".format(len(datasets)))
         self.stdout.write("{} datasets created".format(self.files_added))
 
-    def file_exists(self, fn):
-        path = os.path.join(settings.ENCODE_PATH, fn)
-        found = os.path.exists(path)
-        if not found:
-            self.stdout.write("File not found: {}".format(path))
-        return found
-
-    def create_django_object(self, ds):
-        should_create = True
-        genome_assembly = self.assembly_cw[ds["genome_assembly"]]
-        obj = models.EncodeDataset(
-            name=ds["name"],
-            public=True,
-            genome_assembly=genome_assembly,
-            data_type=ds["data_type"],
-            cell_type=ds["cell_type"],
-            antibody=ds["antibody"],
-            rna_extract=ds["rna_extract"],
-            treatment=ds["treatment"],
-            phase=ds["phase"],
-            localization=ds["localization"],
-            extra_content=ds["extra_content"],
-        )
-
-        fn = ds.get("plus_bigwig")
-        if fn:
-            if self.file_exists(fn):
-                obj.data_plus.name = fn
-            else:
-                should_create = False
-
-        fn = ds.get("minus_bigwig")
-        if fn:
-            if self.file_exists(fn):
-                obj.data_minus.name = fn
+    def check_files(self, datasets):
+        # check all files exist in parallel; return set of found files
+        fns = set()
+        for ds in datasets:
+            for key, _ in self.FILE_FIELDS:
+                if ds.get(key):
+                    fns.add(ds[key])
+        fns = sorted(fns)
+
+        with ThreadPoolExecutor(max_workers=self.FILE_CHECK_WORKERS) as executor:
+            exists = list(executor.map(self.file_exists, fns))
+
+        found = set()
+        for fn, fn_exists in zip(fns, exists):
+            if fn_exists:
+                found.add(fn)
             else:
-                should_create = False
+                path = os.path.join(settings.ENCODE_PATH, fn)
+                self.stdout.write("File not found: {}".format(path))
+        return found
 
-        fn = ds.get("ambig_bigwig")
-        if fn:
-            if self.file_exists(fn):
-                obj.data_ambiguous.name = fn
+    def file_exists(self, fn):
+        path = os.path.join(settings.ENCODE_PATH, fn)
+        return os.path.exists(path)
+
+    def get_key(self, ds):
+        # stable identity of a dataset across reloads
+        return (self.assembly_cw[ds['genome_assembly']], ds['name'])
+
+    def get_field_values(self, ds):
+        # return dict of field values, or None if any files are missing
+        values = {
+            'name': ds['name'],
+            'genome_assembly_id': self.assembly_cw[ds['genome_assembly']],
+        }
+        for fld in self.FIELDS:
+            values[fld] = ds[fld]
+        for key, fld in self.FILE_FIELDS:
+            fn = ds.get(key)
+            if fn:
+                if fn not in self.found_files:
+                    return None
+                values[fld] = fn
             else:
-                should_create = False
+                values[fld] = ''
+        return values
+
+    def set_field_values(self, obj, values):
+        # returns True if any values were changed
+        changed = False
+        for fld, value in values.items():
+            current = getattr(obj, fld)
+            if hasattr(current, 'name'):  # FieldFile
+                current = current.name
+            if current != value:
+                setattr(obj, fld, value)
+                changed = True
+        return changed
 
-        if should_create:
+    def create_django_object(self, ds):
+        values = self.get_field_values(ds)
+        if values is not None:
+            obj = models.EncodeDataset(public=True)
+            self.set_field_values(obj, values)
             obj.save()
             self.files_added += 1
+
+    def sync(self, datasets):
+        existing = {
+            (obj.genome_assembly_id, obj.name): obj
+            for obj in models.EncodeDataset.objects.all()
+        }
+
+        seen = set()
+        changes = []
+        for ds in datasets:
+            # first entry for a key is used; existing datasets with missing
+            # files are kept unchanged, not removed
+            key = self.get_key(ds)
+            if key in seen:
+                self.stdout.write("Duplicate dataset: {}".format(ds['name']))
+                continue
+            seen.add(key)
+            values = self.get_field_values(ds)
+            if values is None:
+                continue
+            obj = existing.get(key)
+            if obj is None:
+                obj = models.EncodeDataset(public=True)
+                self.files_added += 1
+            if self.set_field_values(obj, values) or obj.id is None:
+                changes.append(obj)
+
+        # multi-table inherited models can't use bulk_create; instead save
+        # only changed objects, in batched transactions
+        for i in range(0, len(changes), self.BATCH_SIZE):
+            with transaction.atomic():
+                for obj in changes[i:i + self.BATCH_SIZE]:
+                    obj.save()
+
+        stale_ids = [
+            obj.id for key, obj in existing.items()
+            if key not in seen
+        ]
+        models.EncodeDataset.objects.filter(id__in=stale_ids).delete()
+
+        self.stdout.write("{} datasets updated".format(len(changes) - self.files_added))
+        self.stdout.write("{} datasets removed".format(len(stale_ids)))
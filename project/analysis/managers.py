@@ -16,3 +16,22 @@ class AnalysisManager(models.Manager):
             .select_related('genome_assembly', 'feature_list')\
             .annotate(models.Count('datasets'))\
             .order_by('-last_updated')
+
+
+class AnalysisDatasetsQuerySet(models.QuerySet):
+
+    def user(self):
+        return self.filter(dataset__userdataset__isnull=False)
+
+    def encode(self):
+        return self.filter(dataset__encodedataset__isnull=False)
+
+    def with_is_encode(self):
+        # classify each dataset as user or ENCODE in a single query
+        return self.annotate(is_encode=models.Case(
+            models.When(dataset__encodedataset__isnull=False, then=models.Value(True)),
+            default=models.Value(False),
+            output_field=models.BooleanField()))
+
+
+AnalysisDatasetsManager = models.Manager.from_queryset(AnalysisDatasetsQuerySet)
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-19 10:12
+from __future__ import unicode_literals
+
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analysis', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeatureListCountMatrixSummary',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sort_key', models.CharField(help_text='Sort procedure used to order matrix rows', max_length=64)),
+                ('summary', django.contrib.postgres.fields.jsonb.JSONField(default=dict)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('count_matrix', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='summaries', to='analysis.FeatureListCountMatrix')),
+            ],
+            options={
+                'verbose_name_plural': 'Feature list count matrix summaries',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='featurelistcountmatrixsummary',
+            unique_together=set([('count_matrix', 'sort_key')]),
+        ),
+    ]
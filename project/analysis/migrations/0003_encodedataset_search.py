@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-19 11:05
+from __future__ import unicode_literals
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations, models
+
+
+FACET_FIELDS = (
+    'data_type', 'cell_type', 'antibody', 'rna_extract',
+    'treatment', 'phase', 'localization',
+)
+
+
+def json_text_values(obj):
+    # yield all scalar values from JSON-like content, recursively
+    if isinstance(obj, dict):
+        for value in obj.values():
+            yield from json_text_values(value)
+    elif isinstance(obj, (list, tuple)):
+        for value in obj:
+            yield from json_text_values(value)
+    elif obj is not None:
+        yield obj
+
+
+def set_search_text(apps, schema_editor):
+    # historical models don't have custom methods; replicate save behavior
+    EncodeDataset = apps.get_model('analysis', 'EncodeDataset')
+    for obj in EncodeDataset.objects.all():
+        values = [obj.name]
+        values.extend([getattr(obj, fld) for fld in FACET_FIELDS])
+        values.extend(json_text_values(obj.extra_content))
+        obj.search_text = ' '.join([str(v) for v in values if v])
+        obj.save(update_fields=['search_text'])
+    EncodeDataset.objects.update(search_vector=SearchVector('search_text'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analysis', '0002_featurelistcountmatrixsummary'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='encodedataset',
+            name='search_text',
+            field=models.TextField(blank=True, help_text='Name, metadata, and extra content; used for text search'),
+        ),
+        migrations.AddField(
+            model_name='encodedataset',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(null=True),
+        ),
+        migrations.AddIndex(
+            model_name='encodedataset',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='encodedataset_search_gin'),
+        ),
+        migrations.RunSQL(
+            sql='CREATE INDEX analysis_encodedataset_search_text_trgm ON analysis_encodedataset USING gin (search_text gin_trgm_ops);',
+            reverse_sql='DROP INDEX analysis_encodedataset_search_text_trgm;',
+        ),
+        migrations.RunPython(set_search_text, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-19 14:02
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analysis', '0003_encodedataset_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='analysisdatasets',
+            name='status',
+            field=models.PositiveSmallIntegerField(choices=[(0, 'pending'), (1, 'running'), (2, 'complete'), (3, 'failed')], default=0, help_text='State of the count matrix task for this dataset'),
+        ),
+        migrations.AddField(
+            model_name='analysisdatasets',
+            name='task_start_time',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AddField(
+            model_name='analysisdatasets',
+            name='task_end_time',
+            field=models.DateTimeField(null=True),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-19 16:40
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analysis', '0004_analysisdatasets_task_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExecutionStage',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(choices=[('execute', 'execute'), ('count-matrix', 'count matrix'), ('matrix-combination', 'matrix combination'), ('json-write', 'JSON write'), ('cache-warm', 'cache warm'), ('email', 'email')], max_length=32)),
+                ('queue_wait', models.FloatField(help_text='Seconds between task being queued and started', null=True)),
+                ('compute', models.FloatField(help_text='Seconds to complete stage', null=True)),
+                ('bytes_read', models.BigIntegerField(null=True)),
+                ('bytes_written', models.BigIntegerField(null=True)),
+                ('peak_rss', models.BigIntegerField(help_text='Peak resident memory of worker, in bytes', null=True)),
+                ('succeeded', models.BooleanField(default=True)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('analysis', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stages', to='analysis.Analysis')),
+                ('count_matrix', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='stages', to='analysis.FeatureListCountMatrix')),
+            ],
+            options={
+                'ordering': ('id',),
+            },
+        ),
+    ]
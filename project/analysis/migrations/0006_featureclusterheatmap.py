@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-19 18:05
+from __future__ import unicode_literals
+
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analysis', '0005_executionstage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeatureClusterHeatmap',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('k', models.PositiveSmallIntegerField()),
+                ('dim_x', models.PositiveIntegerField(help_text='Maximum width (columns) of heatmap')),
+                ('dim_y', models.PositiveIntegerField(help_text='Maximum height (rows) of heatmap')),
+                ('nrows', models.PositiveIntegerField()),
+                ('ncols', models.PositiveIntegerField()),
+                ('data', models.BinaryField()),
+                ('cluster_sizes', django.contrib.postgres.fields.jsonb.JSONField(default=dict)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('analysis', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='heatmaps', to='analysis.Analysis')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='featureclusterheatmap',
+            unique_together=set([('analysis', 'k', 'dim_x', 'dim_y')]),
+        ),
+    ]
@@ -5,6 +5,7 @@ import logging
 import os
 import uuid
 import io
+import zlib
 import requests
 import zipfile
 import itertools
@@ -12,7 +13,9 @@ import pandas as pd
 import math
 import numpy
 from scipy import stats, ndimage
-from collections import defaultdict
+from collections import defaultdict, Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 
 from django.db import models
 from django.conf import settings
@@ -23,15 +26,22 @@ from django.core.urlresolvers import reverse
 from django.core.files.base import ContentFile
 from django.contrib.sites.models import Site
 from django.contrib.postgres.fields import JSONField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField, SearchVector, \
+    SearchQuery, SearchRank
 from django.forms.models import model_to_dict
 from django.utils.timezone import now
 from django.utils.text import slugify
 from django.template.loader import render_to_string
 
-from utils.models import ReadOnlyFileSystemStorage, get_random_filename, DynamicFilePathField
+from utils import bed, chromsizes, events, profiling
+from utils.base import finite_or_none, round_significant
+from utils.resources import ResourceMonitor
+from utils.models import ReadOnlyFileSystemStorage, get_random_filename, DynamicFilePathField, \
+    TrigramWordSimilarity
 from async_messages import messages
 
-from .import managers, tasks
+from .import heatmaps, managers, tasks
 
 from orio.matrix import BedMatrix
 from orio.matrixByMatrix import MatrixByMatrix
@@ -42,6 +52,18 @@ from orio.utils import get_data_path
 logger = logging.getLogger(__name__)
 
 
+def json_text_values(obj):
+    # yield all scalar values from JSON-like content, recursively
+    if isinstance(obj, dict):
+        for value in obj.values():
+            yield from json_text_values(value)
+    elif isinstance(obj, (list, tuple)):
+        for value in obj:
+            yield from json_text_values(value)
+    elif obj is not None:
+        yield obj
+
+
 class Dataset(models.Model):
     owner = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -114,6 +136,10 @@ class GenomeAssembly(models.Model):
     def __str__(self):
         return self.name
 
+    def get_chromosome_sizes(self):
+        # parsed once per process; reloaded if the file is modified
+        return chromsizes.load(self.chromosome_size_file)
+
 
 class ValidationMixin:
 
@@ -121,12 +147,16 @@ class ValidationMixin:
         # return tuple (is_valid: bool, validation_text: str)
         raise NotImplementedError('Requires implementation')
 
-    def validate_and_save(self):
+    def validate_and_save(self, silent=False):
         is_valid, text = self.validate()
         self.validated = is_valid
         self.validation_errors = self.scrub_validation_text(text)
-        self.send_validation_message()
+        if not silent:
+            self.send_validation_message()
         self.save()
+        events.publish(
+            self.owner_id, 'validation-complete',
+            model=self._meta.model_name, id=self.id, validated=self.validated)
 
     def scrub_validation_text(self, text):
         # remove any path information from outputs
@@ -264,6 +294,9 @@ class DatasetDownload(models.Model):
         self.save()
 
         for ds in related_ds:
+            events.publish(
+                ds.owner_id, 'download-complete',
+                id=self.id, dataset=ds.id, status_code=self.status_code)
             ds.validate_and_save()
 
     def get_md5(self):
@@ -403,10 +436,10 @@ class UserDataset(ValidationMixin, GenomicDataset):
         else:
             return [self.ambiguous.data.path]
 
-    def validate_and_save(self):
+    def validate_and_save(self, silent=False):
         # wait until all files are downloaded before attempting validation
         if self.is_downloaded:
-            super().validate_and_save()
+            super().validate_and_save(silent=silent)
 
     def validate(self):
         size_file = self.genome_assembly.chromosome_size_file
@@ -487,33 +520,148 @@ class EncodeDataset(GenomicDataset):
         db_index=True,
         help_text='Cellular localization; reported by ENCODE')
     extra_content = JSONField(default=dict)
+    search_text = models.TextField(
+        blank=True,
+        help_text='Name, metadata, and extra content; used for text search')
+    search_vector = SearchVectorField(
+        null=True)
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['search_vector'], name='encodedataset_search_gin'),
+        ]
+
+    FACET_FIELDS = (
+        'data_type',
+        'cell_type',
+        'antibody',
+        'rna_extract',
+        'treatment',
+        'phase',
+        'localization',
+    )
+    FACET_INDEX_CACHE_KEY = 'encode-facet-index'
 
     @property
     def is_stranded(self):
         return self.data_ambiguous.name == ''
 
+    @classmethod
+    def count_facet_values(cls, queryset, fld):
+        rows = queryset\
+            .values(fld)\
+            .annotate(count=models.Count('id'))\
+            .order_by(fld)
+        return [{'value': row[fld], 'count': row['count']} for row in rows]
+
+    @classmethod
+    def build_facet_index(cls):
+        # cache dataset counts for each facet-field value, by genome assembly
+        index = {}
+        for genome_id in GenomeAssembly.objects.values_list('id', flat=True):
+            qs = cls.objects.filter(genome_assembly_id=genome_id)
+            index[genome_id] = {
+                'total': qs.count(),
+                'fields': {
+                    fld: cls.count_facet_values(qs, fld)
+                    for fld in cls.FACET_FIELDS
+                },
+            }
+        cache.set(cls.FACET_INDEX_CACHE_KEY, index, None)
+        return index
+
+    @classmethod
+    def get_facet_index(cls):
+        index = cache.get(cls.FACET_INDEX_CACHE_KEY)
+        if index is None:
+            index = cls.build_facet_index()
+        return index
+
+    @classmethod
+    def clear_facet_index(cls):
+        cache.delete(cls.FACET_INDEX_CACHE_KEY)
+
     @classmethod
     def get_field_options(cls):
+        index = cls.get_facet_index()
         dicts = {}
-        fields = [
-            'data_type',
-            'cell_type',
-            'antibody',
-            'rna_extract',
-            'treatment',
-            'phase',
-            'localization',
-        ]
-        for genome in GenomeAssembly.objects.all():
-            dicts[genome.id] = {}
-            for fld in fields:
-                dicts[genome.id][fld] = cls.objects\
-                    .filter(genome_assembly=genome)\
-                    .values_list(fld, flat=True)\
-                    .distinct()\
-                    .order_by(fld)
+        for genome_id in GenomeAssembly.objects.values_list('id', flat=True):
+            fields = index.get(genome_id, {}).get('fields', {})
+            dicts[genome_id] = {
+                fld: [d['value'] for d in fields.get(fld, [])]
+                for fld in cls.FACET_FIELDS
+            }
         return dicts
 
+    @classmethod
+    def get_facet_counts(cls, genome_assembly_id, selected):
+        """
+        Return number of datasets for each value of each facet field.
+
+        `selected` is a dict of field name to a list of selected values.
+        Counts for a field apply the selections of all other fields, so each
+        count is the number of datasets which would be added by selecting it.
+        Unfiltered counts are served from the cached facet index.
+        """
+        selections = {
+            fld: values
+            for fld, values in selected.items()
+            if fld in cls.FACET_FIELDS and values
+        }
+        if not selections:
+            return cls.get_facet_index().get(
+                genome_assembly_id,
+                {'total': 0, 'fields': {fld: [] for fld in cls.FACET_FIELDS}})
+
+        def filtered(exclude=None):
+            qs = cls.objects.filter(genome_assembly_id=genome_assembly_id)
+            for fld, values in selections.items():
+                if fld != exclude:
+                    qs = qs.filter(**{'{}__in'.format(fld): values})
+            return qs
+
+        return {
+            'total': filtered().count(),
+            'fields': {
+                fld: cls.count_facet_values(filtered(exclude=fld), fld)
+                for fld in cls.FACET_FIELDS
+            },
+        }
+
+    def save(self, *args, **kwargs):
+        self.search_text = self.get_search_text()
+        # computed by the database in the same INSERT/UPDATE statement
+        self.search_vector = SearchVector(
+            models.Value(self.search_text, output_field=models.TextField()))
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = set(kwargs['update_fields']) | {
+                'search_text', 'search_vector'}
+        super().save(*args, **kwargs)
+
+    def get_search_text(self):
+        values = [self.name]
+        values.extend([getattr(self, fld) for fld in self.FACET_FIELDS])
+        values.extend(json_text_values(self.extra_content))
+        return ' '.join([str(v) for v in values if v])
+
+    @classmethod
+    def search(cls, queryset, text):
+        """
+        Filter queryset by free text, ordered by relevance.
+
+        Uses full-text search for whole words and trigram word similarity
+        for partial or misspelled words.
+        """
+        query = SearchQuery(text)
+        return queryset\
+            .annotate(
+                rank=SearchRank(models.F('search_vector'), query),
+                similarity=TrigramWordSimilarity('search_text', text))\
+            .filter(
+                models.Q(search_vector=query) |
+                models.Q(search_text__trigram_word_similar=text))\
+            .order_by('-rank', '-similarity')
+
     def get_bigwig_paths(self):
         if self.is_stranded:
             return[self.data_plus.path, self.data_minus.path]
@@ -607,6 +755,19 @@ class SortVector(ValidationMixin, Dataset):
 
 
 class AnalysisDatasets(models.Model):
+    objects = managers.AnalysisDatasetsManager()
+
+    STATUS_PENDING = 0
+    STATUS_RUNNING = 1
+    STATUS_COMPLETE = 2
+    STATUS_FAILED = 3
+    STATUS_CHOICES = (
+        (STATUS_PENDING, 'pending'),
+        (STATUS_RUNNING, 'running'),
+        (STATUS_COMPLETE, 'complete'),
+        (STATUS_FAILED, 'failed'),
+    )
+
     analysis = models.ForeignKey(
         'Analysis')
     dataset = models.ForeignKey(
@@ -617,6 +778,14 @@ class AnalysisDatasets(models.Model):
         'FeatureListCountMatrix',
         null=True,
         help_text='Matrix of read coverage over genomic features')
+    status = models.PositiveSmallIntegerField(
+        choices=STATUS_CHOICES,
+        default=STATUS_PENDING,
+        help_text='State of the count matrix task for this dataset')
+    task_start_time = models.DateTimeField(
+        null=True)
+    task_end_time = models.DateTimeField(
+        null=True)
     created = models.DateTimeField(
         auto_now_add=True)
     last_updated = models.DateTimeField(
@@ -625,6 +794,25 @@ class AnalysisDatasets(models.Model):
     class Meta:
         verbose_name_plural = 'Analysis datasets'
 
+    @property
+    def task_duration(self):
+        # task duration, in seconds
+        if self.task_start_time and self.task_end_time:
+            return (self.task_end_time - self.task_start_time).total_seconds()
+
+    def set_task_status(self, status):
+        # update only task fields; other tasks may be modifying the analysis
+        fields = {'status': status, 'last_updated': now()}
+        if status == self.STATUS_RUNNING:
+            fields['task_start_time'] = now()
+        elif status in (self.STATUS_COMPLETE, self.STATUS_FAILED):
+            fields['task_end_time'] = now()
+        if self.count_matrix_id:
+            fields['count_matrix_id'] = self.count_matrix_id
+        for key, value in fields.items():
+            setattr(self, key, value)
+        self.__class__.objects.filter(id=self.id).update(**fields)
+
 
 class GenomicBinSettings(models.Model):
 
@@ -660,6 +848,11 @@ class GenomicBinSettings(models.Model):
 class Analysis(ValidationMixin, GenomicBinSettings):
     objects = managers.AnalysisManager()
     UPLOAD_TO = 'analysis/'
+    CACHED_PAYLOADS = (
+        'analysis-overview',
+        'individual-overview',
+        'feature-clustering-overview',
+    )
 
     owner = models.ForeignKey(
         settings.AUTH_USER_MODEL)
@@ -756,6 +949,17 @@ class Analysis(ValidationMixin, GenomicBinSettings):
         return reverse('analysis:analysis_zip',
                        args=[self.pk, self.slug])
 
+    # changes to these fields require re-computation
+    RESET_FIELDS = (
+        'anchor',
+        'bin_start',
+        'bin_number',
+        'bin_size',
+        'genome_assembly',
+        'feature_list_id',
+        'sort_vector_id',
+    )
+
     def is_reset_required(self, ids):
         """
         Determine if analysis reset is required (requires re-computation).
@@ -771,15 +975,7 @@ class Analysis(ValidationMixin, GenomicBinSettings):
             reset = True
         else:
             dbObj = self.__class__.objects.get(id=id_)
-            for fld in [
-                'anchor',
-                'bin_start',
-                'bin_number',
-                'bin_size',
-                'genome_assembly',
-                'feature_list_id',
-                'sort_vector_id',
-            ]:
+            for fld in self.RESET_FIELDS:
                 if getattr(dbObj, fld) != getattr(formObj, fld):
                     reset = True
                     break
@@ -791,48 +987,191 @@ class Analysis(ValidationMixin, GenomicBinSettings):
         logger.info('Analysis reset required: %s' % reset)
         return reset
 
-    def reset_analysis_object(self):
+    def is_incremental_update(self, ids):
+        """
+        Determine if existing count matrices can be kept on re-execution.
+
+        This is possible if datasets were only added to a complete analysis,
+        and no other settings have changed; only the added datasets need
+        count matrices, but the matrix combination is always re-run. This
+        method should be called from a changed form-instance, before saving.
+        """
+        if self.id is None:
+            return False
+
+        dbObj = self.__class__.objects.get(id=self.id)
+        if not dbObj.is_complete or not dbObj.output:
+            return False
+
+        for fld in self.RESET_FIELDS:
+            if getattr(dbObj, fld) != getattr(self, fld):
+                return False
+
+        dbIds = set(dbObj.analysisdatasets_set.values_list('dataset_id', flat=True))
+        return dbIds < set(ids)
+
+    def reset_analysis_object(self, keep_output=False):
+        # if `keep_output`, existing count matrices are kept on re-execution
         formObj = self
-        formObj.validated = False
-        formObj.validation_errors = ''
-        formObj.validation_warnings = ''
-        formObj.output = None
+        if not keep_output:
+            formObj.validated = False
+            formObj.validation_errors = ''
+            formObj.validation_warnings = ''
+            formObj.output = None
         formObj.start_time = None
         formObj.end_time = None
-        cache.delete(self.output_cache_key)
+        self.clear_cache()
+        if self.id:
+            self.heatmaps.all().delete()
+
+    ESTIMATE_HISTORY = 25
+    ESTIMATE_CACHE_KEY = 'analysis-execution-history'
+
+    @classmethod
+    def get_execution_history(cls):
+        """
+        Summarize timings of recently completed analyses.
+
+        Returns a dictionary with the median count matrix task duration, the
+        effective number of parallel workers, and the median matrix
+        combination time (all in seconds), or None if no history exists.
+        Cached for an hour.
+        """
+        history = cache.get(cls.ESTIMATE_CACHE_KEY)
+        if history is not None:
+            return history or None
+
+        task_duration = models.ExpressionWrapper(
+            models.F('analysisdatasets__task_end_time') -
+            models.F('analysisdatasets__task_start_time'),
+            output_field=models.DurationField())
+        rows = cls.objects\
+            .filter(start_time__isnull=False, end_time__isnull=False)\
+            .annotate(
+                n=models.Count('analysisdatasets'),
+                matrix_end=models.Max('analysisdatasets__task_end_time'),
+                task_total=models.Sum(task_duration))\
+            .filter(matrix_end__isnull=False, task_total__isnull=False)\
+            .order_by('-end_time')\
+            .values('start_time', 'end_time', 'n', 'matrix_end', 'task_total')
+        rows = list(rows[:cls.ESTIMATE_HISTORY])
+
+        history = {}
+        if rows:
+            durations, workers, combinations = [], [], []
+            for row in rows:
+                # matrix wall-time includes time queued, which we want
+                wall = (row['matrix_end'] - row['start_time']).total_seconds()
+                total = row['task_total'].total_seconds()
+                durations.append(total / row['n'])
+                workers.append(max(1., total / wall) if wall > 0 else 1.)
+                combinations.append(
+                    max(0., (row['end_time'] - row['matrix_end']).total_seconds()))
+            history = {
+                'task_duration': float(numpy.median(durations)),
+                'workers': float(numpy.median(workers)),
+                'combination': float(numpy.median(combinations)),
+            }
+        cache.set(cls.ESTIMATE_CACHE_KEY, history, 60 * 60)
+        return history or None
 
     def execute_time_estimate(self):
         # estimate execution time, in seconds
         n = float(self.datasets.count())
-        workers = 10
-        base = 300
-        matrices = math.ceil(n / workers) * 90
-        agg = 120 + math.log10(n)**2 * 60
-        return base + matrices + agg
+        history = self.get_execution_history()
+        if history is None:
+            # no measurements; fallback to a rough guess
+            workers = 10
+            base = 300
+            matrices = math.ceil(n / workers) * 90
+            agg = 120 + math.log10(max(n, 1))**2 * 60
+            return base + matrices + agg
+        matrices = math.ceil(n / history['workers']) * history['task_duration']
+        return matrices + history['combination']
+
+    def get_progress(self):
+        """
+        Return live execution progress, from per-dataset task states.
+
+        Throughput is completed datasets per minute, and `eta` is the
+        estimated number of seconds remaining.
+        """
+        counts = Counter(self.analysisdatasets_set.values_list('status', flat=True))
+        total = sum(counts.values())
+        done = counts[AnalysisDatasets.STATUS_COMPLETE]
+        failed = counts[AnalysisDatasets.STATUS_FAILED]
+        progress = {
+            'is_running': bool(self.is_running),
+            'is_complete': bool(self.is_complete),
+            'total': total,
+            'done': done,
+            'failed': failed,
+            'running': counts[AnalysisDatasets.STATUS_RUNNING],
+            'pending': counts[AnalysisDatasets.STATUS_PENDING],
+            'elapsed': None,
+            'throughput': None,
+            'eta': None,
+        }
+
+        if self.is_complete:
+            progress['eta'] = 0
+        elif self.is_running:
+            elapsed = (now() - self.start_time).total_seconds()
+            progress['elapsed'] = elapsed
+            if done > 0 and elapsed > 0:
+                progress['throughput'] = done / elapsed * 60.
+                remaining = total - done - failed
+                progress['eta'] = remaining / done * elapsed
+                history = self.get_execution_history()
+                if history:
+                    progress['eta'] += history['combination']
+            else:
+                progress['eta'] = max(0., self.execute_time_estimate() - elapsed)
+
+        return progress
 
     @property
     def user_datasets(self):
-        return UserDataset.objects.filter(id__in=self.datasets.values_list('id', flat=True))
+        return UserDataset.objects.filter(analysisdatasets__analysis=self)
 
     @property
     def encode_datasets(self):
-        return EncodeDataset.objects.filter(id__in=self.datasets.values_list('id', flat=True))
+        return EncodeDataset.objects.filter(analysisdatasets__analysis=self)
 
     @property
     def analysis_user_datasets(self):
-        return self.analysisdatasets_set.filter(dataset__in=self.user_datasets)
+        # use classified datasets if prefetched, see `prefetch_analysis_datasets`
+        prefetched = getattr(self, 'prefetched_analysis_datasets', None)
+        if prefetched is not None:
+            return [ads for ads in prefetched if not ads.is_encode]
+        return self.analysisdatasets_set.user()
 
     @property
     def analysis_encode_datasets(self):
-        return self.analysisdatasets_set.filter(dataset__in=self.encode_datasets)
+        prefetched = getattr(self, 'prefetched_analysis_datasets', None)
+        if prefetched is not None:
+            return [ads for ads in prefetched if ads.is_encode]
+        return self.analysisdatasets_set.encode()
 
-    def get_form_datasets(self):
-        uds = list(self.analysis_user_datasets.values('dataset_id', 'display_name'))
-        eds = list(self.analysis_encode_datasets.values('dataset_id', 'display_name'))
+    @classmethod
+    def prefetch_analysis_datasets(cls, queryset):
+        # prefetch all analysis datasets, classified as user or ENCODE
+        return queryset.prefetch_related(models.Prefetch(
+            'analysisdatasets_set',
+            queryset=AnalysisDatasets.objects.with_is_encode().order_by('id'),
+            to_attr='prefetched_analysis_datasets'))
 
-        for ds in itertools.chain(uds, eds):
-            ds['dataset'] = ds['dataset_id']
-            del ds['dataset_id']
+    def get_form_datasets(self):
+        uds = []
+        eds = []
+        datasets = self.analysisdatasets_set\
+            .with_is_encode()\
+            .order_by('id')\
+            .values('dataset_id', 'display_name', 'is_encode')
+        for ds in datasets:
+            lst = eds if ds.pop('is_encode') else uds
+            ds['dataset'] = ds.pop('dataset_id')
+            lst.append(ds)
 
         return json.dumps({
             "userDatasets": uds,
@@ -875,11 +1214,76 @@ class Analysis(ValidationMixin, GenomicBinSettings):
     def is_complete(self):
         return self.start_time is not None and self.end_time is not None
 
+    def get_conditional_validators(self):
+        # output is immutable once complete; any reset clears `end_time`
+        if not self.is_complete:
+            return None, None
+        etag = 'analysis-%s-%s' % (self.id, self.end_time.timestamp())
+        return etag, self.end_time
+
+    def get_stages(self):
+        # timings of the most recent execution
+        stages = self.stages.select_related('count_matrix')
+        if self.start_time:
+            stages = stages.filter(created__gte=self.start_time)
+        return stages
+
+    @classmethod
+    def get_bulk_status(cls, queryset):
+        """
+        Return execution status for many analyses, using a single query.
+
+        Includes count-matrix completion for each dataset in each analysis.
+        """
+        rows = queryset\
+            .order_by('id', 'analysisdatasets__id')\
+            .values(
+                'id', 'start_time', 'end_time',
+                'analysisdatasets__dataset_id',
+                'analysisdatasets__display_name',
+                'analysisdatasets__count_matrix_id',
+                'analysisdatasets__status')
+
+        status_display = dict(AnalysisDatasets.STATUS_CHOICES)
+        statuses = {}
+        for row in rows:
+            status = statuses.get(row['id'])
+            if status is None:
+                status = statuses[row['id']] = {
+                    'id': row['id'],
+                    'start_time': row['start_time'],
+                    'end_time': row['end_time'],
+                    'is_running': row['start_time'] is not None and row['end_time'] is None,
+                    'is_complete': row['start_time'] is not None and row['end_time'] is not None,
+                    'datasets': [],
+                }
+            if row['analysisdatasets__dataset_id'] is not None:
+                status['datasets'].append({
+                    'dataset': row['analysisdatasets__dataset_id'],
+                    'display_name': row['analysisdatasets__display_name'],
+                    'count_matrix_complete': row['analysisdatasets__count_matrix_id'] is not None,
+                    'status': status_display.get(row['analysisdatasets__status']),
+                })
+
+        for status in statuses.values():
+            status['datasets_total'] = len(status['datasets'])
+            status['datasets_complete'] = sum(
+                1 for d in status['datasets'] if d['count_matrix_complete'])
+
+        return list(statuses.values())
+
     @property
     def execute_task_id(self):
         return 'analysis-execute-{}'.format(self.id)
 
+    @property
+    def is_incremental(self):
+        # output is kept on reset only if existing count matrices are kept
+        return bool(self.output) and not self.is_complete
+
     def execute(self, silent=False):
+        incremental = self.is_incremental
+
         # intentionally don't fire save signal
         self.__class__.objects\
             .filter(id=self.id)\
@@ -887,23 +1291,36 @@ class Analysis(ValidationMixin, GenomicBinSettings):
                 start_time=now(),
                 end_time=None,
             )
+
+        ads = self.analysisdatasets_set.all()
+        if incremental:
+            ads = ads.filter(count_matrix__isnull=True)
+        ads.update(
+            status=AnalysisDatasets.STATUS_PENDING,
+            task_start_time=None,
+            task_end_time=None,
+        )
         tasks.execute_analysis.apply_async(
-            args=[self.id, silent], task_id=self.execute_task_id)
+            args=[self.id, silent, incremental], task_id=self.execute_task_id)
 
     def create_matrix_list(self):
         return [
             [ads.count_matrix.id, ads.display_name, ads.count_matrix.matrix.path]
-            for ads in self.analysisdatasets_set.all().prefetch_related('count_matrix')
+            for ads in self.analysisdatasets_set.all().select_related('count_matrix')
         ]
 
     def execute_mat2mat(self):
+        return self.write_mat2mat(self.get_mat2mat())
+
+    def get_mat2mat(self):
+        # combine all count matrices; returns a computed MatrixByMatrix
         matrix_list = self.create_matrix_list()
 
         sv = None
         if self.sort_vector:
             sv = self.sort_vector.dataset.path
 
-        mm = MatrixByMatrix(
+        return MatrixByMatrix(
             feature_bed=self.feature_list.dataset.path,
             matrix_list=matrix_list,
             annotation=self.genome_assembly.annotation_file,
@@ -913,21 +1330,62 @@ class Analysis(ValidationMixin, GenomicBinSettings):
             sort_vector=sv,
         )
 
+    def write_mat2mat(self, mm):
+        # write MatrixByMatrix output; returns path relative to MEDIA_ROOT
         fn = get_random_filename(os.path.join(settings.MEDIA_ROOT, self.UPLOAD_TO))
         mm.writeJson(fn)
-
         return os.path.join(self.UPLOAD_TO, os.path.basename(fn))
 
     @property
     def output_cache_key(self):
         return 'analysis-%s' % self.id
 
+    def get_payload_cache_key(self, name):
+        return 'analysis-%s-%s' % (name, self.id)
+
+    @property
+    def cache_keys(self):
+        # all cache keys which are invalidated when an analysis is reset
+        keys = [self.output_cache_key, self.sort_vector_cache_key]
+        keys.extend([self.get_payload_cache_key(name) for name in self.CACHED_PAYLOADS])
+        return keys
+
+    def clear_cache(self):
+        cache.delete_many(self.cache_keys)
+
+    def _get_cached_payload(self, name, func):
+        key = self.get_payload_cache_key(name)
+        obj = profiling.cache_get(key)
+        if obj is None:
+            obj = func()
+            cache.set(key, obj)
+        return obj
+
+    def warm_cache(self):
+        """
+        Pre-populate cache with initial payloads for visualizations.
+
+        Called after execution is complete so that the first visit after the
+        completion email is as fast as subsequent visits.
+        """
+        if not self.output:
+            return
+
+        self.get_analysis_overview_init()
+        self.get_individual_overview_init()
+        self.get_feature_clustering_overview_init()
+        FeatureClusterHeatmap.create_for_analysis(self)
+
+        dim_x, dim_y = FeatureListCountMatrix.DEFAULT_RENDER_DIMS
+        flcms = list(FeatureListCountMatrix.objects.filter(id__in=self.get_flcm_ids()))
+        FeatureListCountMatrix.get_sorted_data_batch(flcms, dim_x, dim_y, False, None, self.id)
+
     @property
     def output_json(self):
         key = self.output_cache_key
-        obj = cache.get(key)
+        obj = profiling.cache_get(key)
         if not obj:
-            with open(self.output.path, 'r') as f:
+            with open(self.output.path, 'r') as f, profiling.phase('json-decode'):
                 output = json.loads(f.read())
 
             obj = output
@@ -944,7 +1402,7 @@ class Analysis(ValidationMixin, GenomicBinSettings):
         sv = None
         if self.sort_vector is not None:
             key = self.sort_vector_cache_key
-            sv = cache.get(key)
+            sv = profiling.cache_get(key)
             if sv is None:
                 sv = pd.read_csv(
                     self.sort_vector.dataset.path, sep='\t', header=None
@@ -973,7 +1431,10 @@ class Analysis(ValidationMixin, GenomicBinSettings):
     def get_analysis_overview_init(self):
         if not self.output:
             return False
+        return self._get_cached_payload(
+            'analysis-overview', self._get_analysis_overview_init)
 
+    def _get_analysis_overview_init(self):
         sv = self.sort_vector_df
         if sv is not None:
             sv = sv.as_matrix(columns=[1]).flatten()
@@ -988,7 +1449,10 @@ class Analysis(ValidationMixin, GenomicBinSettings):
     def get_individual_overview_init(self):
         if not self.output:
             return False
+        return self._get_cached_payload(
+            'individual-overview', self._get_individual_overview_init)
 
+    def _get_individual_overview_init(self):
         matrices = self.matrices
 
         sv = None
@@ -1004,6 +1468,10 @@ class Analysis(ValidationMixin, GenomicBinSettings):
         return data
 
     def get_feature_clustering_overview_init(self):
+        return self._get_cached_payload(
+            'feature-clustering-overview', self._get_feature_clustering_overview_init)
+
+    def _get_feature_clustering_overview_init(self):
         centroids = self.output_json['fc_centroids']
 
         upper_quartile = numpy.array(self.output_json['fc_vectors']['q3'],
@@ -1111,46 +1579,41 @@ class Analysis(ValidationMixin, GenomicBinSettings):
         return self.output_json['dsc_full_data']['rows'][i]['row_id']
 
     def get_cluster_members(self, k, cluster):
-        entry_list = []
-        gene_list = []
-
-        # READ FEATURE LIST
-        feature_to_line = dict()
-        count = 0
-        total_valid_lines = BedMatrix.countValidBedLines(self.feature_list.dataset.path)
-
-        with open(self.feature_list.dataset.path) as f:
-            for line in f:
-                if not BedMatrix.checkHeader(line):
-                    bed_fields = len(line.strip().split())
-
-                    name = None
-                    if bed_fields >= 4:  # Contains name information?
-                        name = line.strip().split()[3]
-                    if name is None or name in BedMatrix.DUMMY_VALUES:
-                        name = BedMatrix.generateFeatureName(
-                            "feature", count, total_valid_lines)
-                    count += 1
-
-                    feature_to_line[name] = line.strip()
-
-        # GET GENE ASSOCIATIONS FROM JSON
         if not self.output:
             return False
         feature_to_gene = self.output_json['feature_to_gene']
+        members = self.output_json['fc_clusters'][str(k)][str(cluster)]
+
+        # find feature-list lines for cluster members in a single pass;
+        # unnamed features are matched by their index in the file
+        wanted = set(members)
+        wanted_index = {
+            bed.get_feature_index(name): name
+            for name in members
+        }
+        wanted_index.pop(None, None)
 
-        # CREATE ENTRY LINES AND GENE LISTS, RETURN ZIPPED
-        for feature in self.output_json['fc_clusters'][str(k)][str(cluster)]:
-            entry_list.append(feature_to_line[feature])
-            gene_list.append(feature_to_gene[feature])
-        return(zip(entry_list, gene_list))
+        feature_to_line = dict()
+        for record in bed.read_bed(
+                self.feature_list.dataset.path, BedMatrix.DUMMY_VALUES):
+            if record.name in wanted:
+                feature_to_line[record.name] = record.line.strip()
+            elif record.index in wanted_index and \
+                    bed.get_feature_index(record.name) == record.index:
+                feature_to_line[wanted_index[record.index]] = record.line.strip()
+
+        return zip(
+            [feature_to_line[feature] for feature in members],
+            [feature_to_gene[feature] for feature in members])
 
     def get_feature_data(self, feature_name):
         if not self.output:
             return False
         return self.output_json['fc_vectors']['vectors'][feature_name]
 
-    def get_k_clust_heatmap(self, k_value, dim_x, dim_y):
+    def get_k_clust_values(self, k_value):
+        # return cluster-ordered feature vectors, normalized by the upper
+        # quartile, and the number of features in each cluster
         fc_vectors = self.output_json['fc_vectors']['vectors']
         fc_clusters = self.output_json['fc_clusters'][str(k_value)]
         upper_quartile = numpy.array(
@@ -1166,29 +1629,49 @@ class Analysis(ValidationMixin, GenomicBinSettings):
         display_values = numpy.array(display_values, dtype=numpy.float)
         display_values = display_values / upper_quartile
         display_values = numpy.nan_to_num(display_values)
+        return display_values, cluster_sizes
 
+    @staticmethod
+    def zoom_k_clust_values(display_values, dim_x, dim_y):
         ncols = len(display_values[0])
         nrows = len(display_values)
 
-        if ncols > dim_x:
+        if dim_x and ncols > dim_x:
             zoom_x = dim_x / ncols
         else:
             zoom_x = 1
 
-        if nrows > dim_y:
+        if dim_y and nrows > dim_y:
             zoom_y = dim_y / nrows
         else:
             zoom_y = 1
 
-        zoomed_data = ndimage.zoom(
+        return ndimage.zoom(
             display_values, (zoom_y, zoom_x), order=0)
 
+    def get_k_clust_heatmap_values(self, k_value, dim_x, dim_y):
+        # return (zoomed values, cluster sizes); use the nearest precomputed
+        # heatmap if available, otherwise compute from the output file.
+        heatmap = FeatureClusterHeatmap.get_nearest(self.id, k_value, dim_x, dim_y)
+        if heatmap is not None:
+            # stored resolution may exceed the request; clients don't shrink
+            values = self.zoom_k_clust_values(heatmap.values, dim_x, dim_y)
+            return values, heatmap.cluster_sizes
+        display_values, cluster_sizes = self.get_k_clust_values(k_value)
+        return self.zoom_k_clust_values(display_values, dim_x, dim_y), cluster_sizes
+
+    def get_k_clust_heatmap(self, k_value, dim_x, dim_y):
+        zoomed_data, cluster_sizes = self.get_k_clust_heatmap_values(k_value, dim_x, dim_y)
         return {
             'display_data': zoomed_data,
             'cluster_sizes': cluster_sizes,
             'col_names': self.output_json['fc_vectors']['col_names'],
         }
 
+    def get_k_clust_heatmap_png(self, k_value, dim_x, dim_y):
+        zoomed_data, _ = self.get_k_clust_heatmap_values(k_value, dim_x, dim_y)
+        return heatmaps.cluster_heatmap_png(zoomed_data, dim_x, dim_y)
+
     def get_ks(self, vector_id, matrix_id):
         if not self.output:
             return False
@@ -1407,11 +1890,17 @@ class FeatureListCountMatrix(GenomicBinSettings):
 
     ALL_BINS = 'All bins'
 
+    # heatmap dimensions used when pre-computing sorted renders
+    DEFAULT_RENDER_DIMS = (500, 1000)
+
+    # maximum threads used to render multiple sorted matrices
+    RENDER_WORKERS = 4
+
     @property
     def df(self):
         # get formatted pandas data frame
         key = 'flcm-df-%s' % self.id
-        df = cache.get(key)
+        df = profiling.cache_get(key)
         if df is None:
             df = pd.read_csv(self.matrix.path, sep='\t')
             df.rename(columns={'Unnamed: 0': 'label'}, inplace=True)
@@ -1469,6 +1958,11 @@ class FeatureListCountMatrix(GenomicBinSettings):
             matrix=os.path.join(cls.UPLOAD_TO, os.path.basename(fn))
         )
 
+    def get_conditional_validators(self):
+        # count matrices are never modified after creation
+        etag = 'flcm-%s-%s' % (self.id, self.last_updated.timestamp())
+        return etag, self.last_updated
+
     def user_can_view(self, user):
         analyses = self.analysisdatasets_set\
             .values('analysis__owner_id', 'analysis__public')
@@ -1481,54 +1975,155 @@ class FeatureListCountMatrix(GenomicBinSettings):
             user.id in self.analysisdatasets_set.objects\
                 .values_list('analysis__owner_id', flat=True)
 
-    def get_dataset(self):
-        key = 'flcm-%s' % self.id
-        obj = cache.get(key)
-        if not obj:
-            with open(self.matrix.path, 'r') as f:
-                obj = f.read()
+    def get_matrix_values(self):
+        # return bin labels and a numpy array of values (without row labels)
+        df = self.df.drop(self.ALL_BINS, axis=1)
+        return list(df.columns), df.values.astype(numpy.float)
+
+    @classmethod
+    def get_sort_settings(cls, analysis_sort, sort_matrix_id, analysis_id):
+        # return tuple (analysis or None, sort key)
+        if analysis_sort and sort_matrix_id:
+            raise ValueError('Two sort procedures specifed')
+
+        if analysis_sort:
+            analysis = Analysis.objects\
+                .select_related('sort_vector')\
+                .get(id=analysis_id)
+            if analysis.sort_vector is None:
+                raise ValueError('Analysis has no sort vector')
+            sort_key = 'sv-%s-%s' % (
+                analysis.sort_vector_id,
+                analysis.sort_vector.last_updated.timestamp())
+            return analysis, sort_key
+        elif sort_matrix_id:
+            return None, 'flcm-%s' % sort_matrix_id
+        return None, 'unsorted'
+
+    @classmethod
+    def get_sort_order(cls, analysis, sort_matrix_id):
+        # return descending row-order for sort procedure, or None if unsorted
+        if analysis:
+            sort_list = analysis.sort_vector_df.as_matrix(columns=[1])
+            return numpy.argsort(sort_list.flatten())[::-1]
+        elif sort_matrix_id:
+            sort_matrix = cls.objects.filter(id=sort_matrix_id).first()
+            return numpy.argsort(sort_matrix.df[cls.ALL_BINS].values)[::-1]
+        return None
+
+    def get_sorted_cache_key(self, dim_x, dim_y, sort_key):
+        return 'flcm-sorted-%s-%s-%s-%s' % (self.id, dim_x, dim_y, sort_key)
+
+    def get_sorted_data(self, dim_x, dim_y, analysis_sort, sort_matrix_id, analysis_id):
+        analysis, sort_key = self.get_sort_settings(analysis_sort, sort_matrix_id, analysis_id)
+        key = self.get_sorted_cache_key(dim_x, dim_y, sort_key)
+        obj = profiling.cache_get(key)
+        if obj is None:
+            summary = FeatureListCountMatrixSummary.objects\
+                .filter(count_matrix=self, sort_key=sort_key)\
+                .first()
+            sort_order = self.get_sort_order(analysis, sort_matrix_id)
+            obj = self.render_sorted_data(
+                dim_x, dim_y, sort_order, summary.summary if summary else None)
+            if summary is None:
+                FeatureListCountMatrixSummary.create_from_data(self, sort_key, obj)
             cache.set(key, obj)
         return obj
 
-    def get_sorted_data(self, dim_x, dim_y, analysis_sort, sort_matrix_id, analysis_id):
-        # TODO: refactor so we don't load self.matrix.path twice; cache?
-        # TODO: move to orio instead of orio-web?
-        with open(self.matrix.path, 'r') as f:
-            bin_labels = f.readline().split('\t')[1:]
-            ncols = len(bin_labels)
+    def get_sorted_png(self, dim_x, dim_y, analysis_sort, sort_matrix_id, analysis_id):
+        data = self.get_sorted_data(dim_x, dim_y, analysis_sort, sort_matrix_id, analysis_id)
+        return heatmaps.count_matrix_heatmap_png(
+            data['smoothed_data'], data['norm_val'], dim_x, dim_y)
 
-        flcm_data = numpy.loadtxt(
-            self.matrix.path, delimiter='\t', skiprows=1,
-            usecols=range(1, ncols + 1))
+    @classmethod
+    def get_sorted_data_batch(cls, objects, dim_x, dim_y,
+                              analysis_sort, sort_matrix_id, analysis_id):
+        """
+        Return sorted data for multiple count matrices, keyed by matrix id.
 
-        if analysis_sort and sort_matrix_id:
-            raise ValueError('Two sort procedures specifed')
+        The sort order is computed once and shared by all matrices; any
+        matrices not already cached are rendered in parallel.
+        """
+        analysis, sort_key = cls.get_sort_settings(analysis_sort, sort_matrix_id, analysis_id)
+        keys = {
+            obj.id: obj.get_sorted_cache_key(dim_x, dim_y, sort_key)
+            for obj in objects
+        }
+        cached = profiling.cache_get_many(list(keys.values()))
+        results = {obj.id: cached.get(keys[obj.id]) for obj in objects}
+
+        missing = [obj for obj in objects if results[obj.id] is None]
+        if missing:
+            # database queries happen here, not in rendering threads
+            summaries = {
+                d.count_matrix_id: d.summary
+                for d in FeatureListCountMatrixSummary.objects.filter(
+                    count_matrix__in=missing, sort_key=sort_key)
+            }
+            sort_order = cls.get_sort_order(analysis, sort_matrix_id)
+            with ThreadPoolExecutor(max_workers=cls.RENDER_WORKERS) as executor:
+                rendered = executor.map(
+                    lambda obj: obj.render_sorted_data(
+                        dim_x, dim_y, sort_order, summaries.get(obj.id)),
+                    missing)
+                for obj, data in zip(missing, rendered):
+                    results[obj.id] = data
+
+            for obj in missing:
+                if obj.id not in summaries:
+                    FeatureListCountMatrixSummary.create_from_data(
+                        obj, sort_key, results[obj.id])
+            cache.set_many({keys[obj.id]: results[obj.id] for obj in missing})
+
+        return results
 
-        elif analysis_sort:
-            sorted_flcm = []
-            analysis = Analysis.objects.get(id=analysis_id)
-            sort_list = analysis.sort_vector_df.as_matrix(columns=[1])
-            for i in numpy.argsort(sort_list.flatten())[::-1]:
-                sorted_flcm.append(flcm_data[i])
-            sorted_flcm = numpy.array(sorted_flcm)
+    @staticmethod
+    def summarize_sorted_data(sorted_flcm):
+        # profile-plot and quartile statistics which are independent of
+        # heatmap dimensions; returned values are JSON serializable.
+        quartile_averages = [
+            numpy.mean(quartile, axis=0)
+            for quartile in numpy.array_split(sorted_flcm, 4)
+        ]
+        quartile_vector_sums = numpy.array_split(numpy.sum(sorted_flcm, axis=1), 4)
 
-        elif sort_matrix_id:
-            sorted_flcm = []
-            sort_matrix = FeatureListCountMatrix.objects\
-                .filter(id=sort_matrix_id).first()
-            with open(sort_matrix.matrix.path, 'r') as f:
-                ncols = len(f.readline().split('\t')[1:])
-            sort_data = numpy.loadtxt(
-                sort_matrix.matrix.path, delimiter='\t', skiprows=1,
-                usecols=range(1, ncols + 1)
-            )
-            for i in numpy.argsort(numpy.sum(sort_data, axis=1))[::-1]:
-                sorted_flcm.append(flcm_data[i])
-            sorted_flcm = numpy.array(sorted_flcm)
+        statistic, critical_values, pvalue = stats.anderson_ksamp(quartile_vector_sums)
+        ad_results = dict(
+            test_statistic=finite_or_none(statistic),
+            critical_values=[finite_or_none(v) for v in critical_values],
+            pvalue=finite_or_none(pvalue),
+        )
+
+        statistic, pvalue = stats.mstats.kruskalwallis(*quartile_vector_sums)
+        kw_results = dict(
+            test_statistic=finite_or_none(statistic),
+            pvalue=finite_or_none(pvalue),
+        )
 
+        return dict(
+            quartile_averages=[
+                [finite_or_none(v) for v in averages]
+                for averages in quartile_averages
+            ],
+            bin_averages=[
+                finite_or_none(v) for v in numpy.mean(sorted_flcm, axis=0)
+            ],
+            ad_results=ad_results,
+            kw_results=kw_results,
+        )
+
+    def render_sorted_data(self, dim_x, dim_y, sort_order, summary=None):
+        # TODO: move to orio instead of orio-web?
+        bin_labels, flcm_data = self.get_matrix_values()
+
+        if sort_order is not None:
+            sorted_flcm = flcm_data[sort_order]
         else:
             sorted_flcm = flcm_data
 
+        if summary is None:
+            summary = self.summarize_sorted_data(sorted_flcm)
+
         nrows = len(sorted_flcm[0])
         ncols = len(sorted_flcm)
 
@@ -1540,54 +2135,265 @@ class FeatureListCountMatrix(GenomicBinSettings):
         if ncols > dim_y:
             zoom_y = dim_y / ncols
 
-        quartiles = numpy.array_split(sorted_flcm, 4)
-        quartile_averages = []
-        quartile_vector_sums = [[] for i in range(4)]
-        for i, quartile in enumerate(quartiles):
-            quartile_averages.append(numpy.mean(quartile, axis=0))
-
-            if quartile_vector_sums[i] is None:
-                quartile_vector_sums[i] = []
-            for vector in quartile:
-                quartile_vector_sums[i].append(
-                    numpy.sum(vector)
-                )
-
-        ad_results = dict()
-        for key, value in zip(['test_statistic', 'critical_values', 'pvalue'],
-                              stats.anderson_ksamp(quartile_vector_sums)):
-            ad_results[key] = value
-
-        kruskalwallis = stats.mstats.kruskalwallis(
-            quartile_vector_sums[0],
-            quartile_vector_sums[1],
-            quartile_vector_sums[2],
-            quartile_vector_sums[3],
-        )
-        kw_results = dict()
-        for key, value in zip(['test_statistic', 'pvalue'], kruskalwallis):
-            kw_results[key] = value
-
         zoomed_data = ndimage.zoom(sorted_flcm, (zoom_y, zoom_x), order=5, prefilter=False)
         smoothed_data = ndimage.median_filter(zoomed_data, size=(1, 5))
 
-        return dict(
+        lower_quartile, median, upper_quartile = numpy.percentile(smoothed_data, [25, 50, 75])
+        average = numpy.mean(smoothed_data)
+        variance = numpy.var(smoothed_data)
+
+        data = dict(
             bin_labels=bin_labels,
-            quartile_averages=quartile_averages,
-            bin_averages=numpy.mean(sorted_flcm, axis=0),
             norm_val=dict(
-                lower_quartile=numpy.percentile(smoothed_data, 25),
-                median=numpy.percentile(smoothed_data, 50),
-                upper_quartile=numpy.percentile(smoothed_data, 75),
+                lower_quartile=lower_quartile,
+                median=median,
+                upper_quartile=upper_quartile,
                 max=numpy.max(smoothed_data),
                 min=numpy.min(smoothed_data),
-                average=numpy.mean(smoothed_data),
-                stddev=numpy.std(smoothed_data),
-                variance=numpy.var(smoothed_data),
+                average=average,
+                stddev=numpy.sqrt(variance),
+                variance=variance,
             ),
             smoothed_data=smoothed_data,
-            ad_results=ad_results,
-            kw_results=kw_results,
+        )
+        data.update(summary)
+        return data
+
+
+class FeatureListCountMatrixSummary(models.Model):
+    """
+    Summary statistics for a count matrix in a specific sort order.
+
+    These are independent of heatmap dimensions, so they're computed once
+    per (count matrix, sort order) and reused for all renders.
+    """
+    SUMMARY_FIELDS = ('quartile_averages', 'bin_averages', 'ad_results', 'kw_results')
+
+    count_matrix = models.ForeignKey(
+        FeatureListCountMatrix,
+        related_name='summaries')
+    sort_key = models.CharField(
+        max_length=64,
+        help_text='Sort procedure used to order matrix rows')
+    summary = JSONField(default=dict)
+    created = models.DateTimeField(
+        auto_now_add=True)
+
+    class Meta:
+        verbose_name_plural = 'Feature list count matrix summaries'
+        unique_together = (('count_matrix', 'sort_key'), )
+
+    @classmethod
+    def create_from_data(cls, count_matrix, sort_key, data):
+        summary = {fld: data[fld] for fld in cls.SUMMARY_FIELDS}
+        obj, created = cls.objects.get_or_create(
+            count_matrix=count_matrix,
+            sort_key=sort_key,
+            defaults={'summary': summary})
+
+        # sort-vector keys end with its last-updated time; summaries for
+        # earlier versions of the same sort vector are no longer used
+        if created and sort_key.startswith('sv-'):
+            prefix = sort_key.rsplit('-', 1)[0] + '-'
+            cls.objects\
+                .filter(count_matrix=count_matrix, sort_key__startswith=prefix)\
+                .exclude(id=obj.id)\
+                .delete()
+        return obj
+
+
+class FeatureClusterHeatmap(models.Model):
+    """
+    Cluster-ordered, normalized feature-clustering heatmap for a value of k.
+
+    Computed at completion for each k at several standard resolutions, so
+    requests are served without recomputing and zooming the full matrix.
+    Values are stored as zlib-compressed little-endian float32, and read as
+    float64 rounded to float32 precision.
+    """
+    RESOLUTIONS = (
+        (250, 250),
+        (500, 500),
+        (750, 750),
+        (1000, 1000),
+        (1500, 1500),
+        (2000, 2000),
+    )
+    DTYPE = '<f4'
+    SIGNIFICANT_DIGITS = 7  # float32 precision
+
+    analysis = models.ForeignKey(
+        Analysis,
+        related_name='heatmaps')
+    k = models.PositiveSmallIntegerField()
+    dim_x = models.PositiveIntegerField(
+        help_text='Maximum width (columns) of heatmap')
+    dim_y = models.PositiveIntegerField(
+        help_text='Maximum height (rows) of heatmap')
+    nrows = models.PositiveIntegerField()
+    ncols = models.PositiveIntegerField()
+    data = models.BinaryField()
+    cluster_sizes = JSONField(default=dict)
+    created = models.DateTimeField(
+        auto_now_add=True)
+
+    class Meta:
+        unique_together = (('analysis', 'k', 'dim_x', 'dim_y'), )
+
+    @classmethod
+    def encode(cls, values):
+        return zlib.compress(numpy.ascontiguousarray(values, dtype=cls.DTYPE).tobytes())
+
+    @property
+    def values(self):
+        values = numpy.frombuffer(zlib.decompress(self.data), dtype=self.DTYPE)
+        values = round_significant(values, self.SIGNIFICANT_DIGITS)
+        return values.reshape(self.nrows, self.ncols)
+
+    @classmethod
+    def create_for_analysis(cls, analysis):
+        """Replace all heatmaps for a completed analysis."""
+        cls.objects.filter(analysis=analysis).delete()
+        if not analysis.output:
+            return
+
+        objects = []
+        for k in sorted(analysis.output_json['fc_clusters'], key=int):
+            display_values, cluster_sizes = analysis.get_k_clust_values(k)
+            for dim_x, dim_y in cls.RESOLUTIONS:
+                values = Analysis.zoom_k_clust_values(display_values, dim_x, dim_y)
+                objects.append(cls(
+                    analysis=analysis,
+                    k=int(k),
+                    dim_x=dim_x,
+                    dim_y=dim_y,
+                    nrows=values.shape[0],
+                    ncols=values.shape[1],
+                    data=cls.encode(values),
+                    cluster_sizes=cluster_sizes,
+                ))
+        cls.objects.bulk_create(objects)
+
+    @classmethod
+    def get_resolution(cls, dim_x, dim_y):
+        # smallest standard resolution covering the requested size, or the
+        # largest available; it's zoomed down to the requested size on read
+        if not dim_x or not dim_y:
+            return cls.RESOLUTIONS[-1]
+        covers = [
+            dims for dims in cls.RESOLUTIONS
+            if dims[0] >= dim_x and dims[1] >= dim_y
+        ]
+        return covers[0] if covers else cls.RESOLUTIONS[-1]
+
+    @classmethod
+    def get_nearest(cls, analysis_id, k, dim_x, dim_y):
+        dim_x, dim_y = cls.get_resolution(dim_x, dim_y)
+        return cls.objects\
+            .filter(analysis_id=analysis_id, k=k, dim_x=dim_x, dim_y=dim_y)\
+            .first()
+
+
+class ExecutionStage(models.Model):
+    EXECUTE = 'execute'
+    COUNT_MATRIX = 'count-matrix'
+    MATRIX_COMBINATION = 'matrix-combination'
+    JSON_WRITE = 'json-write'
+    CACHE_WARM = 'cache-warm'
+    EMAIL = 'email'
+    NAME_CHOICES = (
+        (EXECUTE, 'execute'),
+        (COUNT_MATRIX, 'count matrix'),
+        (MATRIX_COMBINATION, 'matrix combination'),
+        (JSON_WRITE, 'JSON write'),
+        (CACHE_WARM, 'cache warm'),
+        (EMAIL, 'email'),
+    )
+
+    analysis = models.ForeignKey(
+        Analysis,
+        related_name='stages')
+    count_matrix = models.ForeignKey(
+        FeatureListCountMatrix,
+        null=True,
+        on_delete=models.SET_NULL,
+        related_name='stages')
+    name = models.CharField(
+        max_length=32,
+        choices=NAME_CHOICES)
+    queue_wait = models.FloatField(
+        null=True,
+        help_text='Seconds between task being queued and started')
+    compute = models.FloatField(
+        null=True,
+        help_text='Seconds to complete stage')
+    bytes_read = models.BigIntegerField(
+        null=True)
+    bytes_written = models.BigIntegerField(
+        null=True)
+    peak_rss = models.BigIntegerField(
+        null=True,
+        help_text='Peak resident memory of worker, in bytes')
+    succeeded = models.BooleanField(
+        default=True)
+    created = models.DateTimeField(
+        auto_now_add=True)
+
+    class Meta:
+        ordering = ('id', )
+
+    @classmethod
+    @contextmanager
+    def record(cls, name, analysis_id, queued=None, count_matrix_id=None):
+        """
+        Measure and save a stage of analysis execution.
+
+        The stage is yielded, so that its count matrix may be set once known.
+        If `queued` (a datetime) is provided, queue wait is also recorded.
+        """
+        stage = cls(
+            name=name,
+            analysis_id=analysis_id,
+            count_matrix_id=count_matrix_id)
+        if queued is not None:
+            stage.queue_wait = max(0., (now() - queued).total_seconds())
+        monitor = ResourceMonitor()
+        try:
+            with monitor:
+                yield stage
+        except Exception:
+            stage.succeeded = False
+            raise
+        finally:
+            stage.compute = monitor.seconds
+            stage.bytes_read = monitor.bytes_read
+            stage.bytes_written = monitor.bytes_written
+            stage.peak_rss = monitor.peak_rss
+            try:
+                stage.save()
+            except Exception as e:
+                # never fail a task because timings couldn't be saved
+                logger.error(e, exc_info=True)
+
+    @classmethod
+    def get_summary(cls, queryset):
+        # aggregate timings by stage name, for capacity planning
+        return list(
+            queryset
+            .order_by('name')
+            .values('name')
+            .annotate(
+                count=models.Count('id'),
+                failed=models.Count(models.Case(
+                    models.When(succeeded=False, then=1))),
+                queue_wait_avg=models.Avg('queue_wait'),
+                queue_wait_max=models.Max('queue_wait'),
+                compute_avg=models.Avg('compute'),
+                compute_max=models.Max('compute'),
+                bytes_read_total=models.Sum('bytes_read'),
+                bytes_written_total=models.Sum('bytes_written'),
+                peak_rss_max=models.Max('peak_rss'),
+            )
         )
 
 
@@ -1,6 +1,7 @@
 from itertools import chain
 from rest_framework import serializers
 
+from utils.api import SparseFieldsMixin
 from . import models
 
 
@@ -40,7 +41,7 @@ class SortVectorSerializer(serializers.ModelSerializer):
         )
 
 
-class EncodeDatasetSerializer(serializers.ModelSerializer):
+class EncodeDatasetSerializer(SparseFieldsMixin, serializers.ModelSerializer):
 
     class Meta:
         model = models.EncodeDataset
@@ -48,6 +49,7 @@ class EncodeDatasetSerializer(serializers.ModelSerializer):
             'public', 'validated', 'validation_errors', 'validation_warnings',
             'owner', 'created', 'last_updated',
             'data_plus', 'data_minus', 'data_ambiguous', 'uuid',
+            'search_text', 'search_vector',
         )
 
 
@@ -96,9 +98,9 @@ class AnalysisSerializer(serializers.ModelSerializer):
     def update_analysis_datasets(self, analysis, datasets, is_user):
         # get existing objects queryset
         if is_user:
-            existing = analysis.analysis_user_datasets
+            existing = analysis.analysisdatasets_set.user()
         else:
-            existing = analysis.analysis_encode_datasets
+            existing = analysis.analysisdatasets_set.encode()
 
         # delete datasets no longer found
         ids = [d['dataset'].id for d in datasets]
@@ -147,3 +149,10 @@ class FeatureListCountMatrixSerializer(serializers.ModelSerializer):
     class Meta:
         model = models.FeatureListCountMatrix
         fields = ('id', )
+
+
+class ExecutionStageSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = models.ExecutionStage
+        exclude = ('analysis', )
@@ -13,3 +13,9 @@ def trigger_download(sender, instance, created, **kwargs):
 @receiver(post_delete, sender=models.DatasetDownload)
 def trigger_delete(sender, instance, **kwargs):
     instance.delete_file()
+
+
+@receiver(post_save, sender=models.EncodeDataset)
+@receiver(post_delete, sender=models.EncodeDataset)
+def clear_encode_facet_index(sender, instance, **kwargs):
+    models.EncodeDataset.clear_facet_index()
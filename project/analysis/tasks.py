@@ -1,10 +1,14 @@
-from datetime import timedelta
+import time
+from datetime import datetime, timedelta
 from celery.utils.log import get_task_logger
 from celery.decorators import task, periodic_task
 from celery import group, chain
 from django.apps import apps
 from django.utils import timezone
 from django.core.exceptions import ObjectDoesNotExist
+from django.db.models import Max
+
+from utils import events
 
 
 logger = get_task_logger(__name__)
@@ -22,35 +26,48 @@ def raise_error():
 
 
 @task(bind=True)
-def execute_analysis(self, analysis_id, silent):
-    """Run all feature-list count matrix in parallel."""
+def execute_analysis(self, analysis_id, silent, incremental=False):
+    """
+    Run all feature-list count matrix in parallel. If `incremental`, only
+    datasets added since the previous execution are computed.
+    """
     try:
         analysis = gm('Analysis').objects.get(id=analysis_id)
     except ObjectDoesNotExist:
         return
 
-    EncodeDataset = gm('EncodeDataset')
-    ads_qs = analysis.analysisdatasets_set.all()\
-        .prefetch_related('dataset', 'dataset__encodedataset', 'dataset__userdataset')
-    task1 = group([
-        execute_count_matrix.si(
-            analysis.id,
-            ads.id,
-            isinstance(ads.dataset.subclass, EncodeDataset),
-            ads.dataset.subclass.id)
-        for ads in ads_qs
-    ])
+    ExecutionStage = gm('ExecutionStage')
+    with ExecutionStage.record(ExecutionStage.EXECUTE, analysis_id,
+                               queued=analysis.start_time):
+
+        # subclass primary keys are identical to the GenomicDataset primary key
+        ads_qs = analysis.analysisdatasets_set.with_is_encode()
+        if incremental:
+            ads_qs = ads_qs.filter(count_matrix__isnull=True)
+        queued = time.time()
+        task1 = group([
+            execute_count_matrix.si(
+                analysis.id,
+                ads.id,
+                ads.is_encode,
+                ads.dataset_id,
+                queued)
+            for ads in ads_qs
+        ])
 
-    # after completion, build combinatorial result and save
-    task2 = execute_matrix_combination.si(analysis_id, silent)
+        # after completion, build combinatorial result and save
+        task2 = execute_matrix_combination.si(analysis_id)
 
-    # chain tasks to be performed serially
-    return chain(task1, task2)()
+        # warm visualization cache and notify user
+        task3 = warm_analysis_cache.si(analysis_id, silent)
+
+        # chain tasks to be performed serially
+        return chain(task1, task2, task3)()
 
 
 @task()
-def execute_count_matrix(analysis_id, ads_id, is_encode, dataset_id):
-    """Execute each count matrix."""
+def execute_count_matrix(analysis_id, ads_id, is_encode, dataset_id, queued=None):
+    """Execute each count matrix; `queued` is a unix timestamp."""
     try:
         analysis = gm('Analysis').objects.get(id=analysis_id)
         ads = gm('AnalysisDatasets').objects.get(id=ads_id)
@@ -61,23 +78,65 @@ def execute_count_matrix(analysis_id, ads_id, is_encode, dataset_id):
     except ObjectDoesNotExist:
         return
 
+    if queued is not None:
+        queued = datetime.fromtimestamp(queued, timezone.utc)
+
     FeatureListCountMatrix = gm('FeatureListCountMatrix')
-    ads.count_matrix = FeatureListCountMatrix.execute(analysis, dataset)
-    ads.save()
+    ExecutionStage = gm('ExecutionStage')
+    ads.set_task_status(ads.STATUS_RUNNING)
+    try:
+        with ExecutionStage.record(ExecutionStage.COUNT_MATRIX, analysis_id,
+                                   queued=queued) as stage:
+            ads.count_matrix = FeatureListCountMatrix.execute(analysis, dataset)
+            stage.count_matrix = ads.count_matrix
+    except Exception:
+        ads.set_task_status(ads.STATUS_FAILED)
+        raise
+    ads.set_task_status(ads.STATUS_COMPLETE)
+    events.publish(analysis.owner_id, 'analysis-progress', id=analysis.id)
 
 
 @task()
-def execute_matrix_combination(analysis_id, silent):
+def execute_matrix_combination(analysis_id):
     """Save results from matrix combination."""
     try:
         analysis = gm('Analysis').objects.get(id=analysis_id)
     except ObjectDoesNotExist:
         return
-    analysis.output = analysis.execute_mat2mat()
+    # queued once the final count matrix completed
+    queued = analysis.analysisdatasets_set\
+        .aggregate(queued=Max('task_end_time'))['queued']
+
+    ExecutionStage = gm('ExecutionStage')
+    with ExecutionStage.record(ExecutionStage.MATRIX_COMBINATION, analysis_id,
+                               queued=queued):
+        mm = analysis.get_mat2mat()
+    with ExecutionStage.record(ExecutionStage.JSON_WRITE, analysis_id):
+        analysis.output = analysis.write_mat2mat(mm)
     analysis.end_time = timezone.now()
     analysis.save()
+    analysis.clear_cache()
+    events.publish(analysis.owner_id, 'analysis-complete', id=analysis.id)
+
+
+@task()
+def warm_analysis_cache(analysis_id, silent):
+    """Pre-compute initial visualization payloads, then send email."""
+    try:
+        analysis = gm('Analysis').objects.get(id=analysis_id)
+    except ObjectDoesNotExist:
+        return
+    ExecutionStage = gm('ExecutionStage')
+    try:
+        with ExecutionStage.record(ExecutionStage.CACHE_WARM, analysis_id,
+                                   queued=analysis.end_time):
+            analysis.warm_cache()
+    except Exception as e:
+        # a cold cache is slower, but not fatal; always notify user
+        logger.error(e, exc_info=True)
     if not silent:
-        analysis.send_completion_email()
+        with ExecutionStage.record(ExecutionStage.EMAIL, analysis_id):
+            analysis.send_completion_email()
 
 
 @task()
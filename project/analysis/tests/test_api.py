@@ -0,0 +1,427 @@
+import base64
+import json
+from datetime import datetime
+
+import numpy
+import pytest
+
+from django.db import connection
+from django.utils.timezone import now
+from django.test.utils import CaptureQueriesContext
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from myuser.models import User
+from analysis import api, models, views
+from utils import bed, events, profiling
+from utils.api import NumpyJSONRenderer, conditional_file_get, get_stream_encoding, \
+    stream_file_response
+
+
+@pytest.fixture
+def owner(db):
+    return User.objects.create_user('query-count@orio.com', 'password')
+
+
+@pytest.fixture
+def client(owner):
+    client = APIClient()
+    client.force_authenticate(user=owner)
+    return client
+
+
+@pytest.fixture
+def analyses(owner):
+    genome = models.GenomeAssembly.objects.create(
+        name='hg19',
+        chromosome_size_file='hg19.chromSizes',
+        annotation_file='hg19.gtf')
+    feature_list = models.FeatureList.objects.create(
+        owner=owner, name='features', genome_assembly=genome,
+        dataset='features.bed', validated=True)
+
+    objects = []
+    for i in range(3):
+        analysis = models.Analysis.objects.create(
+            owner=owner, name='analysis-{}'.format(i),
+            genome_assembly=genome, feature_list=feature_list)
+        for j in range(2):
+            ud = models.UserDataset.objects.create(
+                owner=owner, name='user-{}-{}'.format(i, j),
+                genome_assembly=genome, data_type='ChipSeq')
+            ed = models.EncodeDataset.objects.create(
+                name='encode-{}-{}'.format(i, j), genome_assembly=genome,
+                data_type='ChipSeq', cell_type='HeLa')
+            models.AnalysisDatasets.objects.create(
+                analysis=analysis, dataset=ud, display_name=ud.name)
+            models.AnalysisDatasets.objects.create(
+                analysis=analysis, dataset=ed, display_name=ed.name)
+        objects.append(analysis)
+    return objects
+
+
+def get_num_queries(client, url):
+    with CaptureQueriesContext(connection) as context:
+        response = client.get(url)
+    assert response.status_code == 200
+    return response, len(context.captured_queries)
+
+
+@pytest.mark.django_db
+def test_analysis_list_queries(client, analyses):
+    response, num_queries = get_num_queries(client, '/dashboard/api/analysis/')
+    # analyses, classified analysis-datasets, and datasets; independent of N
+    assert num_queries == 3
+    for row in response.data:
+        assert len(row['analysis_user_datasets']) == 2
+        assert len(row['analysis_encode_datasets']) == 2
+
+
+@pytest.mark.django_db
+def test_analysis_detail_queries(client, analyses):
+    url = '/dashboard/api/analysis/{}/'.format(analyses[0].id)
+    _, num_queries = get_num_queries(client, url)
+    assert num_queries == 3
+
+    url = '/dashboard/api/analysis/{}/is_complete/'.format(analyses[0].id)
+    _, num_queries = get_num_queries(client, url)
+    assert num_queries == 1
+
+
+@pytest.mark.django_db
+def test_analysis_form_datasets_queries(analyses):
+    with CaptureQueriesContext(connection) as context:
+        analyses[0].get_form_datasets()
+    assert len(context.captured_queries) == 1
+
+
+@pytest.mark.django_db
+def test_encode_dataset_list_queries(client, analyses):
+    # paginated count and results
+    _, num_queries = get_num_queries(client, '/dashboard/api/encode-dataset/')
+    assert num_queries == 2
+
+    _, num_queries = get_num_queries(client, '/dashboard/api/encode-dataset/?pagination=cursor')
+    assert num_queries == 1
+
+    # search results keep relevance order, with page-number pagination
+    response = client.get('/dashboard/api/encode-dataset/?pagination=cursor&search=HeLa')
+    assert response.status_code == 200
+    assert 'count' in response.data
+    response = client.get('/dashboard/api/encode-dataset/?cursor=cD0x&search=HeLa')
+    assert response.status_code == 406
+
+    # facet index is built once, then served from cache
+    models.EncodeDataset.build_facet_index()
+    _, num_queries = get_num_queries(client, '/dashboard/api/encode-dataset/field_options/')
+    assert num_queries == 1
+
+
+@pytest.mark.django_db
+def test_analysis_bulk_status_queries(client, analyses):
+    query = '&'.join('ids[]={}'.format(a.id) for a in analyses)
+    url = '/dashboard/api/analysis/bulk_status/?' + query
+    response, num_queries = get_num_queries(client, url)
+    assert num_queries == 1
+    assert len(response.data) == 3
+    for row in response.data:
+        assert row['is_running'] is False
+        assert row['datasets_total'] == 4
+        assert row['datasets_complete'] == 0
+
+
+@pytest.mark.django_db
+def test_analysis_progress(client, analyses):
+    analysis = analyses[0]
+    models.Analysis.objects.filter(id=analysis.id).update(start_time=now())
+    ads = analysis.analysisdatasets_set.first()
+    ads.set_task_status(ads.STATUS_RUNNING)
+    ads.set_task_status(ads.STATUS_COMPLETE)
+
+    url = '/dashboard/api/analysis/{}/progress/'.format(analysis.id)
+    response, _ = get_num_queries(client, url)
+    assert response.data['is_running'] is True
+    assert response.data['total'] == 4
+    assert response.data['done'] == 1
+    assert response.data['pending'] == 3
+    assert response.data['eta'] is not None
+
+
+@pytest.mark.django_db
+def test_analysis_incremental_update(analyses):
+    analysis = analyses[0]
+    ids = list(analysis.analysisdatasets_set.values_list('dataset_id', flat=True))
+    added = analyses[1].analysisdatasets_set.first().dataset_id
+
+    # incomplete analyses must be fully executed
+    assert analysis.is_incremental_update(ids + [added]) is False
+
+    models.Analysis.objects.filter(id=analysis.id).update(
+        start_time=now(), end_time=now(), output='analysis/output.json')
+    assert analysis.is_incremental_update(ids + [added]) is True
+    assert analysis.is_incremental_update(ids) is False
+    assert analysis.is_incremental_update(ids[1:] + [added]) is False
+
+    analysis.bin_size += 1
+    assert analysis.is_incremental_update(ids + [added]) is False
+
+
+@pytest.mark.django_db
+def test_analysis_timings(client, analyses):
+    analysis = analyses[0]
+    Stage = models.ExecutionStage
+    with Stage.record(Stage.EXECUTE, analysis.id, queued=now()):
+        pass
+    with pytest.raises(ValueError):
+        with Stage.record(Stage.MATRIX_COMBINATION, analysis.id):
+            raise ValueError()
+
+    url = '/dashboard/api/analysis/{}/timings/'.format(analysis.id)
+    response, _ = get_num_queries(client, url)
+    assert [d['name'] for d in response.data] == [Stage.EXECUTE, Stage.MATRIX_COMBINATION]
+    assert response.data[0]['queue_wait'] >= 0
+    assert response.data[0]['compute'] >= 0
+    assert response.data[1]['succeeded'] is False
+
+    # summary is restricted to staff
+    response = client.get('/dashboard/api/analysis/timings_summary/')
+    assert response.status_code == 403
+
+
+def test_numpy_json_renderer():
+    renderer = NumpyJSONRenderer()
+    data = {
+        'display_data': numpy.array([[1 / 3, 2.], [0., 1e-9]]),
+        'norm_val': {'max': numpy.float64(2.), 'count': numpy.int64(4)},
+        'col_names': ['a', 'b'],
+    }
+
+    rendered = json.loads(renderer.render(data).decode())
+    assert rendered['display_data'] == [[0.333333, 2.], [0., 1e-9]]
+    assert renderer.convert(data, False, 2)['display_data'][0] == [0.33, 2.]
+    assert rendered['norm_val'] == {'max': 2., 'count': 4}
+    assert rendered['col_names'] == ['a', 'b']
+
+    packed = renderer.convert(data, True, 3)['display_data']
+    assert packed['dtype'] == 'float32'
+    assert packed['shape'] == [2, 2]
+    values = numpy.frombuffer(base64.b64decode(packed['data']), dtype='<f4')
+    assert numpy.allclose(values, [1 / 3, 2., 0., 1e-9])
+
+    # integers are packed as int32 only if they fit
+    packed = renderer.pack_array(numpy.array([1, -2], dtype=numpy.int64))
+    assert packed['dtype'] == 'int32'
+    assert numpy.frombuffer(base64.b64decode(packed['data']), dtype='<i4').tolist() == [1, -2]
+    assert renderer.pack_array(numpy.array([1, 2 ** 40])) == [1, 2 ** 40]
+
+
+def test_numpy_json_renderer_float32():
+    renderer = NumpyJSONRenderer()
+    data = numpy.array([0.1, 1 / 3, -12345.678, 1.5e-7, 0.], dtype=numpy.float32)
+
+    # widened to float64, without float32 representation error
+    rendered = json.loads(renderer.render({'values': data}).decode())
+    assert rendered['values'] == [0.1, 0.333333, -12345.7, 1.5e-7, 0.]
+    assert renderer.convert(data, False, 3) == [0.1, 0.333, -12300., 1.5e-7, 0.]
+
+
+@pytest.mark.django_db
+def test_flcm_etag_includes_sort_vector(analyses):
+    analysis = analyses[0]
+    sort_vector = models.SortVector.objects.create(
+        owner=analysis.owner, name='sort', feature_list=analysis.feature_list,
+        dataset='sort.txt', validated=True)
+    analysis.sort_vector = sort_vector
+    analysis.save()
+    ads = analysis.analysisdatasets_set.first()
+    flcm = models.FeatureListCountMatrix.objects.create(
+        feature_list=analysis.feature_list, dataset=ads.dataset, matrix='fcm/test.txt')
+
+    view = api.FeatureListCountMatrixViewset()
+    view.request = Request(APIRequestFactory().get(
+        '/', {'analysis_sort': '1', 'analysis_id': analysis.id}))
+    etag, _ = view.get_conditional_validators(flcm)
+
+    # replacing sort vector contents invalidates sorted renders
+    sort_vector.save()
+    assert view.get_conditional_validators(flcm)[0] != etag
+
+
+@pytest.mark.django_db
+def test_flcm_summary_replaces_stale_sort_vector(analyses):
+    analysis = analyses[0]
+    ads = analysis.analysisdatasets_set.first()
+    flcm = models.FeatureListCountMatrix.objects.create(
+        feature_list=analysis.feature_list, dataset=ads.dataset, matrix='fcm/test.txt')
+    data = {fld: [] for fld in models.FeatureListCountMatrixSummary.SUMMARY_FIELDS}
+
+    for sort_key in ('unsorted', 'sv-1-100.0', 'sv-2-100.0', 'sv-1-200.0'):
+        models.FeatureListCountMatrixSummary.create_from_data(flcm, sort_key, data)
+
+    # only the latest version of each sort vector is kept
+    assert set(flcm.summaries.values_list('sort_key', flat=True)) == {
+        'unsorted', 'sv-2-100.0', 'sv-1-200.0'}
+
+
+@pytest.mark.django_db
+def test_flcm_sorted_render_cache_control(client, analyses):
+    analysis = analyses[0]
+    ads = analysis.analysisdatasets_set.first()
+    flcm = models.FeatureListCountMatrix.objects.create(
+        feature_list=analysis.feature_list, dataset=ads.dataset, matrix='fcm/test.txt')
+    ads.count_matrix = flcm
+    ads.save()
+
+    # an analysis sort without a sort vector is a client error
+    url = '/dashboard/api/feature-list-count-matrix/{}/sorted_render/'.format(flcm.id)
+    response = client.get(url, {
+        'analysis_sort': '1', 'analysis_id': analysis.id, 'dim_x': 10, 'dim_y': 10})
+    assert response.status_code == 400
+
+    # shared caches may store responses only for public analyses
+    view = api.FeatureListCountMatrixViewset()
+    view.request = Request(APIRequestFactory().get('/', {'analysis_id': analysis.id}))
+    assert view.is_public(flcm) is False
+    models.Analysis.objects.filter(id=analysis.id).update(public=True)
+    assert view.is_public(flcm) is True
+
+
+def test_conditional_file_get_encodings(tmpdir):
+    path = tmpdir.join('matrix.txt')
+    path.write('a\tb\n' * 100)
+
+    class View:
+        def get_object(self):
+            return None
+
+        def get_conditional_validators(self, obj):
+            return 'matrix-1', datetime(2016, 1, 1)
+
+        def is_public(self, obj):
+            return False
+
+        @conditional_file_get
+        def plot(self, request):
+            return stream_file_response(request, str(path))
+
+    factory = APIRequestFactory()
+    identity = View().plot(factory.get('/'))
+    gzipped = View().plot(factory.get('/', HTTP_ACCEPT_ENCODING='gzip'))
+    assert gzipped['Content-Encoding'] == 'gzip'
+    assert identity['ETag'] != gzipped['ETag']
+    assert 'Accept-Encoding' in identity['Vary']
+    assert 'private' in identity['Cache-Control']
+
+    # a cached identity response doesn't validate the gzip representation
+    response = View().plot(factory.get(
+        '/', HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=identity['ETag']))
+    assert response.status_code == 200
+
+    response = View().plot(factory.get(
+        '/', HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=gzipped['ETag']))
+    assert response.status_code == 304
+    assert response['ETag'] == gzipped['ETag']
+    assert 'Accept-Encoding' in response['Vary']
+
+    # gzip is refused with q=0, or accepted by wildcard
+    for header, encoding in [
+            ('gzip;q=0, deflate', None),
+            ('deflate, *;q=0.5', 'gzip'),
+            ('*, gzip;q=0', None),
+            ('GZIP; q=0.8', 'gzip')]:
+        request = factory.get('/', HTTP_ACCEPT_ENCODING=header)
+        assert get_stream_encoding(request) == encoding
+
+
+@pytest.mark.django_db
+def test_encode_dataset_search_vector(analyses):
+    genome = analyses[0].genome_assembly
+    with CaptureQueriesContext(connection) as context:
+        ed = models.EncodeDataset.objects.create(
+            name='search-test', genome_assembly=genome,
+            data_type='DnaseSeq', cell_type='K562')
+    # search vector is written with the row; no follow-up UPDATE
+    assert len([
+        q for q in context.captured_queries
+        if 'analysis_encodedataset' in q['sql']
+    ]) == 1
+
+    results = models.EncodeDataset.search(models.EncodeDataset.objects.all(), 'K562')
+    assert list(results.values_list('id', flat=True)) == [ed.id]
+
+
+@pytest.mark.django_db
+def test_encode_dataset_search_misspelled(analyses):
+    genome = analyses[0].genome_assembly
+    ed = models.EncodeDataset.objects.create(
+        name='wgEncodeBroadHistoneNhekH3k4me3', genome_assembly=genome,
+        data_type='ChipSeq', cell_type='Keratinocyte', antibody='H3K4me3',
+        extra_content={
+            'description': 'epidermal keratinocytes from a newborn foreskin, '
+                           'histone modification by chromatin immunoprecipitation',
+            'lab': 'Broad', 'protocol': 'standard', 'replicate': '1',
+        })
+    models.EncodeDataset.objects.create(
+        name='wgEncodeSydhTfbsK562Ctcf', genome_assembly=genome,
+        data_type='ChipSeq', cell_type='K562', antibody='CTCF')
+
+    # a misspelled word matches within long search text
+    qs = models.EncodeDataset.objects.filter(genome_assembly=genome)
+    results = models.EncodeDataset.search(qs, 'keratinocite')
+    assert list(results.values_list('id', flat=True)) == [ed.id]
+
+
+@pytest.mark.django_db
+def test_poll_events_redis_unavailable(client, monkeypatch):
+    class BrokenConnection:
+        def __getattr__(self, name):
+            raise ConnectionError('redis unavailable')
+
+    monkeypatch.setattr(events, 'get_connection', BrokenConnection)
+    response = client.get('/dashboard/poll-events/', {'since': 0})
+    assert response.status_code == 200
+    data = json.loads(response.content.decode())
+    assert data['events'] == []
+    assert data['retry'] == views.PollEvents.SHORT_POLL_RETRY
+
+
+@pytest.mark.django_db
+def test_profiling_redis_unavailable(client, analyses, settings, monkeypatch):
+    class BrokenConnection:
+        def __getattr__(self, name):
+            raise ConnectionError('redis unavailable')
+
+    settings.API_PROFILE_SAMPLE_RATE = 1
+    monkeypatch.setattr(profiling, 'get_connection', BrokenConnection)
+    response = client.get('/dashboard/api/analysis/{}/'.format(analyses[0].id))
+    assert response.status_code == 200
+
+
+@pytest.mark.django_db
+def test_cluster_members_padded_names(analyses, settings, tmpdir):
+    settings.MEDIA_ROOT = str(tmpdir)
+    tmpdir.mkdir('analysis')
+    analysis = analyses[2]
+
+    # unnamed features, except one; matrix scripts zero-pad generated names
+    lines = ['chr1\t{}\t{}'.format(i * 100, i * 100 + 50) for i in range(12)]
+    lines[3] += '\tgene3'
+    fn = tmpdir.join('features.bed')
+    fn.write('track name=features\n' + '\n'.join(lines) + '\n')
+    padded = bed.get_feature_name(7, len(str(bed.count_features(str(fn)))))
+    assert padded == 'feature_07'
+
+    # results written by a previous release, with padded names
+    with open(str(tmpdir.join('analysis/padded.json')), 'w') as f:
+        json.dump({
+            'fc_clusters': {'2': {'1': [padded, 'gene3'], '2': ['feature_00']}},
+            'feature_to_gene': {padded: 'GENE7', 'gene3': 'GENE3', 'feature_00': 'GENE0'},
+        }, f)
+    analysis.output = 'analysis/padded.json'
+    analysis.save()
+
+    assert list(analysis.get_cluster_members(2, 1)) == [
+        (lines[7], 'GENE7'),
+        (lines[3], 'GENE3'),
+    ]
+    assert list(analysis.get_cluster_members(2, 2)) == [(lines[0], 'GENE0')]
@@ -1,6 +1,185 @@
-from analysis import models
+import io
+import json
+import os
+
+import numpy
+import pytest
+
+from django.core.management import call_command
+
+from analysis import heatmaps, models
+from utils import bed, chromsizes
 
 
 def test_bad_urls():
     x = models.DatasetDownload.check_valid_url('http://www.kelev.biz')
     assert x[0] is False
+
+
+def test_summarize_sorted_data():
+    data = numpy.arange(40, dtype=numpy.float).reshape(10, 4)
+    summary = models.FeatureListCountMatrix.summarize_sorted_data(data)
+
+    # quartiles split like numpy.array_split: 3, 3, 2, 2 rows
+    assert len(summary['quartile_averages']) == 4
+    assert summary['quartile_averages'][0] == [4., 5., 6., 7.]
+    assert summary['bin_averages'] == [18., 19., 20., 21.]
+    assert summary['kw_results']['pvalue'] < 0.05
+    assert set(summary['ad_results'].keys()) == \
+        {'test_statistic', 'critical_values', 'pvalue'}
+
+
+@pytest.mark.django_db
+def test_encode_facet_counts():
+    genome = models.GenomeAssembly.objects.create(
+        name='hg19', chromosome_size_file='hg19.chromSizes', annotation_file='hg19.gtf')
+    rows = [
+        ('ChipSeq', 'HeLa', 'CTCF'),
+        ('ChipSeq', 'K562', 'CTCF'),
+        ('DnaseSeq', 'K562', ''),
+    ]
+    for i, (data_type, cell_type, antibody) in enumerate(rows):
+        models.EncodeDataset.objects.create(
+            name='encode-{}'.format(i), genome_assembly=genome,
+            data_type=data_type, cell_type=cell_type, antibody=antibody)
+
+    counts = models.EncodeDataset.get_facet_counts(genome.id, {'cell_type': ['K562']})
+    assert counts['total'] == 2
+
+    # a field's own selection doesn't restrict its counts
+    assert counts['fields']['cell_type'] == [
+        {'value': 'HeLa', 'count': 1},
+        {'value': 'K562', 'count': 2},
+    ]
+    assert counts['fields']['data_type'] == [
+        {'value': 'ChipSeq', 'count': 1},
+        {'value': 'DnaseSeq', 'count': 1},
+    ]
+
+    # unfiltered counts come from the cached index
+    models.EncodeDataset.clear_facet_index()
+    counts = models.EncodeDataset.get_facet_counts(genome.id, {})
+    assert counts['total'] == 3
+    assert counts['fields']['antibody'] == [
+        {'value': '', 'count': 1},
+        {'value': 'CTCF', 'count': 2},
+    ]
+    assert models.EncodeDataset.get_facet_counts(genome.id + 1, {})['total'] == 0
+
+
+def test_feature_cluster_heatmap():
+    Heatmap = models.FeatureClusterHeatmap
+
+    # serve the smallest resolution covering the request, then zoom down
+    assert Heatmap.get_resolution(800, 600) == (1000, 1000)
+    assert Heatmap.get_resolution(500, 500) == (500, 500)
+    assert Heatmap.get_resolution(100, 100) == (250, 250)
+    assert Heatmap.get_resolution(5000, 5000) == (2000, 2000)
+    assert Heatmap.get_resolution(None, 600) == (2000, 2000)
+
+    values = numpy.array([[0.1, 1 / 3], [2.5, -1e-7], [0., 123.456]])
+    heatmap = Heatmap(nrows=3, ncols=2, data=Heatmap.encode(values))
+    assert heatmap.values.dtype == numpy.float64
+    assert heatmap.values.tolist() == [[0.1, 0.3333333], [2.5, -1e-7], [0., 123.456]]
+
+    zoomed = models.Analysis.zoom_k_clust_values(numpy.ones((40, 2)), 250, 10)
+    assert zoomed.shape == (10, 2)
+
+
+def test_count_matrix_colors():
+    norm_val = dict(lower_quartile=0., median=1., upper_quartile=3.)
+    rgb = heatmaps.count_matrix_colors(numpy.array([[0., 1., 2., 3., 100.]]), norm_val)
+    assert rgb.shape == (1, 5, 3)
+    assert rgb[0, 0].tolist() == [0xfe, 0xe5, 0xd9]
+    assert rgb[0, 1].tolist() == [0xfc, 0xae, 0x91]
+    assert rgb[0, 2].tolist() == [252, 140, 110]
+    assert rgb[0, 3].tolist() == [0xfb, 0x6a, 0x4a]
+    # extrapolated beyond the upper quartile, then clipped
+    assert rgb[0, 4].tolist() == [202, 0, 0]
+
+    repeated = heatmaps.repeat_to_fit(rgb, 10, 3)
+    assert repeated.shape == (3, 10, 3)
+
+
+def test_read_bed():
+    lines = [
+        'track name=features\n',
+        '# comment\n',
+        '\n',
+        'chr1\t10\t20\n',
+        'chr1 30 40 gene1 0 -\n',
+        'chr2\t5\t6\t.\n',
+    ]
+    records = list(bed.read_bed(lines))
+    assert [r.name for r in records] == ['feature_0', 'gene1', 'feature_2']
+    assert [r.strand for r in records] == [None, '-', None]
+    assert records[1].line == 'chr1 30 40 gene1 0 -'
+
+    # zero-padded names resolve to the same index
+    assert bed.get_feature_index('feature_0002') == 2
+    assert bed.get_feature_index('gene1') is None
+    assert bed.get_feature_name(2, 4) == 'feature_0002'
+
+    chunks = list(bed.read_bed_arrays(lines, chunk_size=2))
+    assert [len(chunk) for chunk in chunks] == [2, 1]
+    assert chunks[0]['end'].tolist() == [20, 40]
+    assert chunks[1]['strand'].tolist() == ['']
+
+
+def test_chromosome_sizes(tmpdir):
+    fn = tmpdir.join('test.chromSizes')
+    fn.write('chr1\t1000\nchr2\t500\n')
+
+    sizes = chromsizes.load(str(fn))
+    assert sizes['chr2'] == 500
+    assert sizes.get_order('chr2') == 1
+    assert sizes.get_sizes(['chr2', 'chr1']).tolist() == [500, 1000]
+    assert chromsizes.load(str(fn)) is sizes
+
+    # reloaded if the file is modified
+    fn.write('chr1\t1000\nchr2\t500\nchr3\t250\n')
+    stat = os.stat(str(fn))
+    os.utime(str(fn), ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert chromsizes.load(str(fn)).as_dict() == {'chr1': 1000, 'chr2': 500, 'chr3': 250}
+
+
+@pytest.mark.django_db
+def test_load_encode_incremental(tmpdir, settings):
+    settings.ENCODE_PATH = str(tmpdir)
+    genome = models.GenomeAssembly.objects.create(
+        name='hg19', chromosome_size_file='hg19.chromSizes', annotation_file='hg19.gtf')
+    tmpdir.join('a.bigWig').write('')
+    tmpdir.join('b.bigWig').write('')
+
+    def get_dataset(name, fn, cell_type='HeLa'):
+        return {
+            'name': name, 'genome_assembly': 'hg19', 'data_type': 'ChipSeq',
+            'cell_type': cell_type, 'antibody': 'CTCF', 'rna_extract': '',
+            'treatment': '', 'phase': '', 'localization': '', 'extra_content': {},
+            'ambig_bigwig': fn,
+        }
+
+    def load(datasets):
+        fn = tmpdir.join('encode.json')
+        fn.write(json.dumps(datasets))
+        out = io.StringIO()
+        call_command('load_encode', str(fn), incremental=True, stdout=out)
+        return dict(
+            models.EncodeDataset.objects
+            .filter(genome_assembly=genome)
+            .values_list('name', 'id'))
+
+    ids = load([get_dataset('a', 'a.bigWig'), get_dataset('b', 'b.bigWig')])
+    assert set(ids) == {'a', 'b'}
+
+    # missing files keep datasets; changes and duplicates update in-place
+    tmpdir.join('b.bigWig').remove()
+    assert load([
+        get_dataset('a', 'a.bigWig', cell_type='K562'),
+        get_dataset('a', 'a.bigWig'),
+        get_dataset('b', 'b.bigWig'),
+    ]) == ids
+    assert models.EncodeDataset.objects.get(id=ids['a']).cell_type == 'K562'
+
+    # datasets not in the JSON file are removed
+    assert load([get_dataset('a', 'a.bigWig')]) == {'a': ids['a']}
@@ -33,9 +33,9 @@ urlpatterns = [
         views.Dashboard.as_view(),
         name='dashboard'),
 
-    url(r'^poll-messages/$',
-        views.ShortPollMessages.as_view(),
-        name='poll_messages'),
+    url(r'^poll-events/$',
+        views.PollEvents.as_view(),
+        name='poll_events'),
 
     url(r'^manage-data/$',
         views.ManageData.as_view(),
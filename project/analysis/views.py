@@ -1,6 +1,8 @@
+from django.conf import settings
 from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.messages import get_messages
+from django.contrib.messages.constants import DEFAULT_TAGS
 from django.core.urlresolvers import reverse_lazy
 from django.http import HttpResponseRedirect, JsonResponse
 from django.shortcuts import get_object_or_404
@@ -8,7 +10,11 @@ from django.utils.decorators import method_decorator
 from django.views.generic import TemplateView, CreateView, UpdateView, \
     DetailView, DeleteView, View
 
+from async_messages import get_messages as get_async_messages
+
 from staticpages.views import PageTemplateMixin
+from utils import events
+from utils.base import try_int
 from utils.views import UserCanEdit, UserCanView, \
     AddUserToFormMixin, MessageMixin, NeverCacheFormMixin
 from . import models, forms, tasks
@@ -34,13 +40,45 @@ class Quickstart(PageTemplateMixin, TemplateView):
     template_object_name = 'quickstart'
 
 
-class ShortPollMessages(View):
+class PollEvents(View):
+    """
+    Return messages and events published to the current user since `since`;
+    clients should poll again after `retry` milliseconds with the `last_id`
+    returned.
+
+    By default this is a short poll, returning immediately. With
+    `EVENTS_LONG_POLL`, it waits for an event (clients poll again
+    immediately); that holds a worker per open page, so it requires async
+    workers.
+    """
+    SHORT_POLL_RETRY = 10 * 1000
+
     def get(self, request, *args, **kwargs):
+        long_poll = settings.EVENTS_LONG_POLL
+        since = try_int(request.GET.get('since'), 0) or events.get_last_id()
+        msgs = [
+            {'status': m.tags, 'message': m.message}
+            for m in get_messages(request)
+        ]
+
+        evts = None
+        if request.user.is_authenticated():
+            timeout = settings.EVENTS_LONG_POLL_TIMEOUT if long_poll and not msgs else 0
+            evts = events.wait(request.user.id, since, timeout)
+
+        if evts and long_poll:
+            # messages may have been queued while waiting
+            for message, level in get_async_messages(request.user) or []:
+                msgs.append({
+                    'status': DEFAULT_TAGS.get(level, 'info'),
+                    'message': message,
+                })
+
         return JsonResponse({
-            'messages': [
-                {'status': m.tags, 'message': m.message}
-                for m in get_messages(request)
-            ]
+            'events': evts or [],
+            'messages': msgs,
+            'last_id': evts[-1]['id'] if evts else since,
+            'retry': 0 if long_poll and evts is not None else self.SHORT_POLL_RETRY,
         })
 
 
@@ -40,14 +40,32 @@ export function genomeAssemblyChange(value){
 
 
 // ---- Request new encode options
+// only fields shown in the dataset selector and its detail popup
+const ENCODE_FIELDS = [
+    'id', 'name', 'data_type', 'cell_type', 'treatment',
+    'antibody', 'phase', 'rna_extract',
+];
+
 export function requestEncodeDatasets(query){
     return (dispatch, getState) => {
         let state = getState(),
-            opts = $.param(query, false),
-            url = `${state.config.encode_dataset}?${opts}`;
-        return fetch(url, h.fetchGet)
-            .then(response => response.json())
-            .then(json => dispatch(receiveEncodeDatasets(json.results)))
+            params = _.extend({}, query, {
+                pagination: 'cursor',
+                fields: ENCODE_FIELDS.join(','),
+            }),
+            url = `${state.config.encode_dataset}?${$.param(params, false)}`,
+            datasets = [],
+            fetchPage = function(pageUrl){
+                // follow cursor links until all matching datasets are loaded
+                return fetch(pageUrl, h.fetchGet)
+                    .then(response => response.json())
+                    .then(function(json){
+                        datasets = datasets.concat(json.results);
+                        return (json.next) ? fetchPage(json.next) : datasets;
+                    });
+            };
+        return fetchPage(url)
+            .then(results => dispatch(receiveEncodeDatasets(results)))
             .catch((ex) => console.error('Encode dataset parsing failed', ex));
     };
 }
@@ -26,7 +26,9 @@ class FeatureClusteringOverview{
             float: 'right',
             'padding-top': '5px',
         }).insertAfter(this.el);
-        ReactDOM.render(<SaveAsImage content={this.el.get(0)} />, dl.get(0));
+        ReactDOM.render(<SaveAsImage
+            content={this.el.get(0)}
+            heatmapUrl={() => this.currentURL} />, dl.get(0));
     }
 
     getColors(){
@@ -198,6 +200,7 @@ class FeatureClusteringOverview{
 
         window.clustHeatmapOffest = {left: 60};
 
+        this.currentURL = url;
         $.get(url, this.renderHeatmap.bind(this, heatmap));
     }
 
@@ -12,6 +12,12 @@ import {
     displayPValue,
 } from './utils';
 
+// Matrices are fetched from the batched sorted_render route, several at a
+// time; results are kept for the page, keyed by sort settings and size,
+// so browsing neighboring matrices doesn't need further requests.
+const BATCH_SIZE = 8,
+    sortedCache = {};
+
 class IndividualHeatmap {
 
     constructor (id, matrix_names, matrix_ids, heatmap_name,
@@ -69,7 +75,9 @@ class IndividualHeatmap {
             'margin-top': '-40px',
         }).insertAfter(this.modal_body);
         this.downloadBtnContainer = el.get(0);
-        ReactDOM.render(<SaveAsImage content={this.modal_body} />, this.downloadBtnContainer);
+        ReactDOM.render(<SaveAsImage
+            content={this.modal_body}
+            heatmapUrl={() => this.currentURL} />, this.downloadBtnContainer);
     }
 
     unrender(){
@@ -526,9 +534,44 @@ class IndividualHeatmap {
                 $.param({dim_x, dim_y, analysis_sort, sort_id, analysis_id});
     }
 
+    sortedBatchURL(ids, dim_x, dim_y, analysis_sort, sort_id, analysis_id) {
+        return '/dashboard/api/feature-list-count-matrix/sorted_render_batch/?' +
+                $.param({ids, dim_x, dim_y, analysis_sort, sort_id, analysis_id});
+    }
+
+    batchIds(cache) {
+        // requested matrix first, then the following uncached matrices
+        let ids = this.matrix_ids.map((d) => parseInt(d)),
+            start = Math.max(ids.indexOf(parseInt(this.id)), 0),
+            ordered = ids.slice(start).concat(ids.slice(0, start));
+
+        return _.chain([parseInt(this.id)].concat(ordered))
+            .uniq()
+            .filter((id) => !_.has(cache, id))
+            .first(BATCH_SIZE)
+            .value();
+    }
+
+    fetchSorted(dim_x, dim_y, analysis_sort, sort_id, cb) {
+        let key = [dim_x, dim_y, analysis_sort, sort_id, this.analysis_id].join('-'),
+            cache = sortedCache[key] = sortedCache[key] || {};
+
+        if (_.has(cache, this.id)) {
+            return cb(cache[this.id]);
+        }
+
+        let url = this.sortedBatchURL(
+            this.batchIds(cache), dim_x, dim_y, analysis_sort, sort_id, this.analysis_id);
+        $.get(url, (data) => {
+            _.extend(cache, data);
+            cb(cache[this.id]);
+        });
+    }
+
     renderSorted(dim_x, dim_y, analysis_sort, sort_id) {
         var url = this.sortedURL(this.id, dim_x, dim_y, analysis_sort, sort_id, this.analysis_id),
             cb = function(data) {
+                this.currentURL = url;
                 this.loadingSpinner.fadeOut();
                 this.drawHeatmap(data.smoothed_data, data.norm_val, dim_x, dim_y);
                 this.drawHeatmapHeader(data.bin_labels);
@@ -539,7 +582,7 @@ class IndividualHeatmap {
             };
 
         this.loadingSpinner.fadeIn();
-        $.get(url, cb.bind(this));
+        this.fetchSorted(dim_x, dim_y, analysis_sort, sort_id, cb.bind(this));
     }
 }
 
@@ -8,6 +8,7 @@ class SaveAsImage extends React.Component {
         super();
         this.handlePngSubmit = this.handlePngSubmit.bind(this);
         this.handlePdfSubmit = this.handlePdfSubmit.bind(this);
+        this.handleHeatmapDownload = this.handleHeatmapDownload.bind(this);
     }
 
     getJqueryElement(){
@@ -35,13 +36,30 @@ class SaveAsImage extends React.Component {
         this.refs.width.value = parseInt($clone.width() * 1.08);
         this.refs.height.value = parseInt($clone.height() * 1.08);
         this.refs.format.value = type;
-        this.refs.form.submit();
+        $.post(this.refs.form.action, $(this.refs.form).serialize())
+            .done((d) => this.pollRasterize(d.status_url, d.download_url))
+            .fail(() => console.error('Image rendering could not be queued'));
 
         $clone.remove();
 
         return false;
     }
 
+    pollRasterize(statusUrl, downloadUrl){
+        // images are rendered by a background task; download when complete
+        $.get(statusUrl)
+            .done((d) => {
+                if (d.status === 'complete'){
+                    window.location.href = downloadUrl;
+                } else if (d.status === 'pending'){
+                    window.setTimeout(() => this.pollRasterize(statusUrl, downloadUrl), 1000);
+                } else {
+                    console.error('Image rendering failed');
+                }
+            })
+            .fail(() => console.error('Image rendering failed'));
+    }
+
     handlePngSubmit(e){
         this.handleSubmit(e, 'png');
     }
@@ -50,6 +68,24 @@ class SaveAsImage extends React.Component {
         this.handleSubmit(e, 'pdf');
     }
 
+    handleHeatmapDownload(e){
+        // heatmap rendered server-side from data, without a browser
+        e.preventDefault();
+        let url = this.props.heatmapUrl();
+        if (url){
+            window.location.href = url + '&image=png&download=1';
+        }
+        return false;
+    }
+
+    renderHeatmapOption(){
+        if (!this.props.heatmapUrl){
+            return null;
+        }
+        return <li><a href='#' onClick={this.handleHeatmapDownload}>
+            <i className='fa fa-fixed fa-th'></i> Heatmap PNG</a></li>;
+    }
+
     render(){
         let classType = (this.props.dropup)? 'btn-group dropup': 'btn-group';
         return <div>
@@ -73,6 +109,7 @@ class SaveAsImage extends React.Component {
                         <i className='fa fa-fixed fa-file-image-o'></i> PNG</a></li>
                     <li><a href='#' onClick={this.handlePdfSubmit}>
                         <i className='fa fa-fixed fa-file-pdf-o'></i> PDF</a></li>
+                    {this.renderHeatmapOption()}
                 </ul>
             </div>
         </div>;
@@ -83,6 +120,7 @@ SaveAsImage.propTypes = {
     content: React.PropTypes.instanceOf(window.HTMLElement),
     selector: React.PropTypes.string,
     dropup: React.PropTypes.bool,
+    heatmapUrl: React.PropTypes.func,
 };
 
 export default SaveAsImage;
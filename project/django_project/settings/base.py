@@ -97,6 +97,7 @@ INSTALLED_APPS = (
     'django.contrib.admin',
     'django.contrib.humanize',
     'django.contrib.sitemaps',
+    'django.contrib.postgres',
     # External apps
     'crispy_forms',
     'rest_framework',
@@ -192,6 +193,14 @@ CACHES = {
     }
 }
 
+# Fraction of analysis API requests to profile; see utils.profiling
+API_PROFILE_SAMPLE_RATE = float(os.getenv('API_PROFILE_SAMPLE_RATE', 0))
+
+# Hold event polls open until an event arrives (see analysis.views.PollEvents);
+# each poll occupies a worker, so only enable with async (e.g. gevent) workers.
+EVENTS_LONG_POLL = os.getenv('EVENTS_LONG_POLL', 'False') == 'True'
+EVENTS_LONG_POLL_TIMEOUT = 25  # seconds
+
 # Celery settings
 CELERYD_HIJACK_ROOT_LOGGER = False
 BROKER_URL = 'redis://localhost:6379'
@@ -219,3 +228,6 @@ WEBPACK_LOADER = {
 
 # assume phantomJS is available on PATH; else change to absolute location
 PHANTOMJS_PATH = 'phantomjs'
+PHANTOMJS_WORKERS = int(os.getenv('PHANTOMJS_WORKERS', 2))
+PHANTOMJS_TIMEOUT = 60  # seconds, per job
+PHANTOMJS_MAX_JOBS = 100  # renders before a process is replaced
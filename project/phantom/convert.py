@@ -1,11 +1,11 @@
 import logging
 import os
-import subprocess
 import tempfile
 
-from django.conf import settings
 from django.template.loader import render_to_string
 
+from .pool import get_pool
+
 __all__ = ('Converter', )
 
 
@@ -43,27 +43,17 @@ class Converter:
         self.tempfiles = TempFileList()
 
     def _to_html(self):
-        # return rendered html absolute filepath
-        fn = self.tempfiles.get_tempfile(suffix='.html')
-        html = render_to_string('phantom/base.html', dict(
+        return render_to_string('phantom/base.html', dict(
             static_path=self.static_path,
             content=self.html,
         ))
-        with open(fn, 'w') as f:
-            f.write(html)
-        return fn
 
     def _rasterize(self, output_fn):
-        rasterize = os.path.join(
-            settings.PROJECT_PATH,
-            'phantom/js/rasterize.js')
-        html_fn = self._to_html()
-        commands = [
-            settings.PHANTOMJS_PATH, rasterize,
-            html_fn, output_fn,
-            str(self.width), str(self.height)
-        ]
-        subprocess.call(commands)
+        # rendered by a warm process from the shared pool, which bounds
+        # the number of concurrent PhantomJS processes
+        get_pool().render(
+            self._to_html(), self.static_path, output_fn,
+            self.width, self.height)
 
     def convert(self):
         content = None
@@ -0,0 +1,84 @@
+"use strict";
+// Long-lived renderer; reads one JSON job per line from stdin and writes one
+// JSON result per line to stdout, prefixed so that other console output
+// can be ignored. Jobs are processed serially.
+var webpage = require('webpage'),
+    system = require('system'),
+    renderTimeout = 3000,
+    resultPrefix = 'ORIO-RESULT ';
+
+var respond = function(id, status, message){
+        system.stdout.writeLine(resultPrefix + JSON.stringify({
+            id: id,
+            status: status,
+            message: message || '',
+        }));
+        system.stdout.flush();
+    },
+    render = function(job, done){
+        var page = webpage.create(),
+            finish = function(status, message){
+                page.close();
+                respond(job.id, status, message);
+                done();
+            },
+            renderPage = function(){
+                if (job.output.substr(-4) !== '.pdf') {
+                    page.zoomFactor = 1;
+                }
+                // Wait for animations, after viewport size change
+                window.setTimeout(function(){
+                    page.render(job.output);
+                    finish('ok');
+                }, renderTimeout);
+            },
+            checkReadyState = function() {
+                // continue to check until ready-state is complete
+                setTimeout(function () {
+                    var readyState = page.evaluate(function () {
+                        return document.readyState;
+                    });
+                    if (readyState === 'complete') {
+                        window.setTimeout(renderPage, renderTimeout);
+                    } else {
+                        checkReadyState();
+                    }
+                });
+            };
+
+        page.viewportSize = {
+            width: job.width,
+            height: job.height,
+        };
+        page.onLoadFinished = function(status){
+            // page loaded but other resources may not be complete
+            page.onLoadFinished = null;
+            if (status === 'success') {
+                checkReadyState();
+            } else {
+                finish('error', 'Unable to load content');
+            }
+        };
+        page.setContent(job.content, job.base_url);
+    },
+    next = function(){
+        // blocks until a job is available; only called when idle
+        var line = system.stdin.readLine(),
+            job;
+        if (line === null || (line === '' && system.stdin.atEnd())) {
+            phantom.exit();
+            return;
+        }
+        try {
+            job = JSON.parse(line);
+        } catch (e) {
+            respond(null, 'error', 'Invalid job');
+            window.setTimeout(next, 0);
+            return;
+        }
+        render(job, function(){
+            window.setTimeout(next, 0);
+        });
+    };
+
+next();
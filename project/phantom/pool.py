@@ -0,0 +1,175 @@
+import atexit
+import itertools
+import json
+import logging
+import os
+import queue
+import select
+import subprocess
+import threading
+import time
+
+from django.conf import settings
+
+
+__all__ = ('RenderError', 'get_pool')
+
+
+logger = logging.getLogger(__name__)
+
+RESULT_PREFIX = b'ORIO-RESULT '
+
+
+class RenderError(Exception):
+    pass
+
+
+class RendererProcess:
+    """
+    A long-lived PhantomJS process which renders jobs sent over stdin.
+
+    Jobs are processed one at a time; see `js/server.js` for the protocol.
+    """
+
+    def __init__(self, command=None):
+        if command is None:
+            script = os.path.join(settings.PROJECT_PATH, 'phantom/js/server.js')
+            command = [settings.PHANTOMJS_PATH, script]
+        self.proc = subprocess.Popen(
+            command,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL)
+        self.jobs = 0
+        self._buffer = b''
+
+    def is_alive(self):
+        return self.proc.poll() is None
+
+    def _readline(self, deadline):
+        # read a line from stdout; raise RenderError if deadline is reached
+        fd = self.proc.stdout.fileno()
+        while b'\n' not in self._buffer:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise RenderError('Render timed out')
+            ready, _, _ = select.select([fd], [], [], remaining)
+            if not ready:
+                continue
+            data = os.read(fd, 4096)
+            if not data:
+                raise RenderError('Renderer exited unexpectedly')
+            self._buffer += data
+        line, self._buffer = self._buffer.split(b'\n', 1)
+        return line
+
+    def render(self, job, timeout):
+        self.jobs += 1
+        try:
+            self.proc.stdin.write(json.dumps(job).encode() + b'\n')
+            self.proc.stdin.flush()
+        except OSError as e:
+            # includes BrokenPipeError, if the process has exited
+            raise RenderError('Renderer unavailable: {}'.format(e)) from e
+
+        deadline = time.monotonic() + timeout
+        while True:
+            line = self._readline(deadline)
+            if not line.startswith(RESULT_PREFIX):
+                continue  # page console output
+            result = json.loads(line[len(RESULT_PREFIX):].decode())
+            if result['id'] == job['id']:
+                return result
+
+    def close(self):
+        if self.is_alive():
+            self.proc.kill()
+        self.proc.wait()
+
+
+class RendererPool:
+    """
+    Bounded pool of warm renderer processes.
+
+    At most `size` processes exist; callers wait for an idle process, and
+    each job has a timeout after which its process is killed. Processes are
+    started on demand and replaced after `max_jobs` renders. `command`
+    overrides the PhantomJS command line of each process.
+    """
+
+    def __init__(self, size, max_jobs, timeout, command=None):
+        self.max_jobs = max_jobs
+        self.timeout = timeout
+        self.command = command
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+
+    def _acquire(self):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise RenderError('No renderer available')
+        try:
+            process = self._idle.get_nowait()
+        except queue.Empty:
+            process = None
+        if process is None or not process.is_alive():
+            try:
+                process = RendererProcess(self.command)
+            except Exception:
+                self._slots.release()
+                raise
+        return process
+
+    def _release(self, process, healthy):
+        if healthy and process.jobs < self.max_jobs:
+            self._idle.put(process)
+        else:
+            process.close()
+        self._slots.release()
+
+    def render(self, content, base_url, output, width, height):
+        with self._lock:
+            job_id = next(self._ids)
+        job = dict(
+            id=job_id,
+            content=content,
+            base_url=base_url,
+            output=output,
+            width=width,
+            height=height,
+        )
+        process = self._acquire()
+        healthy = False
+        try:
+            result = process.render(job, self.timeout)
+            healthy = True
+        finally:
+            # a timed out or failed process may be in an unknown state
+            self._release(process, healthy)
+
+        if result['status'] != 'ok':
+            raise RenderError(result['message'])
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = RendererPool(
+                size=settings.PHANTOMJS_WORKERS,
+                max_jobs=settings.PHANTOMJS_MAX_JOBS,
+                timeout=settings.PHANTOMJS_TIMEOUT)
+            atexit.register(_pool.close)
+    return _pool
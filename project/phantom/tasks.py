@@ -0,0 +1,32 @@
+from celery.decorators import task
+from django.core.cache import cache
+
+from .convert import Converter
+
+
+RESULT_TTL = 600  # seconds a rendered image is available for download
+
+
+def get_result_key(job_id):
+    return 'phantom-rasterize-{}'.format(job_id)
+
+
+def set_result(job_id, status, format_=None, content=None):
+    cache.set(get_result_key(job_id), {
+        'status': status,
+        'format': format_,
+        'content': content,
+    }, RESULT_TTL)
+
+
+def get_result(job_id):
+    # return dict of status, format, and content; or None if expired/unknown
+    return cache.get(get_result_key(job_id))
+
+
+@task()
+def rasterize(job_id, static_path, format_, html, width, height):
+    """Render an image and store it for download; see `get_result`."""
+    content = Converter(static_path, format_, html, width, height).convert()
+    status = 'failed' if content is None else 'complete'
+    set_result(job_id, status, format_, content)
@@ -0,0 +1,90 @@
+import sys
+import textwrap
+
+import pytest
+
+from phantom.pool import RendererPool, RendererProcess, RenderError
+
+
+# stands in for js/server.js: one JSON job per stdin line; writes its pid to
+# the output file, sleeps if the content is "sleep", and exits on "exit".
+STUB_SERVER = textwrap.dedent("""
+    import json, os, sys, time
+    for line in sys.stdin:
+        job = json.loads(line)
+        if job['content'] == 'exit':
+            sys.exit(0)
+        if job['content'] == 'sleep':
+            time.sleep(10)
+        with open(job['output'], 'w') as f:
+            f.write(str(os.getpid()))
+        print('console output from page')
+        status = 'error' if job['content'] == 'error' else 'ok'
+        print('ORIO-RESULT ' + json.dumps(
+            {'id': job['id'], 'status': status, 'message': 'failed'}))
+        sys.stdout.flush()
+""")
+
+
+@pytest.fixture
+def command(tmpdir):
+    script = tmpdir.join('server.py')
+    script.write(STUB_SERVER)
+    return [sys.executable, str(script)]
+
+
+def render(pool, tmpdir, content='<p></p>'):
+    # return pid of the process which rendered the job
+    output = tmpdir.join('output.png')
+    pool.render(content, 'http://localhost/static/', str(output), 400, 300)
+    return int(output.read())
+
+
+def test_render_protocol(command, tmpdir):
+    pool = RendererPool(size=1, max_jobs=10, timeout=10, command=command)
+    try:
+        pid = render(pool, tmpdir)
+        # warm process is reused; console output is ignored
+        assert render(pool, tmpdir) == pid
+        with pytest.raises(RenderError):
+            render(pool, tmpdir, 'error')
+        assert render(pool, tmpdir) == pid
+    finally:
+        pool.close()
+
+
+def test_render_timeout(command, tmpdir):
+    pool = RendererPool(size=1, max_jobs=10, timeout=0.5, command=command)
+    try:
+        pid = render(pool, tmpdir)
+        process = pool._idle.queue[0]
+        with pytest.raises(RenderError):
+            render(pool, tmpdir, 'sleep')
+        # timed-out process is killed and replaced
+        assert not process.is_alive()
+        assert render(pool, tmpdir) != pid
+    finally:
+        pool.close()
+
+
+def test_recycle_after_max_jobs(command, tmpdir):
+    pool = RendererPool(size=1, max_jobs=2, timeout=10, command=command)
+    try:
+        pids = [render(pool, tmpdir) for _ in range(5)]
+        assert pids[0] == pids[1]
+        assert pids[2] == pids[3]
+        assert len(set(pids)) == 3
+    finally:
+        pool.close()
+
+
+def test_exited_process(command):
+    process = RendererProcess(command)
+    with pytest.raises(RenderError):
+        process.render(dict(id=0, content='exit', output='-'), timeout=10)
+    process.proc.wait()
+
+    # writing to a closed pipe is reported as a render error
+    with pytest.raises(RenderError):
+        process.render(dict(id=1, content='<p></p>', output='-'), timeout=10)
+    process.close()
@@ -9,4 +9,12 @@ urlpatterns = [
         views.Rasterize.as_view(),
         name='rasterize'),
 
+    url(r'^rasterize/(?P<job_id>[0-9a-f]{32})/$',
+        views.RasterizeStatus.as_view(),
+        name='rasterize_status'),
+
+    url(r'^rasterize/(?P<job_id>[0-9a-f]{32})/download/$',
+        views.RasterizeDownload.as_view(),
+        name='rasterize_download'),
+
 ]
@@ -1,18 +1,24 @@
 import json
+import uuid
 
-from django.views.generic import FormView
+from django.views.generic import FormView, View
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 from django.shortcuts import HttpResponse
 from django.conf import settings
-from django.http import HttpResponseBadRequest
+from django.core.urlresolvers import reverse
+from django.http import HttpResponseBadRequest, JsonResponse, Http404
 
-from .convert import Converter
 from .forms import RasterizeForm
+from . import tasks
 
 
 @method_decorator(csrf_exempt, name='dispatch')
 class Rasterize(FormView):
+    """
+    Queue a rasterization job; returns 202 with URLs to poll the job status
+    and to download the result once complete.
+    """
 
     http_method_names = ('post', )
     form_class = RasterizeForm
@@ -27,11 +33,36 @@ class Rasterize(FormView):
         protocol = 'https' if self.request.is_secure() else 'http'
         static_path = '{}://{}{}'.format(
             protocol, self.request.META['HTTP_HOST'], settings.STATIC_URL)
-        converter = Converter(
-            static_path, format_, data['content'],
+
+        job_id = uuid.uuid4().hex
+        tasks.set_result(job_id, 'pending')
+        tasks.rasterize.delay(
+            job_id, static_path, format_, data['content'],
             data['width'], data['height'])
-        image = converter.convert()
 
-        response = HttpResponse(image, content_type='application/{}'.format(format_))
+        return JsonResponse({
+            'status_url': reverse('phantom:rasterize_status', args=[job_id]),
+            'download_url': reverse('phantom:rasterize_download', args=[job_id]),
+        }, status=202)
+
+
+class RasterizeStatus(View):
+
+    def get(self, request, job_id):
+        result = tasks.get_result(job_id)
+        if result is None:
+            raise Http404()
+        return JsonResponse({'status': result['status']})
+
+
+class RasterizeDownload(View):
+
+    def get(self, request, job_id):
+        result = tasks.get_result(job_id)
+        if result is None or result['status'] != 'complete':
+            raise Http404()
+        format_ = result['format']
+        response = HttpResponse(
+            result['content'], content_type='application/{}'.format(format_))
         response['Content-Disposition'] = 'attachment; filename="download.{}"'.format(format_)
         return response
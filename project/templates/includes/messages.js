@@ -13,14 +13,23 @@
         toastr["{{message.tags}}"]("{{ message|safe }}");
     {% endfor %}
 
-    window.setInterval(function(){
-        $.get('{% url "analysis:poll_messages" %}', function(d){
+    // poll for messages and events; each event is re-triggered as an
+    // `orio:event` on the document, for pages to handle.
+    var pollEvents = function(since){
+        $.get('{% url "analysis:poll_events" %}', {since: since}, function(d){
             if(d.messages.length>0){
                 toastr.clear();
             }
             d.messages.forEach(function(resp){
                 toastr[resp.status](resp.message);
             });
+            d.events.forEach(function(ev){
+                $(document).trigger('orio:event', ev);
+            });
+            window.setTimeout(function(){pollEvents(d.last_id);}, d.retry);
+        }).fail(function(){
+            window.setTimeout(function(){pollEvents(since);}, 60000);
         });
-    }, 60000);
+    };
+    pollEvents(0);
 </script>
@@ -1,6 +1,21 @@
+import base64
 import json
+import os
+import re
+import zlib
+from calendar import timegm
+from functools import wraps
+
+import numpy
+from django.http import StreamingHttpResponse, HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
 from rest_framework import authentication, permissions, pagination
 from rest_framework import renderers
+from rest_framework.exceptions import NotAcceptable
+
+from . import profiling
+from .base import round_significant
 
 
 class StandardResultsSetPagination(pagination.PageNumberPagination):
@@ -13,6 +28,65 @@ class NoPagination(pagination.PageNumberPagination):
     page_size = None
 
 
+class CursorResultsSetPagination(pagination.CursorPagination):
+    page_size = 500
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    ordering = 'id'
+
+
+class OptionalCursorPaginationMixin:
+    """
+    Use keyset (cursor) pagination if requested with `?pagination=cursor`.
+
+    Cursor pagination imposes its own ordering, so it is not used when any
+    of `relevance_params` are given (e.g. free-text search, ordered by
+    relevance); page-number pagination is used instead, and a `cursor`
+    token is rejected.
+    """
+
+    cursor_pagination_class = CursorResultsSetPagination
+    relevance_params = ('search', )
+
+    def use_cursor_pagination(self):
+        params = self.request.query_params
+        requested = params.get('pagination') == 'cursor' or 'cursor' in params
+        if requested and any(params.get(p, '').strip() for p in self.relevance_params):
+            if 'cursor' in params:
+                raise NotAcceptable('`cursor` cannot be combined with `{}`'.format(
+                    '`, `'.join(self.relevance_params)))
+            return False
+        return requested
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            if self.use_cursor_pagination():
+                self._paginator = self.cursor_pagination_class()
+            else:
+                return super().paginator
+        return self._paginator
+
+
+class SparseFieldsMixin:
+    """Serializer which can be restricted to a subset of its fields."""
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        if fields:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+def get_sparse_fields(request):
+    # return list of fields requested with `?fields=a,b,c`, or None
+    fields = request.query_params.get('fields')
+    if not fields:
+        return None
+    return [fld.strip() for fld in fields.split(',') if fld.strip()]
+
+
 class SiteMixin:
     """Sitewide default authentication, permissions, filtering, and pagination."""
 
@@ -50,3 +124,310 @@ class PlainTextRenderer(renderers.BaseRenderer):
         if isinstance(data, dict):
             return json.dumps(data)
         return data.encode(self.charset)
+
+
+class NumpyJSONRenderer(renderers.JSONRenderer):
+    """
+    JSON renderer which serializes NumPy arrays in bulk.
+
+    Float arrays are rounded to a number of significant digits
+    (`?precision=<n>`, default FLOAT_PRECISION) before conversion, which
+    considerably reduces response size; small values keep their precision.
+    With `?array_encoding=base64`, each array is instead packed as a
+    little-endian typed array:
+
+        {"dtype": "float32", "shape": [rows, cols], "data": "<base64>"}
+
+    which can be read client-side with `new Float32Array(buffer)`. Integer
+    arrays with values outside the 32-bit range are left as lists.
+    """
+    FLOAT_PRECISION = 6
+    MAX_PRECISION = 15
+    PACKED_DTYPES = (
+        ('f', '<f4', 'float32'),
+        ('i', '<i4', 'int32'),
+        ('u', '<u4', 'uint32'),
+        ('b', '<u1', 'uint8'),
+    )
+
+    def get_options(self, renderer_context):
+        # return (packed: bool, precision: int) from request query parameters
+        request = (renderer_context or {}).get('request')
+        if request is None:
+            return False, self.FLOAT_PRECISION
+        params = request.query_params
+        packed = params.get('array_encoding') == 'base64'
+        try:
+            precision = int(params.get('precision', self.FLOAT_PRECISION))
+        except ValueError:
+            precision = self.FLOAT_PRECISION
+        return packed, min(max(precision, 1), self.MAX_PRECISION)
+
+    def pack_array(self, arr):
+        for kind, dtype, name in self.PACKED_DTYPES:
+            if arr.dtype.kind == kind:
+                if kind in 'iu' and arr.size:
+                    info = numpy.iinfo(dtype)
+                    if arr.min() < info.min or arr.max() > info.max:
+                        return arr.tolist()
+                data = numpy.ascontiguousarray(arr, dtype=dtype)
+                return {
+                    'dtype': name,
+                    'shape': list(arr.shape),
+                    'data': base64.b64encode(data.tobytes()).decode('ascii'),
+                }
+        return arr.tolist()
+
+    def convert(self, data, packed, precision):
+        # replace arrays in nested containers with JSON-serializable values
+        if isinstance(data, numpy.ndarray):
+            if packed:
+                return self.pack_array(data)
+            if data.dtype.kind == 'f':
+                return round_significant(data, precision).tolist()
+            return data.tolist()
+        if isinstance(data, dict):
+            return {
+                key: self.convert(value, packed, precision)
+                for key, value in data.items()
+            }
+        if isinstance(data, (list, tuple)):
+            return [self.convert(value, packed, precision) for value in data]
+        if isinstance(data, numpy.generic):
+            return data.item()
+        return data
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        packed, precision = self.get_options(renderer_context)
+        data = self.convert(data, packed, precision)
+        return super().render(data, accepted_media_type, renderer_context)
+
+
+class ProfilingMixin:
+    """Sampled request profiling of all routes on a viewset; opt-in."""
+
+    def dispatch(self, request, *args, **kwargs):
+        if not profiling.should_sample():
+            return super().dispatch(request, *args, **kwargs)
+
+        with profiling.profile_request() as profile:
+            with profiling.phase('view'):
+                response = super().dispatch(request, *args, **kwargs)
+
+            # rendering is normally deferred until after the view returns
+            if hasattr(response, 'render') and not response.is_rendered:
+                with profiling.phase('render'):
+                    response.render()
+
+            profile.route = '{}.{}'.format(
+                self.__class__.__name__,
+                getattr(self, 'action', None) or request.method.lower())
+            if not response.streaming:
+                profile.bytes = len(response.content)
+            elif response.has_header('Content-Length'):
+                profile.bytes = int(response['Content-Length'])
+
+        return response
+
+
+class ConditionalGetMixin:
+    """Cache the requested object so conditional routes only fetch it once."""
+
+    def get_object(self):
+        if not hasattr(self, '_object'):
+            self._object = super().get_object()
+        return self._object
+
+    def get_conditional_validators(self, obj):
+        # return tuple (etag: str, last_modified: datetime), or (None, None)
+        # if the object may still change and shouldn't be cached.
+        return obj.get_conditional_validators()
+
+    def is_public(self, obj):
+        # responses for public objects may be stored by shared (proxy) caches
+        return bool(getattr(obj, 'public', False))
+
+
+def _conditional(func, get_content_encoding=None):
+    @wraps(func)
+    def wrapper(self, request, *args, **kwargs):
+        obj = self.get_object()
+        etag, last_modified = self.get_conditional_validators(obj)
+        if etag is None:
+            return func(self, request, *args, **kwargs)
+
+        # each content-encoding of a representation needs a distinct ETag
+        encoding = get_content_encoding(request) if get_content_encoding else None
+        if encoding == 'gzip':
+            etag = '%s-gz' % etag
+
+        etag = quote_etag(etag)
+        timestamp = timegm(last_modified.utctimetuple())
+        response = get_conditional_response(
+            request, etag=etag, last_modified=timestamp)
+        if response is None:
+            response = func(self, request, *args, **kwargs)
+
+        if response.status_code in (200, 206, 304):
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(timestamp)
+            visibility = 'public' if self.is_public(obj) else 'private'
+            patch_cache_control(response, must_revalidate=True, max_age=0, **{visibility: True})
+        if get_content_encoding:
+            patch_vary_headers(response, ('Accept-Encoding', ))
+        return response
+
+    return wrapper
+
+
+def conditional_get(func):
+    """
+    Support conditional GET requests (ETag/Last-Modified) on a detail route.
+
+    If the client already has the current version of an immutable object,
+    return 304 Not Modified without computing the response payload.
+    Requires the viewset to inherit `ConditionalGetMixin`.
+    """
+    return _conditional(func)
+
+
+def conditional_file_get(func):
+    """
+    As `conditional_get`, for routes returning `stream_file_response`; the
+    gzip-encoded representation is given a `-gz` suffixed ETag.
+    """
+    return _conditional(func, get_stream_encoding)
+
+
+def wants_image(request):
+    # native raster requested with `?image=png`
+    return request.GET.get('image') == 'png'
+
+
+def png_response(request, content, filename='heatmap.png'):
+    """PNG response; an attachment if requested with `?download=1`."""
+    response = HttpResponse(content, content_type='image/png')
+    if request.GET.get('download') == '1':
+        response['Content-Disposition'] = 'attachment; filename="{}"'.format(filename)
+    return response
+
+
+STREAM_CHUNK = 64 * 1024
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def _read_chunks(path, start=0, length=None):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = length
+        while remaining is None or remaining > 0:
+            size = STREAM_CHUNK if remaining is None else min(STREAM_CHUNK, remaining)
+            chunk = f.read(size)
+            if not chunk:
+                break
+            if remaining is not None:
+                remaining -= len(chunk)
+            yield chunk
+
+
+def _gzip_chunks(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def _is_range_request(request):
+    # single byte-range requested, which may still be unsatisfiable
+    match = RANGE_RE.match(request.META.get('HTTP_RANGE', '').strip())
+    return match is not None and any(match.groups())
+
+
+def _parse_range(header, filesize):
+    # return (start, end) inclusive for a single byte-range, False if the
+    # range is unsatisfiable, or None if missing or unsupported.
+    match = RANGE_RE.match(header.strip())
+    if match is None:
+        return None
+    start, end = match.groups()
+    if start == '' and end == '':
+        return None
+    if start == '':
+        suffix = int(end)
+        if suffix == 0:
+            return False
+        return max(filesize - suffix, 0), filesize - 1
+    start = int(start)
+    end = filesize - 1 if end == '' else min(int(end), filesize - 1)
+    if start > end:
+        return False
+    return start, end
+
+
+def _get_encoding_quality(header, encoding):
+    # q-value for `encoding` in an Accept-Encoding header; 0 if not accepted
+    wildcard = 0.
+    for item in header.split(','):
+        parts = item.split(';')
+        coding = parts[0].strip().lower()
+        quality = 1.
+        for param in parts[1:]:
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.
+        if coding == encoding:
+            return quality
+        if coding == '*':
+            wildcard = quality
+    return wildcard
+
+
+def get_stream_encoding(request):
+    """Return the content-encoding `stream_file_response` will use, or None."""
+    if _is_range_request(request):
+        return None
+    if _get_encoding_quality(request.META.get('HTTP_ACCEPT_ENCODING', ''), 'gzip') > 0:
+        return 'gzip'
+    return None
+
+
+def stream_file_response(request, path, content_type='text/plain'):
+    """
+    Stream a file from disk in chunks, without reading it into memory.
+
+    Supports single byte-range requests (uncompressed), and otherwise uses
+    gzip content-encoding if the client accepts it.
+    """
+    filesize = os.path.getsize(path)
+
+    byte_range = None
+    if _is_range_request(request):
+        byte_range = _parse_range(request.META['HTTP_RANGE'], filesize)
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = 'bytes */%d' % filesize
+        return response
+
+    if byte_range:
+        start, end = byte_range
+        length = end - start + 1
+        response = StreamingHttpResponse(
+            _read_chunks(path, start, length), status=206, content_type=content_type)
+        response['Content-Range'] = 'bytes %d-%d/%d' % (start, end, filesize)
+        response['Content-Length'] = str(length)
+    elif get_stream_encoding(request) == 'gzip':
+        response = StreamingHttpResponse(
+            _gzip_chunks(_read_chunks(path)), content_type=content_type)
+        response['Content-Encoding'] = 'gzip'
+    else:
+        response = StreamingHttpResponse(_read_chunks(path), content_type=content_type)
+        response['Content-Length'] = str(filesize)
+
+    response['Accept-Ranges'] = 'bytes'
+    patch_vary_headers(response, ('Accept-Encoding', ))
+    return response
@@ -1,3 +1,8 @@
+import math
+
+import numpy
+
+
 def try_int(val, default=None):
     """Return int or default value."""
     try:
@@ -8,3 +13,33 @@ def try_int(val, default=None):
 
 def is_none(val):
     return val is None
+
+
+def finite_or_none(val):
+    """Return float value, or None if NaN or infinite (not valid JSON)."""
+    val = float(val)
+    return val if math.isfinite(val) else None
+
+
+def round_significant(arr, digits):
+    """
+    Round array values to a number of significant digits, as float64.
+
+    float32 values are widened first, so rounded values serialize as their
+    shortest decimal form. Zero and non-finite values are unchanged.
+    """
+    arr = numpy.asarray(arr, dtype=numpy.float64)
+    nonzero = numpy.isfinite(arr) & (arr != 0)
+    exponent = numpy.zeros(arr.shape)
+    exponent[nonzero] = numpy.floor(numpy.log10(numpy.abs(arr[nonzero])))
+    shift = digits - 1 - exponent
+
+    # scale by exact powers of ten, multiplying or dividing as required
+    rounded = arr.copy()
+    up = nonzero & (shift >= 0)
+    down = nonzero & (shift < 0)
+    scale = 10. ** shift[up]
+    rounded[up] = numpy.round(arr[up] * scale) / scale
+    scale = 10. ** -shift[down]
+    rounded[down] = numpy.round(arr[down] / scale) * scale
+    return rounded
@@ -0,0 +1,119 @@
+"""
+Streaming BED file reader.
+
+Lines are split once, and records are yielded as the file is read. Features
+without a name are given a deterministic name from their index in the file
+(`feature_<index>`), so the file doesn't need to be counted first. Generated
+names from the zero-padded scheme used by matrix scripts (`feature_00012`)
+are resolved to the same index by `get_feature_index`.
+
+This module has no Django dependencies, so it can be used from scripts.
+"""
+import re
+from collections import namedtuple
+
+import numpy
+
+
+FEATURE_PREFIX = 'feature'
+HEADER_WORDS = ('track', 'browser')
+
+# name column values which indicate that a feature is unnamed
+DUMMY_NAMES = ('.', )
+
+# rows per structured array yielded by `read_bed_arrays`
+CHUNK_SIZE = 100000
+
+BedRecord = namedtuple('BedRecord', (
+    'index', 'chrom', 'start', 'end', 'name', 'strand', 'num_fields', 'line'))
+
+_generated_name = re.compile(r'^{}_(\d+)$'.format(FEATURE_PREFIX))
+
+
+def is_header(line):
+    """Return True if a line is blank, a comment, or a track/browser line."""
+    stripped = line.lstrip()
+    if not stripped or stripped[0] == '#':
+        return True
+    word = stripped[:8].split(None, 1)[0].lower()
+    return word in HEADER_WORDS
+
+
+def get_feature_name(index, width=0):
+    """Return the generated name of an unnamed feature, zero-padded to `width`."""
+    return '{}_{}'.format(FEATURE_PREFIX, str(index).zfill(width))
+
+
+def count_features(fn):
+    """Return the number of features in a BED file, skipping header lines."""
+    with open(fn, 'r') as f:
+        return sum(1 for line in f if not is_header(line))
+
+
+def get_feature_index(name):
+    """Return the index of a generated feature name, or None."""
+    match = _generated_name.match(name)
+    return int(match.group(1)) if match else None
+
+
+def _parse(lines, dummy_names):
+    index = 0
+    for line in lines:
+        if is_header(line):
+            continue
+        fields = line.split()
+        name = fields[3] if len(fields) >= 4 else None
+        if name is None or name in dummy_names:
+            name = get_feature_name(index)
+        yield BedRecord(
+            index=index,
+            chrom=fields[0],
+            start=int(fields[1]),
+            end=int(fields[2]),
+            name=name,
+            strand=fields[5] if len(fields) >= 6 else None,
+            num_fields=len(fields),
+            line=line.rstrip('\n'),
+        )
+        index += 1
+
+
+def read_bed(fn, dummy_names=DUMMY_NAMES):
+    """
+    Yield a `BedRecord` for each feature in a BED file.
+
+    `fn` is a path or an iterable of lines. `index` counts features, not
+    lines, and `start` is 0-based, as in the file.
+    """
+    if isinstance(fn, str):
+        with open(fn, 'r') as f:
+            yield from _parse(f, dummy_names)
+    else:
+        yield from _parse(fn, dummy_names)
+
+
+BED_DTYPE = numpy.dtype([
+    ('index', numpy.int64),
+    ('chrom', object),
+    ('start', numpy.int64),
+    ('end', numpy.int64),
+    ('name', object),
+    ('strand', 'U1'),
+])
+
+
+def read_bed_arrays(fn, chunk_size=CHUNK_SIZE, dummy_names=DUMMY_NAMES):
+    """
+    Yield features as structured arrays (see BED_DTYPE), `chunk_size` rows
+    at a time, for vectorized processing; a missing strand is empty.
+    """
+    chunk = []
+    for record in read_bed(fn, dummy_names):
+        chunk.append((
+            record.index, record.chrom, record.start, record.end,
+            record.name, record.strand or ''))
+        if len(chunk) == chunk_size:
+            yield numpy.array(chunk, dtype=BED_DTYPE)
+            chunk = []
+    if chunk:
+        yield numpy.array(chunk, dtype=BED_DTYPE)
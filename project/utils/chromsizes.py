@@ -0,0 +1,57 @@
+"""
+Chromosome sizes for a genome assembly.
+
+`load` parses a chromosome sizes file once per process, and reloads it only
+if the file is modified. This module has no Django dependencies, so it can
+be used from scripts.
+"""
+import numpy
+
+from . import filecache
+
+
+class ChromosomeSizes:
+    """Chromosome names and sizes, as arrays in file order."""
+
+    def __init__(self, names, sizes):
+        self.names = numpy.array(names, dtype=numpy.str_)
+        self.sizes = numpy.array(sizes, dtype=numpy.int64)
+        self._index = {name: i for i, name in enumerate(names)}
+
+    @classmethod
+    def from_file(cls, fn):
+        names = []
+        sizes = []
+        with open(fn, 'r') as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) < 2 or fields[0].startswith('#'):
+                    continue
+                names.append(fields[0])
+                sizes.append(int(fields[1]))
+        return cls(names, sizes)
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, chrom):
+        return chrom in self._index
+
+    def __getitem__(self, chrom):
+        return int(self.sizes[self._index[chrom]])
+
+    def get_order(self, chrom):
+        # position of a chromosome in the file
+        return self._index[chrom]
+
+    def get_sizes(self, chroms):
+        """Return an array of sizes; raises KeyError for an unknown chromosome."""
+        return self.sizes[[self._index[chrom] for chrom in chroms]]
+
+    def as_dict(self):
+        return dict(zip(self.names.tolist(), self.sizes.tolist()))
+
+
+def load(fn):
+    """Return `ChromosomeSizes` for a file, memoized until it's modified."""
+    return filecache.load(fn, ChromosomeSizes.from_file)
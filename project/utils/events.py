@@ -0,0 +1,123 @@
+import json
+import logging
+import time
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+
+logger = logging.getLogger(__name__)
+
+
+SEQUENCE_KEY = 'orio-events-seq'
+EVENT_HISTORY = 50  # events retained per user
+EVENT_TTL = 600  # seconds
+
+
+def _list_key(user_id):
+    return 'orio-events-{}'.format(user_id)
+
+
+def _channel(user_id):
+    return 'orio-events-channel-{}'.format(user_id)
+
+
+def get_connection():
+    # return raw redis connection, or None if cache isn't backed by redis
+    try:
+        from django_redis import get_redis_connection
+        return get_redis_connection('default')
+    except (ImportError, NotImplementedError):
+        return None
+
+
+def publish(user_id, event, **data):
+    """
+    Publish an event to a user.
+
+    Events are pushed to any waiting clients, and are also retained for a
+    short period so that clients between polls don't miss them. Failures are
+    logged and ignored; events are a convenience, not a requirement.
+    """
+    if user_id is None:
+        return
+    conn = get_connection()
+    if conn is None:
+        return
+    try:
+        payload = json.dumps({
+            'id': conn.incr(SEQUENCE_KEY),
+            'event': event,
+            'data': data,
+        }, cls=DjangoJSONEncoder)
+        key = _list_key(user_id)
+        pipe = conn.pipeline()
+        pipe.lpush(key, payload)
+        pipe.ltrim(key, 0, EVENT_HISTORY - 1)
+        pipe.expire(key, EVENT_TTL)
+        pipe.publish(_channel(user_id), payload)
+        pipe.execute()
+    except Exception as e:
+        logger.error(e, exc_info=True)
+
+
+def get_last_id():
+    # return the most recently published event id; new clients start here
+    conn = get_connection()
+    if conn is None:
+        return 0
+    try:
+        return int(conn.get(SEQUENCE_KEY) or 0)
+    except Exception as e:
+        logger.error(e, exc_info=True)
+        return 0
+
+
+def _recent(conn, user_id, since):
+    events = [
+        json.loads(payload.decode())
+        for payload in conn.lrange(_list_key(user_id), 0, -1)
+    ]
+    return sorted(
+        [ev for ev in events if ev['id'] > since],
+        key=lambda ev: ev['id'])
+
+
+def wait(user_id, since=0, timeout=25):
+    """
+    Return events for a user newer than `since`, waiting up to `timeout`
+    seconds for one to be published. Returns None if events are unavailable,
+    including on redis errors, which are logged.
+    """
+    conn = get_connection()
+    if conn is None:
+        return None
+
+    try:
+        return _wait(conn, user_id, since, timeout)
+    except Exception as e:
+        logger.error(e, exc_info=True)
+        return None
+
+
+def _wait(conn, user_id, since, timeout):
+    if timeout <= 0:
+        return _recent(conn, user_id, since)
+
+    # subscribe before checking history so no events are missed in-between
+    pubsub = conn.pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe(_channel(user_id))
+    try:
+        events = _recent(conn, user_id, since)
+        deadline = time.time() + timeout
+        while not events:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            message = pubsub.get_message(timeout=min(remaining, 1.))
+            if message and message['type'] == 'message':
+                ev = json.loads(message['data'].decode())
+                if ev['id'] > since:
+                    events.append(ev)
+        return events
+    finally:
+        pubsub.close()
@@ -0,0 +1,31 @@
+"""
+Process-level cache of data loaded from files.
+
+Each worker process loads a file once; the cached value is reloaded if the
+file's modification time changes.
+"""
+import os
+import threading
+
+
+_cache = {}
+_lock = threading.Lock()
+
+
+def load(path, loader):
+    """Return `loader(path)`, memoized until the file is modified."""
+    mtime = os.stat(path).st_mtime_ns
+    key = (path, loader)
+    with _lock:
+        entry = _cache.get(key)
+    if entry is not None and entry[0] == mtime:
+        return entry[1]
+    value = loader(path)
+    with _lock:
+        _cache[key] = (mtime, value)
+    return value
+
+
+def clear():
+    with _lock:
+        _cache.clear()
@@ -1,7 +1,8 @@
 import os
 import uuid
 
-from django.db.models import FilePathField
+from django.contrib.postgres.lookups import PostgresSimpleLookup
+from django.db.models import FilePathField, FloatField, Func, TextField, Value
 from django.core.files.storage import FileSystemStorage
 
 
@@ -47,3 +48,24 @@ class DynamicFilePathField(FilePathField):
         if hasattr(self, "pathfunc"):
             kwargs['path'] = self.pathfunc
         return name, path, args, kwargs
+
+
+class TrigramWordSimilarity(Func):
+    """
+    Trigram similarity of `string` to the most similar extent of words in
+    `expression` (Postgres `word_similarity`); unlike `TrigramSimilarity`,
+    it isn't diluted by the length of the text searched.
+    """
+    function = 'WORD_SIMILARITY'
+
+    def __init__(self, expression, string, **extra):
+        if not hasattr(string, 'resolve_expression'):
+            string = Value(string)
+        super().__init__(string, expression, output_field=FloatField(), **extra)
+
+
+@TextField.register_lookup
+class TrigramWordSimilar(PostgresSimpleLookup):
+    # `field %> string`; uses a gin_trgm_ops index, requires Postgres 9.6+
+    lookup_name = 'trigram_word_similar'
+    operator = '%%>'
@@ -0,0 +1,198 @@
+"""
+Opt-in, sampled profiling of API requests.
+
+A fraction of requests (`settings.API_PROFILE_SAMPLE_RATE`) to profiled
+viewsets are timed. Per-route latency histograms, time spent in named
+phases (cache fetch, JSON decode, rendering), cache hit ratios, and payload
+sizes are accumulated in redis; see the `api_profile` management command.
+Profiling is disabled if the cache isn't backed by redis.
+"""
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .events import get_connection
+
+
+logger = logging.getLogger(__name__)
+
+
+KEY_PREFIX = 'orio-api-profile'
+ROUTES_KEY = KEY_PREFIX + '-routes'
+
+# latency histogram bucket upper bounds, in milliseconds
+BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, float('inf'))
+
+_local = threading.local()
+
+
+def _route_key(route):
+    return '{}:{}'.format(KEY_PREFIX, route)
+
+
+def should_sample():
+    rate = getattr(settings, 'API_PROFILE_SAMPLE_RATE', 0)
+    return rate > 0 and random.random() < rate
+
+
+class RequestProfile:
+
+    def __init__(self, route=None):
+        self.route = route
+        self.phases = {}
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.bytes = None
+        self.seconds = None
+
+    def add_phase(self, name, seconds):
+        self.phases[name] = self.phases.get(name, 0.) + seconds
+
+    def get_fields(self):
+        # hash increments for this request
+        ms = self.seconds * 1000.
+        bucket = next(b for b in BUCKETS if ms <= b)
+        fields = {
+            'count': 1,
+            'ms': int(round(ms)),
+            'bucket:{}'.format(bucket): 1,
+            'cache_hits': self.cache_hits,
+            'cache_misses': self.cache_misses,
+        }
+        for name, seconds in self.phases.items():
+            fields['phase:{}'.format(name)] = int(round(seconds * 1000.))
+        if self.bytes is not None:
+            fields['bytes'] = self.bytes
+            fields['sized'] = 1
+        return fields
+
+    def save(self):
+        conn = get_connection()
+        if conn is None or self.route is None:
+            return
+        key = _route_key(self.route)
+        pipe = conn.pipeline()
+        pipe.sadd(ROUTES_KEY, self.route)
+        for field, value in self.get_fields().items():
+            pipe.hincrby(key, field, value)
+        pipe.execute()
+
+
+def current():
+    # return profile of the request being handled by this thread, or None
+    return getattr(_local, 'profile', None)
+
+
+@contextmanager
+def profile_request():
+    """Profile a request; the route must be set on the yielded profile."""
+    profile = RequestProfile()
+    _local.profile = profile
+    start = time.perf_counter()
+    try:
+        yield profile
+    finally:
+        profile.seconds = time.perf_counter() - start
+        _local.profile = None
+        # profiling must never fail the request it measures
+        try:
+            profile.save()
+        except Exception as e:
+            logger.error(e, exc_info=True)
+
+
+@contextmanager
+def phase(name):
+    """Add time spent in a block to the named phase, if profiling."""
+    profile = current()
+    if profile is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.add_phase(name, time.perf_counter() - start)
+
+
+def cache_get(key):
+    """Profiled equivalent of `cache.get`, which also records hits/misses."""
+    with phase('cache'):
+        value = cache.get(key)
+    profile = current()
+    if profile is not None:
+        if value is None:
+            profile.cache_misses += 1
+        else:
+            profile.cache_hits += 1
+    return value
+
+
+def cache_get_many(keys):
+    """Profiled equivalent of `cache.get_many`."""
+    with phase('cache'):
+        values = cache.get_many(keys)
+    profile = current()
+    if profile is not None:
+        profile.cache_hits += len(values)
+        profile.cache_misses += len(keys) - len(values)
+    return values
+
+
+def get_results():
+    """Return accumulated profiles, as a dictionary keyed by route."""
+    conn = get_connection()
+    if conn is None:
+        return {}
+    results = {}
+    for route in sorted(r.decode() for r in conn.smembers(ROUTES_KEY)):
+        fields = conn.hgetall(_route_key(route))
+        results[route] = {k.decode(): int(v) for k, v in fields.items()}
+    return results
+
+
+def reset():
+    conn = get_connection()
+    if conn is None:
+        return
+    routes = [r.decode() for r in conn.smembers(ROUTES_KEY)]
+    conn.delete(ROUTES_KEY, *[_route_key(route) for route in routes])
+
+
+def summarize(fields):
+    """Summarize accumulated fields for a route: means and percentiles."""
+    count = fields.get('count', 0)
+    if count == 0:
+        return None
+
+    def percentile(q):
+        # upper bound of the histogram bucket containing the percentile;
+        # None if in the unbounded bucket
+        target = q * count
+        seen = 0
+        for bucket in BUCKETS[:-1]:
+            seen += fields.get('bucket:{}'.format(bucket), 0)
+            if seen >= target:
+                return bucket
+        return None
+
+    lookups = fields.get('cache_hits', 0) + fields.get('cache_misses', 0)
+    sized = fields.get('sized', 0)
+    return {
+        'count': count,
+        'mean_ms': fields.get('ms', 0) / count,
+        'p50_ms': percentile(0.5),
+        'p95_ms': percentile(0.95),
+        'p99_ms': percentile(0.99),
+        'cache_hit_ratio': fields.get('cache_hits', 0) / lookups if lookups else None,
+        'mean_bytes': fields.get('bytes', 0) / sized if sized else None,
+        'phases_mean_ms': {
+            key.split(':', 1)[1]: value / count
+            for key, value in fields.items() if key.startswith('phase:')
+        },
+    }
@@ -0,0 +1,74 @@
+import resource
+import time
+
+
+def _read_proc(fn):
+    # return dict of "key: value" pairs from a /proc file, or None
+    try:
+        with open(fn, 'r') as f:
+            pairs = [line.split(':', 1) for line in f if ':' in line]
+    except OSError:
+        return None
+    return {key.strip(): value.strip() for key, value in pairs}
+
+
+def _io_counters():
+    # bytes read/written by this process, and its terminated children
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    read = children.ru_inblock * 512
+    written = children.ru_oublock * 512
+
+    io = _read_proc('/proc/self/io')
+    if io is not None:
+        read += int(io['read_bytes'])
+        written += int(io['write_bytes'])
+    else:
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        read += usage.ru_inblock * 512
+        written += usage.ru_oublock * 512
+    return read, written
+
+
+def _reset_peak_rss():
+    # reset peak RSS of this process; requires linux 4.0+
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        return False
+    return True
+
+
+def _peak_rss():
+    # peak RSS of this process, in bytes
+    status = _read_proc('/proc/self/status')
+    if status is not None and 'VmHWM' in status:
+        return int(status['VmHWM'].split()[0]) * 1024
+    return None
+
+
+class ResourceMonitor:
+    """
+    Measure wall-time, storage I/O, and peak memory within a block.
+
+    Peak RSS is only reported where it can be reset at the start of the
+    block; otherwise it would be the peak over the lifetime of the process.
+    """
+
+    def __enter__(self):
+        self.seconds = None
+        self.bytes_read = None
+        self.bytes_written = None
+        self.peak_rss = None
+        self._can_reset = _reset_peak_rss()
+        self._io = _io_counters()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.seconds = time.perf_counter() - self._start
+        read, written = _io_counters()
+        self.bytes_read = read - self._io[0]
+        self.bytes_written = written - self._io[1]
+        if self._can_reset:
+            self.peak_rss = _peak_rss()
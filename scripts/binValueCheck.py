@@ -1,9 +1,15 @@
 #!/usr/bin/env python
 
 import click
+import numpy
 import os
 import sys
 
+# shared BED reader, from the project's utils package
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'project'))
+from utils import chromsizes  # noqa: E402
+from utils.bed import read_bed_arrays  # noqa: E402
+
 class BinValueCheck(object):
     
     ANCHOR_OPTIONS = ('start', 'end', 'center')
@@ -44,71 +50,46 @@ class BinValueCheck(object):
         return True
     
     def readChrom(self, chrom_sizes_fn):
-        chrom_sizes = dict()
-        with open(chrom_sizes_fn) as f:
-            for line in f:
-                chromosome, size = line.strip().split('\t')
-                chrom_sizes[chromosome] = int(size)
-        return chrom_sizes
-    
-    def checkHeader(self, line):
-        # Check to see if line is header
-        if line == '\n':
-            return True
-        elif line[0] == '#':
-            return True
-        elif line.split()[0].lower() in ('track', 'browser'):
-            return True
-        else:
-            return False
+        # memoized; only re-read if the file is modified
+        return chromsizes.load(chrom_sizes_fn)
     
+    def getWindows(self, features):
+        # Return (window_start, window_end, is_minus) arrays for a chunk
+        if self.stranded_bed and numpy.any(features['strand'] == ''):
+            raise ValueError('BED file lacks strand column!!')
+        minus = features['strand'] == '-'
+        start = features['start'] + 1  # Convert from 0-based to 1-based
+        end = features['end']
+        center = (start + end) // 2
+
+        # Define start and end points for window
+        if self.bin_anchor == 'center':
+            plus_anchor, minus_anchor = center, center
+        elif self.bin_anchor == 'start':
+            plus_anchor, minus_anchor = start, end
+        elif self.bin_anchor == 'end':
+            plus_anchor, minus_anchor = end, start
+
+        window_start = numpy.where(
+            minus, minus_anchor - self.bin_start, plus_anchor + self.bin_start)
+        length = self.bin_size * self.bin_number
+        window_end = numpy.where(minus, window_start - length, window_start + length)
+        return window_start, window_end, minus
+
     def checkIfOutside(self):
         chrom_sizes = self.readChrom(self.chrom_sizes_fn)
-        with open(self.feature_bed_fn) as f:
-            for line in f:
-                if not self.checkHeader(line):
-                    bed_fields = len(line.strip().split())
-                    chromosome, start, end = line.strip().split()[0:3]
-                    start = int(start) + 1  # Convert from 0-based to 1-based
-                    end = int(end)
-                    center = int((start + end) / 2)
-                    if self.stranded_bed:
-                        if bed_fields >= 6:  # Contains strand information?
-                            strand = line.strip().split()[5]
-                        else:
-                            raise ValueError('BED file lacks strand column!!')
-                    else:
-                        strand = 'AMBIG'
-                    # Define start and end points for window
-                    if self.bin_anchor == 'center':
-                        if strand == '+' or strand == 'AMBIG':
-                            window_start = center + self.bin_start
-                        if strand == '-':
-                            window_start = center - self.bin_start
-                    elif self.bin_anchor == 'start':
-                        if strand == '+' or strand == 'AMBIG':
-                            window_start = start + self.bin_start
-                        if strand == '-':
-                            window_start = end - self.bin_start
-                    elif self.bin_anchor == 'end':
-                        if strand == '+' or strand == 'AMBIG':
-                            window_start = end + self.bin_start
-                        if strand == '-':
-                            window_start = start - self.bin_start
-    
-                    if strand == '+' or strand == 'AMBIG':
-                        window_end = window_start + self.bin_size * self.bin_number
-                    elif strand == '-':
-                        window_end = window_start - self.bin_size * self.bin_number
-                    
-                    if strand == '+' or strand == 'AMBIG':
-                        if window_start < 1 or window_end > chrom_sizes[chromosome]:
-                            sys.stdout.write('Feature window extends outside chromosome!!\n')
-                            return False
-                    if strand == '-':
-                        if window_start > chrom_sizes[chromosome] or window_end < 1:
-                            sys.stdout.write('Feature window extends outside chromosome!!\n')
-                            return False
+        for features in read_bed_arrays(self.feature_bed_fn):
+            if not self.stranded_bed:
+                features['strand'] = ''
+            sizes = chrom_sizes.get_sizes(features['chrom'])
+            window_start, window_end, minus = self.getWindows(features)
+            outside = numpy.where(
+                minus,
+                (window_start > sizes) | (window_end < 1),
+                (window_start < 1) | (window_end > sizes))
+            if outside.any():
+                sys.stdout.write('Feature window extends outside chromosome!!\n')
+                return False
         return True
     
     def checkWindowSize(self):
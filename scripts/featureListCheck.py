@@ -5,6 +5,10 @@ import click
 import sys
 import subprocess
 
+# shared BED reader, from the project's utils package
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'project'))
+from utils.bed import read_bed  # noqa: E402
+
 class FeatureListCheck(object):
 
     validateFiles_path = "/ddn/gs1/home/lavenderca/validateFiles"
@@ -19,24 +23,11 @@ class FeatureListCheck(object):
         
         self.check_feature_list()
     
-    def checkHeader(self, line):
-        # Check to see if line is header
-        if line == "\n":
-            return True
-        elif line[0] == "#":
-            return True
-        elif line.split()[0].lower() in ("track", "browser"):
-            return True
-        else:
-            return False
-    
     def find_col_number(self):
         # Find number of columns in bed
-        with open(self.feature_list) as f:
-            for line in f:
-                if not (self.checkHeader(line)):
-                    self.col_number = len(line.split())
-                    break
+        for record in read_bed(self.feature_list):
+            self.col_number = record.num_fields
+            break
         
     def run_validate_file(self):
         proc = subprocess.Popen([
@@ -52,16 +43,11 @@ class FeatureListCheck(object):
     
     def check_feature_names(self):
         # If BED file contains names (cols >= 4), make sure they are unique
-        used_feature_names = []
-        with open(self.feature_list) as f:
-            for line in f:
-                if not (self.checkHeader(line)):
-                    feature_name = line.strip().split()[3]
-                    if feature_name in used_feature_names:
-                        raise Exception("Feature list includes duplicate feature names!!")
-                        break
-                    else:
-                        used_feature_names.append(feature_name)
+        used_feature_names = set()
+        for record in read_bed(self.feature_list, dummy_names=()):
+            if record.name in used_feature_names:
+                raise Exception("Feature list includes duplicate feature names!!")
+            used_feature_names.add(record.name)
     
     def check_feature_list(self):
         self.find_col_number()
@@ -1,8 +1,13 @@
 #!/usr/bin/env python
 
+import os
 import sys
 import argparse
 from subprocess import call
+
+# shared BED reader, from the project's utils package
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'project'))
+from utils.bed import count_features, get_feature_name, read_bed  # noqa: E402
 #from optparse import OptionParser
 
 bigWigAverageOverBed_path = "/ddn/gs1/home/lavenderca/bigWigAverageOverBed"
@@ -59,40 +64,6 @@ def checkInt(num):
     else:
         return(int(num))
 
-## COUNT VALID FEATURE LINES IN BED FILE
-def countValidBedLines(input_file):
-    line_count = 0
-    with open(input_file) as f:
-        for line in f:
-            if line == "\n":
-                pass
-            elif line[0] == "#":
-                pass
-            elif line.split()[0].lower() == "track" or line.split()[0].lower() == "browser":
-                pass
-            else:
-                line_count += 1
-    return line_count
-
-## GENERATE ROW/FEATURE NAMES FOR BED ENTRIES
-def generateFeatureName(feature_header, feature_count, num_lines):
-    feature_name = feature_header + "_"
-    for i in range(len(str(feature_count)), len(str(num_lines))):
-        feature_name = feature_name + "0"
-    feature_name = feature_name + str(feature_count)
-    return feature_name
-
-## CHECK TO SEE IF BED LINE IS HEADER
-def checkHeader(line):
-    if line == "\n":
-        return True
-    elif line[0] == "#":
-        return True
-    elif line.split()[0].lower() == "track" or line.split()[0].lower() == "browser":
-        return True
-    else:
-        return False
-
 ## READ FEATURE NAME FROM TAB IDENTIFIER:
 def readTabName(tab_name):
     feature_name = tab_name.split("_")
@@ -104,51 +75,49 @@ def readTabName(tab_name):
 ## ALSO RETURN DICTIONARY WITH FEATURE INFORMATION
 def makeBed(input_file, output_file):
     feature_dict = dict()
-    with open(input_file) as f, open(output_file, "w") as OUTPUT:
-        total_valid_lines = countValidBedLines(input_file)
-        count = 0
-        for line in f:
-            if not checkHeader(line):
-                ## READ FIELDS FROM BED
-                bed_fields = len(line.strip().split())
-                chromosome, start, end = line.strip().split()[0:3]
-                start = int(start)+1 ## CONVERT FROM O-BASED TO 1-BASED
-                end = int(end)
-                center = int((start+end)/2)
-                if bed_fields >= 4: ## CONTAINS NAME INFORMATION?
-                    name = line.strip().split()[3]
-                else:
-                    name = generateFeatureName("feature", count, total_valid_lines)
-                if stranded_bed:
-                    if bed_fields >= 6: ## CONTAINS STRAND INFORMATION?
-                        strand = line.strip().split()[5]
-                    else:
-                        sys.stderr.write("BED file lacks strand column!!\n")
-                        exit()
+    ## UNNAMED FEATURES ARE NAMED BY INDEX, ZERO-PADDED TO THE FEATURE COUNT
+    width = len(str(count_features(input_file)))
+    with open(output_file, "w") as OUTPUT:
+        for record in read_bed(input_file, dummy_names=()):
+            ## READ FIELDS FROM BED
+            chromosome = record.chrom
+            start = record.start+1 ## CONVERT FROM O-BASED TO 1-BASED
+            end = record.end
+            center = int((start+end)/2)
+            if record.num_fields >= 4: ## CONTAINS NAME INFORMATION?
+                name = record.name
+            else:
+                name = get_feature_name(record.index, width)
+            if stranded_bed:
+                if record.strand is not None: ## CONTAINS STRAND INFORMATION?
+                    strand = record.strand
                 else:
-                    strand = "AMBIG"
-                ## UPDATE FEATURE DICT
-                feature_dict[name] = {"chromosome":chromosome, "start":start, "end":end, "strand":strand}
-                ## DEFINE ANCHOR POINT FOR WINDOW
-                if anchor == "center":
-                    start = center
-                elif anchor == "start":
-                    if strand == "-":
-                        start = end
-                elif anchor == "end":
-                    if strand == "+" or strand == "AMBIG":
-                        start = end
-                ## CREATE BED WITH BINS FOR THE GIVEN LINE
+                    sys.stderr.write("BED file lacks strand column!!\n")
+                    exit()
+            else:
+                strand = "AMBIG"
+            ## UPDATE FEATURE DICT
+            feature_dict[name] = {"chromosome":chromosome, "start":start, "end":end, "strand":strand}
+            ## DEFINE ANCHOR POINT FOR WINDOW
+            if anchor == "center":
+                start = center
+            elif anchor == "start":
+                if strand == "-":
+                    start = end
+            elif anchor == "end":
                 if strand == "+" or strand == "AMBIG":
-                    start = start + bin_start
-                    for i in range(bin_number):
-                        OUTPUT.write(chromosome + "\t" + str(start-1) + "\t" + str(start + bin_size - 1) + "\t" + name + "_" + str(i) + "\n")
-                        start += bin_size
-                elif strand == "-":
-                    start = start - bin_start
-                    for i in range(bin_number):
-                        OUTPUT.write(chromosome + "\t" + str(start - bin_size) + "\t" + str(start) + "\t" + name + "_" + str(i) + "\n")
-                        start -= bin_size
+                    start = end
+            ## CREATE BED WITH BINS FOR THE GIVEN LINE
+            if strand == "+" or strand == "AMBIG":
+                start = start + bin_start
+                for i in range(bin_number):
+                    OUTPUT.write(chromosome + "\t" + str(start-1) + "\t" + str(start + bin_size - 1) + "\t" + name + "_" + str(i) + "\n")
+                    start += bin_size
+            elif strand == "-":
+                start = start - bin_start
+                for i in range(bin_number):
+                    OUTPUT.write(chromosome + "\t" + str(start - bin_size) + "\t" + str(start) + "\t" + name + "_" + str(i) + "\n")
+                    start -= bin_size
     return feature_dict
 
 ## CREATE OUTPUT MATRIX, UNSTRANDED BIGWIG
@@ -19,14 +19,18 @@ if len(sys.argv) == 1:
 def readInVector(input_file):
     return(numpy.loadtxt(input_file, usecols=[1]))
 
+## RANK EACH ROW ONCE; CENTER AND SCALE TO UNIT LENGTH
+## DOT-PRODUCT OF TWO RANKED ROWS IS THEIR SPEARMAN CORRELATION
+def rankRows(values):
+    ranks = numpy.apply_along_axis(stats.rankdata, 1, numpy.atleast_2d(values))
+    ranks -= ranks.mean(axis=1, keepdims=True)
+    return ranks / numpy.sqrt((ranks ** 2).sum(axis=1, keepdims=True))
+
 ## FOR A MATRIX, FIND CORRELATION OF EACH BIN WITH VECTOR
 ## RETURN LIST
-def findCorrForMatrix(vector, matrix_file, bin_num):
-    corr_values = []
+def findCorrForMatrix(vector_ranks, matrix_file, bin_num):
     input_matrix = numpy.loadtxt(matrix_file, skiprows=1, usecols=tuple(range(1,bin_num+1,1)), unpack = True)
-    for i in range(len(input_matrix)):
-        corr_values.append(stats.spearmanr(vector, input_matrix[i])[0])
-    return corr_values
+    return list(rankRows(input_matrix).dot(vector_ranks[0]))
 
 window_start = int(sys.argv[3])
 bin_num = int(sys.argv[4])
@@ -35,10 +39,10 @@ bin_size = int(sys.argv[5])
 output_matrix = []
 row_names = []
 
-vector = readInVector(sys.argv[1])
+vector_ranks = rankRows(readInVector(sys.argv[1]))
 matrix_list = [line.strip().split() for line in open(sys.argv[2], "r")]
 for matrix_entry in matrix_list:
-    output_matrix.append(findCorrForMatrix(vector, matrix_entry[1], bin_num))
+    output_matrix.append(findCorrForMatrix(vector_ranks, matrix_entry[1], bin_num))
     row_names.append(matrix_entry[0])
 
 ## CONVERT LIST OF LISTS INTO NUMPY ARRAY